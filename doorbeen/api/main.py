@@ -20,7 +20,14 @@ from starlette.types import ASGIApp
 from __version__ import version
 from doorbeen.api.docs.meta import DocsMeta
 from doorbeen.api.routers import PUBLIC_ROUTES
+from doorbeen.core.assistants.memory.checkpointer import checkpointer_manager
+from doorbeen.core.assistants.memory.locations.postgres import PostgresLocation
+from doorbeen.core.assistants.memory.questions import question_cache
 from doorbeen.core.config.execution_env import ExecutionEnv
+from doorbeen.core.connections.SQL.query_cache import query_result_cache
+from doorbeen.core.connections.clients.engines import engine_registry
+from doorbeen.core.models.cache import llm_response_cache
+from doorbeen.core.models.invoker import llm_invoker
 from fastapi.logger import logger as fastapi_logger
 
 API_PREFIX = "/api"
@@ -72,6 +79,16 @@ app.mount("/static", StaticFiles(directory=STATIC_DIR), name="static")
 @app.on_event("startup")
 async def startup():
     FastAPICache.init(InMemoryBackend())
+    memory_location_uri = ExecutionEnv.get_key('ASSISTANT_MEMORY_LOCATION_URI')
+    if memory_location_uri:
+        # Opens the checkpoint pool and runs the checkpointer migrations once for the lifetime of the process
+        await checkpointer_manager.open(PostgresLocation(db_uri=memory_location_uri))
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    await checkpointer_manager.close()
+    await engine_registry.adispose()
 
 
 # app.add_middleware(CORSMiddlewareCustom)
@@ -131,7 +148,10 @@ for route in PUBLIC_ROUTES:
 
 @app.get('/', tags=["Health"])
 def health():
-    return {"status": "running"}
+    return {"status": "running", "checkpoint_pool": checkpointer_manager.get_stats(),
+            "llm_calls": llm_invoker.stats.model_dump(), "llm_cache": llm_response_cache.stats.model_dump(),
+            "question_cache": {**question_cache.stats.model_dump(), "hit_rate": question_cache.stats.hit_rate},
+            "query_result_cache": query_result_cache.stats.model_dump()}
 
 
 # @app.options("/{path:path}")
@@ -11,9 +11,10 @@ from langchain_core.messages import AIMessage
 from langgraph.checkpoint.memory import MemorySaver
 from langgraph.checkpoint.postgres.aio import AsyncPostgresSaver
 from psycopg import AsyncConnection
-from starlette.responses import StreamingResponse, JSONResponse
+from starlette.responses import StreamingResponse, JSONResponse, PlainTextResponse, Response
 
 from doorbeen.api.schemas.requests.assistants import AskLLMRequest
+from doorbeen.api.utils.disconnect import cancel_on_disconnect, run_until_disconnect
 from doorbeen.core.assistants.analysis.sql.query.graph.builder import SQLAgentGraphBuilder
 from doorbeen.core.assistants.memory.locations.postgres import PostgresLocation
 from doorbeen.core.chat.assistants import AssistantService
@@ -77,7 +78,7 @@ async def authed_request_state(
 
 # Then update the route to use the service
 @AssistantsRouter.post("/assistants", tags=["Assistants"])
-async def ask(request: AskLLMRequest = Body()):
+async def ask(http_request: Request, request: AskLLMRequest = Body()):
     # Convert to the old request format
     request_data = AskLLMRequest(**request.model_dump())
     assistant_service = AssistantService()
@@ -85,13 +86,27 @@ async def ask(request: AskLLMRequest = Body()):
     # Determine if we should stream based on the request
     stream = getattr(request, "stream", True)
     
-    # Use the service instance
-    result = await assistant_service.process_llm_request(request_data, stream=stream)
-    
+    # Use the service instance, a client that goes away cancels the graph along with the query it is running
     if stream:
+        result = await assistant_service.process_llm_request(request_data, stream=stream)
         return StreamingResponse(
-            result,
+            cancel_on_disconnect(http_request, result),
             media_type="application/x-ndjson"
         )
     else:
+        result = await run_until_disconnect(http_request,
+                                            assistant_service.process_llm_request(request_data, stream=stream))
+        if result is None:
+            return Response(status_code=499)
         return JSONResponse(content=result)
+
+
+@AssistantsRouter.get("/assistants/debug/graph", tags=["Assistants"])
+async def assistant_graph(format: str = "mermaid"):
+    # Rendering is only needed while developing the graph, it's kept off the request path
+    if not ExecutionEnv.is_local():
+        raise HTTPException(status_code=404, detail="Not Found")
+    graph = SQLAgentGraphBuilder().build(checkpointer=None).get_graph()
+    if format == "png":
+        return Response(content=graph.draw_mermaid_png(), media_type="image/png")
+    return PlainTextResponse(graph.draw_mermaid())
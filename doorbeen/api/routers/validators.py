@@ -15,7 +15,7 @@ async def validate_credentials(details: DBConnectionRequestParams = Body()):
     try:
         client: CommonSQLClient = DBClientService.get_client(details=details.credentials,
                                                              db_type=details.db_type)
-        connection = client.connect()
+        connection = client.connect(verify=True)
         result.can_connect = True
         tables = client.get_table_names(details.credentials['database'])
         result.non_null_tables = True if len(tables) > 0 else False
@@ -2,7 +2,10 @@ from typing import Optional
 
 from pydantic import Field
 
+from doorbeen.core.assistants.analysis.sql.retries import RetryBudget
+from doorbeen.core.connections.SQL.estimates import QueryCostBudget
 from doorbeen.core.types.databases import DatabaseTypes
+from doorbeen.core.types.outputs import ResultLayout
 from doorbeen.core.types.ts_model import TSModel
 
 
@@ -44,6 +47,12 @@ class DBConnectionRequestParams(TSModel):
             },
         ]
     )
+    result_cache_ttl: Optional[float] = Field(None, ge=0,
+                                              description="Seconds query results of this connection are reused, 0 "
+                                                          "turns the cache off for it")
+    statement_timeout: Optional[float] = Field(None, ge=0,
+                                               description="Seconds a query may run on this connection, 0 turns the "
+                                                           "limit off. Defaults to the dialect's timeout")
 
 
 class ModelMetaRequest(TSModel):
@@ -56,3 +65,23 @@ class AskLLMRequest(TSModel):
     model: ModelMetaRequest
     connection: DBConnectionRequestParams
     stream: bool = Field(True, description="Whether to stream the response or not")
+    result_format: ResultLayout = Field(ResultLayout.RECORDS,
+                                        description="'records' returns the results as a list of objects, 'columns' "
+                                                    "as {columns, types, rows} without repeating column names")
+    result_chunk_rows: Optional[int] = Field(None, gt=0,
+                                             description="With the 'columns' format, send the results as separate "
+                                                         "stream events of this many rows after the final answer")
+    bypass_question_cache: bool = Field(False, description="Always generate a new query instead of reusing the one of "
+                                                           "an earlier, similar question")
+    bypass_result_cache: bool = Field(False, description="Always run the queries against the database instead of "
+                                                         "reusing cached results")
+    statement_timeout: Optional[float] = Field(None, gt=0,
+                                               description="Seconds each query of this request may run, overrides "
+                                                           "the connection's timeout")
+    cost_budget: Optional[QueryCostBudget] = Field(None, description="Budgets the planner's estimates of each query "
+                                                                     "are checked against before it runs, queries "
+                                                                     "over budget are rewritten to be cheaper. "
+                                                                     "Sending it turns the check on")
+    retry_budget: Optional[RetryBudget] = Field(None, description="Limits the repairs, regenerations, tokens and time "
+                                                                  "of this request, an answer with the results so "
+                                                                  "far is given when one runs out")
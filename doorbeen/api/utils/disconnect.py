@@ -0,0 +1,59 @@
+import asyncio
+from typing import Any, AsyncGenerator, Awaitable, Optional, TypeVar
+
+from starlette.requests import Request
+
+from doorbeen.core.config.execution_env import ExecutionEnv
+
+T = TypeVar("T")
+
+
+def get_poll_seconds() -> float:
+    return float(ExecutionEnv.get_key('DISCONNECT_POLL_SECONDS') or 0.5)
+
+
+async def cancel_on_disconnect(request: Request, stream: AsyncGenerator[T, None]) -> AsyncGenerator[T, None]:
+    """
+    Yields from ``stream`` and cancels it once the client disconnects. Starlette only notices a disconnect when the
+    next chunk is sent, this also catches it while the graph waits on a query, which is then cancelled on the server.
+    """
+    poll_seconds = get_poll_seconds()
+    next_chunk = None
+    try:
+        while True:
+            next_chunk = asyncio.ensure_future(stream.__anext__())
+            if not await wait_or_disconnect(request, next_chunk, poll_seconds):
+                return
+            try:
+                chunk = next_chunk.result()
+            except StopAsyncIteration:
+                return
+            yield chunk
+    finally:
+        # Also covers the response itself being cancelled while a chunk is pending
+        if next_chunk is not None and not next_chunk.done():
+            next_chunk.cancel()
+            await asyncio.gather(next_chunk, return_exceptions=True)
+        await stream.aclose()
+
+
+async def run_until_disconnect(request: Request, awaitable: Awaitable[Any]) -> Optional[Any]:
+    """Awaits ``awaitable`` and cancels it if the client disconnects first, in which case None is returned."""
+    task = asyncio.ensure_future(awaitable)
+    try:
+        if not await wait_or_disconnect(request, task, get_poll_seconds()):
+            return None
+        return task.result()
+    finally:
+        if not task.done():
+            task.cancel()
+
+
+async def wait_or_disconnect(request: Request, task: asyncio.Future, poll_seconds: float) -> bool:
+    while not task.done():
+        await asyncio.wait([task], timeout=poll_seconds)
+        if not task.done() and await request.is_disconnected():
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+            return False
+    return True
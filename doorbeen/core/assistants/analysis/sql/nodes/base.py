@@ -0,0 +1,30 @@
+from typing import List, Optional, Tuple
+
+from langchain_core.runnables import RunnableConfig
+
+from doorbeen.core.assistants.analysis.sql.state import SQLAssistantState
+from doorbeen.core.connections.clients.SQL.aio import AsyncCommonSQLClient
+from doorbeen.core.models.provider import ModelHandler
+from doorbeen.core.types.sql_schema import DatabaseSchema
+from doorbeen.core.types.ts_model import TSModel
+
+
+class SQLAssistantNode(TSModel):
+    """
+    Base for the SQL assistant graph nodes. The model handler is read from ``config["configurable"]["handler"]`` so
+    that one compiled graph can serve every request, ``handler`` is only the fallback when none is configured.
+    """
+    handler: Optional[ModelHandler] = None
+
+    def get_handler(self, config: RunnableConfig) -> ModelHandler:
+        handler = config.get("configurable", {}).get("handler", None)
+        return handler if handler is not None else self.handler
+
+    @staticmethod
+    async def get_selected_schema(state: SQLAssistantState,
+                                  connection: AsyncCommonSQLClient) -> Tuple[List[str], DatabaseSchema]:
+        """The tables picked for the current question and their schemas, every table when none were picked."""
+        if state.selected_tables and state.table_schemas:
+            return state.selected_tables, state.table_schemas
+        schema = await connection.aget_schema()
+        return [table.name for table in schema.tables], schema
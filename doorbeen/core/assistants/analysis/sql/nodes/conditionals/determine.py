@@ -1,4 +1,5 @@
 import json
+import time
 import uuid
 from enum import Enum
 from logging import info
@@ -7,9 +8,15 @@ from typing import Any, Optional
 from langchain_core.messages import AIMessage, HumanMessage
 from langchain_core.runnables import RunnableConfig
 
+from doorbeen.core.assistants.analysis.sql.nodes.base import SQLAssistantNode
+from doorbeen.core.assistants.analysis.sql.nodes.generate import GenerateSQLQueryNode
+from doorbeen.core.assistants.analysis.sql.nodes.interpretation import InterpretInputNode
+from doorbeen.core.assistants.analysis.sql.retries import RetryUsage
 from doorbeen.core.assistants.analysis.sql.state import SQLAssistantState
-from doorbeen.core.connections.clients.SQL.common import CommonSQLClient
-from doorbeen.core.models.provider import ModelHandler
+from doorbeen.core.assistants.memory.questions import question_cache
+from doorbeen.core.assistants.memory.summary import MemoryOperation
+from doorbeen.core.connections.SQL.retrieval import TableSelectionConfig
+from doorbeen.core.connections.clients.SQL.aio import AsyncCommonSQLClient
 from doorbeen.core.types.ts_model import TSModel
 
 
@@ -18,20 +25,29 @@ class DeterminedQuestionTypes(Enum):
     FOLLOWUP = "followup"
 
 
-class InitAssistant(TSModel):
-    handler: ModelHandler = None
+class InitAssistant(SQLAssistantNode):
     qn: Optional[str] = None
 
-    def __call__(self, state: SQLAssistantState, config: RunnableConfig):
+    async def __call__(self, state: SQLAssistantState, config: RunnableConfig):
         configuration = config.get("configurable", {})
         messages_length = len(state.messages)
         is_messages_empty = messages_length == 1 and isinstance(state.messages[0], HumanMessage)
-        connection: CommonSQLClient = configuration.get("connection", None)
+        connection: AsyncCommonSQLClient = configuration.get("connection", None)
         print("Starting SQL Analysis. Entry Node is initialized.")
         print(f"Connection: {connection}")
         print(f"Thread ID: {configuration.get('thread_id')}")
-        print(f"Table Names: {connection.get_table_names(schema_name=connection.credentials.database)}")
-        print(f"Schema: {connection.get_schema()}")
+        question = configuration.get("question", None) or self.qn
+        schema = await connection.aget_schema()
+        cached = None
+        if is_messages_empty and not configuration.get("bypass_question_cache", False):
+            cached = question_cache.lookup(connection.get_identity(), schema.get_fingerprint(), question)
+        # Only the tables relevant to the question are carried into the prompts of the following nodes
+        selection_config = TableSelectionConfig()
+        schema_index = await connection.aget_schema_index(sample_rows=selection_config.sample_rows)
+        table_names = schema_index.select(question, config=selection_config,
+                                          keep=state.selected_tables if not is_messages_empty else None)
+        table_schemas = schema.subset(table_names)
+        print(f"Table Names: {table_names}")
         determined_type = {"question_type": None}
         if is_messages_empty:
             determined_type["question_type"] = DeterminedQuestionTypes.NEW.value
@@ -41,10 +57,32 @@ class InitAssistant(TSModel):
         state.is_followup = True if determined_type[
                                         "question_type"] == DeterminedQuestionTypes.FOLLOWUP.value else False
         state.request_count += 1
-        summary = "" if state.summary is None else state.summary
-        summary += "\n\n------------------------- [New Message Starts Here] -------------------------\n"
-        summary += f"This is the order of the message: {state.request_count}\n"
+        memory = state.memory.add(MemoryOperation.NEW_MESSAGE,
+                                  f"This is the order of the message: {state.request_count}",
+                                  f"The user asked: {question}",
+                                  digest=f"Message {state.request_count}: {question}", turn=state.request_count)
         output = {
+            "question_cache_hit": None,
+            "cost_estimate": None,
+            "cost_rewrites": 0,
+            # Every turn starts with a fresh retry budget
+            "retry_usage": RetryUsage(reset=True, started_at=time.time()),
+            "retry_exhausted": None,
+        }
+        if cached is not None:
+            # A repeated or paraphrased question skips grading, interpretation and generation, the cached query runs
+            entry, hit = cached
+            determined_type["question_cache_hit"] = hit.model_dump()
+            memory = InterpretInputNode.remember(memory, entry.interpretation)
+            memory = GenerateSQLQueryNode.remember(memory, entry.generated_query)
+            table_names = entry.selected_tables or table_names
+            table_schemas = schema.subset(table_names)
+            output.update({
+                "question_cache_hit": hit,
+                "interpretation": entry.interpretation,
+                "generated_query": entry.generated_query,
+            })
+        output.update({
             "messages": [
                 AIMessage(
                     content=json.dumps(determined_type),
@@ -52,12 +90,12 @@ class InitAssistant(TSModel):
                 )
             ],
             "request_count": state.request_count,
-            "input": self.qn,
+            "input": question,
             "is_followup": state.is_followup,
-            "selected_tables": connection.get_table_names(schema_name=connection.credentials.database),
-            "table_schemas": connection.get_schema(),
-            "summary": summary
-        }
+            "selected_tables": table_names,
+            "table_schemas": table_schemas,
+            "memory": memory
+        })
 
         return output
 
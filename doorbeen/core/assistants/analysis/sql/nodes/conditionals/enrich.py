@@ -4,37 +4,49 @@ import uuid
 from langchain_core.messages import SystemMessage, HumanMessage, AIMessage
 from langchain_core.runnables import RunnableConfig
 
+from doorbeen.core.assistants.analysis.sql.nodes.base import SQLAssistantNode
 from doorbeen.core.assistants.analysis.sql.state import SQLAssistantState
+from doorbeen.core.assistants.memory.summary import MemoryOperation
+from doorbeen.core.assistants.prompts.budget import PromptBudget, PromptSection, SectionPriority
 from doorbeen.core.assistants.prompts.inputs.enrich import enrich_input
-from doorbeen.core.connections.clients.SQL.common import CommonSQLClient
-from doorbeen.core.models.provider import ModelHandler
+from doorbeen.core.connections.clients.SQL.aio import AsyncCommonSQLClient
+from doorbeen.core.models.invoker import llm_invoker
 from doorbeen.core.types.enrich import EnrichedOutput
-from doorbeen.core.types.ts_model import TSModel
 
 
-class EnrichInputNode(TSModel):
-    handler: ModelHandler = None
+class EnrichInputNode(SQLAssistantNode):
 
     async def __call__(self, state: SQLAssistantState, config: RunnableConfig):
         configuration = config.get("configurable", {})
         assert state.should_enrich, "Only enrich if the state should be enriched"
         assert state.grade is not None, "Grade should be present in the state"
-        connection: CommonSQLClient = configuration.get("connection", None)
-        db_schema = connection.get_schema().json()
-        prompt = enrich_input(db_schema)
-
-        user_input = f"Enrich this input:\n{state.input}\n\n{db_schema}\n\n{state.grade.json()}"
-        state.messages.append(SystemMessage(content=prompt))
-        state.messages.append(HumanMessage(content=user_input))
-        json_llm = self.handler.model.bind(response_format={"type": "json_object"})
-        response = await json_llm.ainvoke(state.messages)
+        connection: AsyncCommonSQLClient = configuration.get("connection", None)
+        db_schema = (await self.get_selected_schema(state, connection))[1].json()
+        prompt = enrich_input()
+
+        # The schema goes in once and the earlier conversation comes from the memory instead of the full message list
+        fitted = PromptBudget.for_handler(self.get_handler(config)).fit("enrichment", [
+            PromptSection(name="summary", content=state.memory.render("interpretation"),
+                          priority=SectionPriority.SUMMARY),
+            PromptSection(name="instructions", content=prompt),
+            PromptSection(name="input", content=f"Enrich this input:\n{state.input}\n\n"),
+            PromptSection(name="schema", content=f"{db_schema}\n\n", priority=SectionPriority.SCHEMA),
+            PromptSection(name="grade", content=state.grade.json()),
+        ])
+        user_input = fitted["input"] + fitted["schema"] + fitted["grade"]
+        request_messages = [
+            AIMessage(content=f"Here is a summary of all of the previous conversations\n\n {fitted['summary']}\n\n"),
+            SystemMessage(content=fitted["instructions"]),
+            HumanMessage(content=user_input)
+        ]
+        json_llm = self.get_handler(config).model.bind(response_format={"type": "json_object"})
+        response = await llm_invoker.ainvoke(self.get_handler(config), request_messages, runnable=json_llm)
         response = json.loads(response.content)
         enriched_output = EnrichedOutput(**response)
-        summary = state.summary
-        summary += "\n\n[CURRENT OPERATION: Input Enrichment]\n"
-        summary += f"We've decided to enrich the input and this was the result.\n"
-        summary += enriched_output.model_dump_json(indent=4) + "\n"
-
+        memory = state.memory.add(MemoryOperation.ENRICHMENT,
+                                  "We've decided to enrich the input and this was the result.",
+                                  enriched_output.model_dump_json(),
+                                  digest=f"The input was enriched to: {enriched_output.improved_input}")
 
         result_message = AIMessage(
                     content=enriched_output.model_dump_json(),
@@ -43,6 +55,8 @@ class EnrichInputNode(TSModel):
         output = {
             "messages": [result_message],
             "input": enriched_output.improved_input,
-            "enrich_output": enriched_output
+            "enrich_output": enriched_output,
+            "memory": memory,
+            "prompt_usage": [fitted.usage]
         }
         return output
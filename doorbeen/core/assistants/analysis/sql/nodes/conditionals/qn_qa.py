@@ -3,23 +3,26 @@ import uuid
 
 from langchain_core.messages import SystemMessage, HumanMessage, AIMessage
 from langchain_core.runnables import RunnableConfig
+from pydantic import Field
 
+from doorbeen.core.assistants.analysis.sql.nodes.base import SQLAssistantNode
 from doorbeen.core.assistants.analysis.sql.state import SQLAssistantState
+from doorbeen.core.assistants.memory.summary import ConversationMemory, MemoryOperation
 from doorbeen.core.assistants.prompts.inputs.grader import grade_question
-from doorbeen.core.connections.clients.SQL.common import CommonSQLClient
-from doorbeen.core.models.provider import ModelHandler
-from doorbeen.core.types.ts_model import TSModel
+from doorbeen.core.connections.clients.SQL.aio import AsyncCommonSQLClient
+from doorbeen.core.models.invoker import llm_invoker
 
 
-class InputGradingNode(TSModel):
-    handler: ModelHandler = None
+class InputGradingNode(SQLAssistantNode):
+    defer_memory: bool = Field(default=False, description="Leave the memory to the join node when running as a "
+                                                          "parallel branch")
 
     async def __call__(self, state: SQLAssistantState, config: RunnableConfig):
         configuration = config.get("configurable", {})
-        connection: CommonSQLClient = configuration.get("connection", None)
-        db_schema = connection.get_schema()
+        connection: AsyncCommonSQLClient = configuration.get("connection", None)
+        _, db_schema = await self.get_selected_schema(state, connection)
         prompt = grade_question(db_schema)
-        summarized_content = state.summary
+        summarized_content = state.memory.render("grading")
         summarized_context = AIMessage(content=f"Here is a summary of all of the previous "
                                                f"conversations\n\n {summarized_content}\n\n")
         request_messages = [
@@ -27,14 +30,10 @@ class InputGradingNode(TSModel):
             SystemMessage(content=prompt),
             AIMessage(content=state.input)
         ]
-        json_llm = self.handler.model.bind(response_format={"type": "json_object"})
-        response = await json_llm.ainvoke(request_messages)
+        json_llm = self.get_handler(config).model.bind(response_format={"type": "json_object"})
+        response = await llm_invoker.ainvoke(self.get_handler(config), request_messages, runnable=json_llm)
         response = json.loads(response.content)
         should_enrich = response.get("should_enrich", False)
-        summary = state.summary
-        summary += (f"After evaluating the question based on various parameters, we determined that these are the"
-                    f" grades:\n")
-        summary += json.dumps(response, indent=4) + "\n"
         result_message = AIMessage(
                     content=json.dumps(response),
                 )
@@ -42,8 +41,16 @@ class InputGradingNode(TSModel):
             "messages": [result_message],
             "should_enrich": False,
             "grade": response,
-            "summary": summary
         }
+        if not self.defer_memory:
+            output["memory"] = self.remember(state.memory, response)
         state.qa_passed = True
         return output
 
+    @staticmethod
+    def remember(memory: ConversationMemory, grade: dict) -> ConversationMemory:
+        return memory.add(MemoryOperation.GRADING,
+                          "After evaluating the question based on various parameters, we determined that "
+                          "these are the grades:", json.dumps(grade),
+                          digest="The question was graded")
+
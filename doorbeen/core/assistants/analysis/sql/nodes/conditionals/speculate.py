@@ -0,0 +1,23 @@
+from langchain_core.runnables import RunnableConfig
+
+from doorbeen.core.assistants.analysis.sql.nodes.base import SQLAssistantNode
+from doorbeen.core.assistants.analysis.sql.nodes.conditionals.qn_qa import InputGradingNode
+from doorbeen.core.assistants.analysis.sql.nodes.interpretation import InterpretInputNode
+from doorbeen.core.assistants.analysis.sql.state import SQLAssistantState
+
+
+class JoinGradeAndInterpretationNode(SQLAssistantNode):
+    """
+    Joins grading and the speculative interpretation that ran alongside it. Both are recorded in the memory in the
+    order the sequential graph would have, unless the grade asks for enrichment, in which case the interpretation is
+    discarded and redone on the enriched input.
+    """
+
+    async def __call__(self, state: SQLAssistantState, config: RunnableConfig):
+        assert state.grade is not None, "Grade should be present in the state"
+        memory = InputGradingNode.remember(state.memory, state.grade.model_dump())
+        if state.should_enrich:
+            return {"memory": memory, "interpretation": None}
+        assert state.interpretation is not None, "Interpretation should be present in the state"
+        memory = InterpretInputNode.remember(memory, state.interpretation)
+        return {"memory": memory}
@@ -2,13 +2,11 @@ from typing import Optional
 
 from langchain_core.runnables import RunnableConfig
 
+from doorbeen.core.assistants.analysis.sql.nodes.base import SQLAssistantNode
 from doorbeen.core.assistants.analysis.sql.state import SQLAssistantState
-from doorbeen.core.models.provider import ModelHandler
-from doorbeen.core.types.ts_model import TSModel
 
 
-class SQLAnalysisEntryNode(TSModel):
-    handler: ModelHandler = None
+class SQLAnalysisEntryNode(SQLAssistantNode):
 
     def __call__(self, state: SQLAssistantState, config: RunnableConfig):
         self.state = state
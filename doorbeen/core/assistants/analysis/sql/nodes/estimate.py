@@ -0,0 +1,129 @@
+import json
+import logging
+import time
+
+from langchain_core.messages import AIMessage, SystemMessage
+from langchain_core.runnables import RunnableConfig
+
+from doorbeen.core.assistants.analysis.sql.nodes.base import SQLAssistantNode
+from doorbeen.core.assistants.analysis.sql.nodes.execute import AnalyseExecutionFailure
+from doorbeen.core.assistants.analysis.sql.retries import record_db_seconds
+from doorbeen.core.assistants.analysis.sql.state import SQLAssistantState
+from doorbeen.core.assistants.memory.summary import MemoryOperation
+from doorbeen.core.assistants.prompts.budget import PromptBudget, PromptSection, SectionPriority
+from doorbeen.core.connections.SQL.estimates import QueryCostBudget, query_cost_budget
+from doorbeen.core.connections.clients.SQL.aio import AsyncCommonSQLClient
+from doorbeen.core.exceptions.SQLClients import CSQLInvalidQuery
+from doorbeen.core.models.invoker import llm_invoker
+from doorbeen.core.types.execute import CorrectedSQLQuery, QueryCostEstimate
+from doorbeen.core.types.generate import GeneratedSQLQuery
+
+
+class EstimateSQLQueryCostNode(SQLAssistantNode):
+    """
+    Plans the generated query before it runs and compares the planner's estimates with the request's cost budget.
+    Queries over budget are sent to be made cheaper, up to ``max_rewrites`` times, instead of being executed.
+    """
+
+    async def __call__(self, state: SQLAssistantState, config: RunnableConfig):
+        configuration = config.get("configurable", {})
+        budget: QueryCostBudget = configuration.get("cost_budget", None) or query_cost_budget
+        if not budget.enabled:
+            return {"cost_estimate": None, "query_over_budget": False}
+        assert state.generated_query is not None, "Generated query should be present in the state"
+        connection: AsyncCommonSQLClient = configuration.get("connection", None)
+        query = state.generated_query.query
+        started = time.perf_counter()
+        try:
+            estimate = budget.check(await connection.aestimate_query(query))
+        except CSQLInvalidQuery as e:
+            # Invalid queries fail the same way when executed, where the failure analysis takes care of them
+            estimate = QueryCostEstimate(query=query, dialect=connection.credentials.dialect.value, error=e.message)
+        except Exception as e:
+            logging.warning(f"Could not estimate the cost of the query: {e}")
+            estimate = QueryCostEstimate(query=query, dialect=connection.credentials.dialect.value, error=str(e))
+        record_db_seconds(time.perf_counter() - started)
+        over_budget = not estimate.within_budget
+        if over_budget and state.cost_rewrites >= budget.max_rewrites:
+            logging.warning(f"Query is still over budget after {state.cost_rewrites} rewrites, running it: "
+                            f"{'; '.join(estimate.exceeded)}")
+            over_budget = False
+        return {"cost_estimate": estimate, "query_over_budget": over_budget}
+
+
+class MakeQueryCheaperNode(AnalyseExecutionFailure):
+
+    async def __call__(self, state: SQLAssistantState, config: RunnableConfig):
+        configuration = config.get("configurable", {})
+        estimate = state.cost_estimate
+        assert estimate is not None and state.query_over_budget, "This node should only be called for queries " \
+                                                                 "over budget"
+        connection: AsyncCommonSQLClient = configuration.get("connection", None)
+        selected_tables, table_schemas = await self.get_selected_schema(state, connection)
+        formatted_schema = self._format_schema_info(table_schemas)
+        system_prompt = f"""
+You have just generated a query which has not been run because the database's query planner estimates it to be too
+expensive. Rewrite it so that it still meets the task objective but does less work.
+
+Instructions:
+1. Explain what makes the query expensive according to the estimates.
+2. Provide a cheaper version of the query: filter as early as possible, filter on indexed columns, avoid cross joins
+and joins without a selective condition, aggregate before joining, select only the columns that are needed and add a
+LIMIT where the objective allows it.
+3. Make sure the output is in JSON format only.
+
+JSON Format:
+{{{{
+    "explanation": "Your explanation about why the query is expensive",
+    "corrected_query": "Your cheaper SQL query here",
+    "modification_plan": "What changes did you make and how do they reduce the work"
+}}}}
+"""
+        input_sections = [
+            PromptSection(name="estimate", content=f"""
+Objective: {state.interpretation.objective}
+
+Query: {estimate.query}
+
+Estimated rows: {estimate.estimated_rows}
+Estimated cost: {estimate.estimated_cost}
+Bytes scanned: {estimate.bytes_scanned}
+Tables scanned without an index: {estimate.full_scans}
+Exceeded budgets: {'; '.join(estimate.exceeded)}
+"""),
+            PromptSection(name="schema", content=f"""
+Table Schemas:
+{formatted_schema}
+""", priority=SectionPriority.SCHEMA),
+            PromptSection(name="tables", content=f"""
+Selected Tables:
+{selected_tables}
+"""),
+        ]
+        summarized_content = state.memory.render("cost_rewrite")
+        fitted = PromptBudget.for_handler(self.get_handler(config)).fit("cost_rewrite", [
+            PromptSection(name="summary", content=summarized_content, priority=SectionPriority.SUMMARY),
+            PromptSection(name="instructions", content=system_prompt),
+            *input_sections
+        ])
+        request_messages = [
+            AIMessage(content=f"Here is a summary of all of the previous conversations\n\n {fitted['summary']}\n\n"),
+            SystemMessage(content=fitted["instructions"]),
+            AIMessage(content="".join(fitted[section.name] for section in input_sections))
+        ]
+        json_llm = self.get_handler(config).model.bind(response_format={"type": "json_object"})
+        response = await llm_invoker.ainvoke(self.get_handler(config), request_messages, runnable=json_llm)
+        response = json.loads(response.content)
+        corrected_query = CorrectedSQLQuery(**response, raw_query=estimate.query)
+        memory = state.memory.add(MemoryOperation.COST_REWRITE,
+                                  f"This query was estimated to be too expensive ({'; '.join(estimate.exceeded)}) "
+                                  f"and was rewritten without running it.\n",
+                                  corrected_query.model_dump_json(),
+                                  digest=f"The query was too expensive: {corrected_query.explanation}")
+        return {
+            "messages": [AIMessage(content=corrected_query.model_dump_json())],
+            "generated_query": GeneratedSQLQuery(query=corrected_query.corrected_query),
+            "cost_rewrites": state.cost_rewrites + 1,
+            "memory": memory,
+            "prompt_usage": [fitted.usage]
+        }
@@ -1,31 +1,39 @@
 import json
 import logging
+import time
 
 from langchain_core.messages import AIMessage, SystemMessage
 from langchain_core.runnables import RunnableConfig
 
+from doorbeen.core.assistants.analysis.sql.nodes.base import SQLAssistantNode
+from doorbeen.core.assistants.analysis.sql.retries import RetryUsage, record_db_seconds
 from doorbeen.core.assistants.analysis.sql.state import SQLAssistantState
-from doorbeen.core.assistants.utils.sql import convert_sqlalchemy_rows_to_dict
-from doorbeen.core.connections.clients.SQL.common import CommonSQLClient
-from doorbeen.core.exceptions.SQLClients import CSQLInvalidQuery
-from doorbeen.core.models.provider import ModelHandler
+from doorbeen.core.assistants.memory.summary import MemoryOperation
+from doorbeen.core.assistants.prompts.budget import PromptBudget, PromptSection, SectionPriority
+from doorbeen.core.connections.SQL.results import QueryResultLimits
+from doorbeen.core.connections.clients.SQL.aio import AsyncCommonSQLClient
+from doorbeen.core.exceptions.SQLClients import CSQLExecutionLimitExceeded, CSQLInvalidQuery
+from doorbeen.core.models.invoker import llm_invoker
 from doorbeen.core.types.execute import ExecutionResults, CorrectedSQLQuery
 from doorbeen.core.types.generate import GeneratedSQLQuery
+from doorbeen.core.types.serialization import dumps, dumps_model
 from doorbeen.core.types.sql_schema import DatabaseSchema
-from doorbeen.core.types.ts_model import TSModel
 
 
-class ExecuteSQLQueryNode(TSModel):
-    handler: ModelHandler
+class ExecuteSQLQueryNode(SQLAssistantNode):
 
     async def __call__(self, state: SQLAssistantState, config: RunnableConfig):
         configuration = config.get("configurable", {})
         assert state.generated_query is not None, "Generated query should be present in the state"
-        connection: CommonSQLClient = configuration.get("connection", None)
+        connection: AsyncCommonSQLClient = configuration.get("connection", None)
+        limits: QueryResultLimits = configuration.get("result_limits", None) or QueryResultLimits()
         generated_query = state.generated_query
+        started = time.perf_counter()
         try:
-            result = connection.query(generated_query.query)
-            output = ExecutionResults(query=generated_query.query, result=result, error=None)
+            use_cache = not configuration.get("bypass_result_cache", False)
+            streamed = await connection.astream_query(generated_query.query, limits=limits, use_cache=use_cache)
+            output = ExecutionResults(query=generated_query.query, table=streamed.table,
+                                      statistics=streamed.statistics, cache=streamed.cache, error=None)
         except Exception as e:
             sql_exceptions = [CSQLInvalidQuery]
             is_sql_error = False
@@ -35,56 +43,71 @@ class ExecuteSQLQueryNode(TSModel):
                 is_sql_error = True
             else:
                 logging.error(f"Error executing query: {e}")
+            limit_exceeded = e.limit if isinstance(e, CSQLExecutionLimitExceeded) else None
             output = ExecutionResults(query=generated_query.query, result=None, error=error,
-                                      is_sql_error=is_sql_error)
+                                      is_sql_error=is_sql_error, limit_exceeded=limit_exceeded)
+        record_db_seconds(time.perf_counter() - started)
 
         result_message = AIMessage(
-            content=output.model_dump_json(exclude={'result'})
+            content=dumps_model(output, exclude={'result', 'table'})
         )
-        last_execution_failed = output.error is not None and output.result is None
-        summary = state.summary
-        summary += "\n\n[CURRENT OPERATION: SQL Query Execution]\n"
-        summary += (f"We tried executing this query and it was {'' if output.error is None else 'not'} successful."
-                    f"Here are some details about the execution output.\n")
-        summary += f"Query: {generated_query.query}\n\n"
+        last_execution_failed = output.error is not None and not output.has_rows()
+        fragments = [f"We tried executing this query and it was {'' if output.error is None else 'not'} successful."
+                     f"Here are some details about the execution output.",
+                     f"Query: {generated_query.query}\n"]
         if not last_execution_failed:
-            result_count = 0 if output.result is None else len(output.result)
-            RESULT_SUMMARY_THRESHOLD = 30
-            summary += f"There are {result_count} records in the result of the executed query.\n"
-            included_results = output.result[:RESULT_SUMMARY_THRESHOLD] if output.result is not None else []
-            if len(included_results) > 0:
-                included_results = convert_sqlalchemy_rows_to_dict(included_results)
-            if result_count > RESULT_SUMMARY_THRESHOLD:
-                summary += (f"The results displayed below have been trimmed due to memory limitations. Execute the query "
-                            f"if required to access the full set of results\n Query: {generated_query.query}\n")
-            for result in included_results:
-                summary += json.dumps(result, indent=2) + "\n"
+            result_count = output.get_row_count()
+            statistics = output.statistics
+            at_least = "" if statistics is None or statistics.row_count_exact else "at least "
+            fragments.append(f"There are {at_least}{result_count} records in the result of the executed query.")
+            digest = f"Query {generated_query.query} returned {at_least}{result_count} records"
+            if output.cache is not None and output.cache.hit:
+                fragments.append(f"The result was served from the cache and is {output.cache.age_seconds:.0f} "
+                                 f"seconds old.")
+            if statistics is not None and statistics.truncated:
+                fragments.append(f"Only part of the result was kept ({statistics.truncation_reason}). Column "
+                                 f"aggregates cover every row read: {dumps(statistics.aggregates)}")
+            included_results = output.get_records(limit=limits.sample_rows)
+            if result_count > limits.sample_rows:
+                fragments.append(f"The results displayed below have been trimmed due to memory limitations. Execute "
+                                 f"the query if required to access the full set of results")
+            fragments.extend(dumps(result) for result in included_results)
         else:
-            summary += f"This error occurred: {output.error}\n"
+            fragments.append(f"This error occurred: {output.error}")
+            digest = f"Query {generated_query.query} failed with: {output.error}"
+        memory = state.memory.add(MemoryOperation.EXECUTION, *fragments, digest=digest)
 
         output = {
             "messages": [result_message],
             "execution_results": [output],
             "last_execution_failed": last_execution_failed,
-            "summary": summary
+            "memory": memory,
+            "retry_usage": RetryUsage(executions=1)
         }
         return output
 
 
-class AnalyseExecutionFailure(TSModel):
-    handler: ModelHandler
+class AnalyseExecutionFailure(SQLAssistantNode):
 
     async def __call__(self, state: SQLAssistantState, config: RunnableConfig):
         configuration = config.get("configurable", {})
         is_last_execution_failed = state.last_execution_failed is not None and state.last_execution_failed
         assert is_last_execution_failed, "This node should only be called if the last execution failed"
-        connection: CommonSQLClient = configuration.get("connection", None)
+        connection: AsyncCommonSQLClient = configuration.get("connection", None)
         failed_execution = state.execution_results[-1]
         error = failed_execution.error
-        selected_tables = connection.get_table_names(schema_name=connection.credentials.database)
-        table_schemas = connection.get_schema()
+        selected_tables, table_schemas = await self.get_selected_schema(state, connection)
         formatted_schema = self._format_schema_info(table_schemas)
-        examples = connection.get_examples(selected_tables)
+        examples = await connection.aget_examples(selected_tables)
+        limit_guidance = ""
+        if failed_execution.limit_exceeded is not None:
+            # The query was valid but too expensive, a corrected version has to do less work rather than fix syntax
+            limit_guidance = f"""
+The query is valid but the database stopped it because it exceeded the {failed_execution.limit_exceeded} limit. Rewrite
+it to be cheaper while still meeting the objective: filter as early as possible, avoid cross joins and joins without a
+selective condition, aggregate before joining, select only the columns that are needed and add a LIMIT where the
+objective allows it.
+"""
         system_prompt = f"""
 You have just generated a query which resulted in an error. Take a look at the error message below and provide 
 an explanation of why the query failed and a corrected version of the query. You were supposed to meet the
@@ -94,7 +117,7 @@ Instructions:
 1. Provide an explanation of why the query failed.
 2. Provide a corrected version of the query.
 3. Make sure the output is in JSON format only.
-
+{limit_guidance}
 JSON Format:
 {{{{
     "explanation": "Your explanation about why it failed",
@@ -102,33 +125,43 @@ JSON Format:
     "modification_plan": "What changes did you make and how are they supposed to fix the issue"
 }}}}
 """
-        input_prompt = f"""
+        input_sections = [
+            PromptSection(name="failure", content=f"""
 Objective: {state.interpretation.objective}
 
 Error: {error}
 
 Query: {failed_execution.query}
-
+"""),
+            PromptSection(name="schema", content=f"""
 Table Schemas:
 {formatted_schema}
-
+""", priority=SectionPriority.SCHEMA),
+            PromptSection(name="tables", content=f"""
 Selected Tables:
 {selected_tables}
-
+"""),
+            PromptSection(name="examples", content=f"""
 Example Data:
 {examples}
 
-        """
-        summarized_content = state.summary
+        """, priority=SectionPriority.EXAMPLES),
+        ]
+        summarized_content = state.memory.render("failure_analysis")
+        fitted = PromptBudget.for_handler(self.get_handler(config)).fit("failure_analysis", [
+            PromptSection(name="summary", content=summarized_content, priority=SectionPriority.SUMMARY),
+            PromptSection(name="instructions", content=system_prompt),
+            *input_sections
+        ])
         summarized_context = AIMessage(content=f"Here is a summary of all of the previous "
-                                               f"conversations\n\n {summarized_content}\n\n")
+                                               f"conversations\n\n {fitted['summary']}\n\n")
         request_messages = [
             summarized_context,
-            SystemMessage(content=system_prompt),
-            AIMessage(content=input_prompt)
+            SystemMessage(content=fitted["instructions"]),
+            AIMessage(content="".join(fitted[section.name] for section in input_sections))
         ]
-        json_llm = self.handler.model.bind(response_format={"type": "json_object"})
-        response = json_llm.invoke(request_messages)
+        json_llm = self.get_handler(config).model.bind(response_format={"type": "json_object"})
+        response = await llm_invoker.ainvoke(self.get_handler(config), request_messages, runnable=json_llm)
         response = json.loads(response.content)
         corrected_query = CorrectedSQLQuery(**response, raw_query=failed_execution.query)
         updated_query = GeneratedSQLQuery(query=corrected_query.corrected_query)
@@ -136,14 +169,16 @@ Example Data:
             content=corrected_query.model_dump_json()
         )
 
-        summary = state.summary
-        summary += "\n\n[CURRENT OPERATION: Analyse Why SQL Execution Failed]\n"
-        summary += f"This is the reason why the query failed and what approach we've taken to fix it.\n\n"
-        summary += corrected_query.model_dump_json(indent=2) + "\n"
+        memory = state.memory.add(MemoryOperation.FAILURE_ANALYSIS,
+                                  "This is the reason why the query failed and what approach we've taken to fix it.\n",
+                                  corrected_query.model_dump_json(),
+                                  digest=f"The query failed because: {corrected_query.explanation}")
         output = {
             "messages": [result_message],
             "generated_query": updated_query,
-            "summary": summary
+            "memory": memory,
+            "prompt_usage": [fitted.usage],
+            "retry_usage": RetryUsage(repairs=1)
         }
         return output
 
@@ -3,26 +3,31 @@ import json
 from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
 from langchain_core.runnables import RunnableConfig
 
+from doorbeen.core.assistants.analysis.sql.nodes.base import SQLAssistantNode
+from doorbeen.core.assistants.analysis.sql.retries import get_retry_budget
 from doorbeen.core.assistants.analysis.sql.state import SQLAssistantState
+from doorbeen.core.assistants.memory.questions import question_cache
+from doorbeen.core.assistants.prompts.budget import PromptBudget, PromptSection, SectionPriority
 from doorbeen.core.assistants.prompts.memory.summarize import SUMMARIZE_MEMORY_SYSTEM
-from doorbeen.core.assistants.utils.sql import convert_sqlalchemy_rows_to_dict
-from doorbeen.core.connections.clients.SQL.common import CommonSQLClient
-from doorbeen.core.models.provider import ModelHandler
+from doorbeen.core.connections.clients.SQL.aio import AsyncCommonSQLClient
+from doorbeen.core.models.invoker import llm_invoker
 from doorbeen.core.types.finalize import FinalPresentation
-from doorbeen.core.types.ts_model import TSModel
+from doorbeen.core.types.outputs import ResultLayout
+from doorbeen.core.types.serialization import dumps, dumps_model
 
 
-class FinalizeAnswerNode(TSModel):
-    handler: ModelHandler
+class FinalizeAnswerNode(SQLAssistantNode):
 
     async def __call__(self, state: SQLAssistantState, config: RunnableConfig):
         configuration = config.get("configurable", {})
-        connection: CommonSQLClient = configuration.get("connection", None)
-        selected_tables = connection.get_table_names(schema_name=connection.credentials.database)
-        table_schemas = connection.get_schema().json()
+        connection: AsyncCommonSQLClient = configuration.get("connection", None)
+        selected_tables, table_schemas = await self.get_selected_schema(state, connection)
+        table_schemas = table_schemas.json()
 
-        last_execution_results = state.execution_results[-1].result
-        row_dicts = convert_sqlalchemy_rows_to_dict(last_execution_results)
+        last_execution_results = state.execution_results[-1]
+        result_format = configuration.get("result_format", None) or ResultLayout.RECORDS
+        # Chunked results are streamed as separate events by the caller, straight from the execution results
+        results_chunked = result_format is ResultLayout.COLUMNS and bool(configuration.get("result_chunk_rows", None))
 
         # Steps to perform here
         # 1. Fetch the query_observation_report: QueryAnalysisReport from the state
@@ -33,6 +38,10 @@ class FinalizeAnswerNode(TSModel):
         # in the result
         interpretation = state.interpretation
         original_question = state.input
+        # Unmet objectives only reach this node when the retry budget doesn't allow generating another query
+        exhausted = None
+        if not observed_report.all_objectives_met:
+            exhausted = get_retry_budget(config).exhausted(state.retry_usage, "regenerate")
 
         system_prompt = """
         You are a Data Scientist who was tasked with an objective. Now you've analysed the data and now it's time to
@@ -54,6 +63,8 @@ class FinalizeAnswerNode(TSModel):
         4. Do not mention anything about the items that have been presented to you. 
         5. In case if you are referring to any datapoint, make sure to use the entity name as  well. Do not use names
         like Category A, instead say <Category [Category ID]>.
+        6. If no more queries can be run, present the best answer the available data allows and clearly say which
+        parts of the question it doesn't answer.
            
         **JSON Output Format**
         {
@@ -62,66 +73,117 @@ class FinalizeAnswerNode(TSModel):
             "message": <Message to be presented to the user in markdown>
         }
 """
-        context_prompt = f"""
+        if exhausted is not None:
+            system_prompt += f"""
+        **No more queries can be run for this question, the retry budget is exhausted: {exhausted}.**
+"""
+        context_sections = [
+            PromptSection(name="question", content=f"""
         [ORIGINAL QUESTION]: {original_question}
         
         [INTERPRETATION]:
 
         {interpretation.objective}
-        
+        """),
+            PromptSection(name="report", content=f"""
         [Analysis Report]: {observed_report.model_dump_json()}
-        
+        """, priority=SectionPriority.RESULTS),
+            PromptSection(name="tables", content=f"""
         **Database Info Availability**:
         
         [SELECTED TABLES]: {selected_tables}
-        
+        """),
+            PromptSection(name="schema", content=f"""
         [TABLE SCHEMAS]: {table_schemas}
-        """
+        """, priority=SectionPriority.SCHEMA),
+        ]
 
-        summarized_content = state.summary
+        budget = PromptBudget.for_handler(self.get_handler(config))
+        summarized_content = state.memory.render("finalize")
+        fitted = budget.fit("finalize", [
+            PromptSection(name="summary", content=summarized_content, priority=SectionPriority.SUMMARY),
+            PromptSection(name="instructions", content=system_prompt),
+            *context_sections
+        ])
         summarized_context = AIMessage(content=f"Here is a summary of all of the previous "
-                                               f"conversations\n\n {summarized_content}\n\n")
+                                               f"conversations\n\n {fitted['summary']}\n\n")
         request_messages = [
             summarized_context,
-            SystemMessage(content=system_prompt),
-            HumanMessage(content=context_prompt)
+            SystemMessage(content=fitted["instructions"]),
+            HumanMessage(content="".join(fitted[section.name] for section in context_sections))
         ]
-        json_llm = self.handler.model.bind(response_format={"type": "json_object"})
-        response = json_llm.invoke(request_messages)
+        json_llm = self.get_handler(config).model.bind(response_format={"type": "json_object"})
+        response = await llm_invoker.ainvoke(self.get_handler(config), request_messages, runnable=json_llm)
         response = json.loads(response.content)
-        summarized_content += json.dumps(response) + "\n"
-        response = FinalPresentation(**response, results=row_dicts)
+        fragments = [json.dumps(response)]
+        if results_chunked:
+            response = FinalPresentation(**response, results_chunked=True)
+        else:
+            response = FinalPresentation(**response, results=last_execution_results.serialize(layout=result_format))
 
-        summarized_content += "\n\n[CURRENT OPERATION: Presenting Final Answer to the User]\n"
-        summarized_content += (f"After thinking through the problem and analysing the data, you've come up with"
-                               f"the following information:\n\n {summarized_content}\n\n")
+        fragments.append("\n\n[CURRENT OPERATION: Presenting Final Answer to the User]\n")
+        fragments.append(f"After thinking through the problem and analysing the data, you've come up with "
+                         f"the following information:\n\n {response.message}\n\n")
 
-        result_count = len(row_dicts)
+        result_count = last_execution_results.get_row_count()
         RESULT_SUMMARY_THRESHOLD = 30
-        summarized_content += f"There are {result_count} records in the result of the executed query.\n"
-        included_results = row_dicts[:RESULT_SUMMARY_THRESHOLD] if result_count > 0 else []
+        fragments.append(f"There are {result_count} records in the result of the executed query.\n")
+        included_results = last_execution_results.get_records(limit=RESULT_SUMMARY_THRESHOLD)
         if result_count > RESULT_SUMMARY_THRESHOLD:
-            summarized_content += (f"The results displayed below have been trimmed due to memory limitations.\n")
-        for result in included_results:
-            summarized_content += json.dumps(result, indent=2) + "\n"
-
+            fragments.append(f"The results displayed below have been trimmed due to memory limitations.\n")
+        answer_content = "".join(fragments)
+        results_content = "".join(dumps(result) + "\n" for result in included_results)
+
+        fitted_summary = budget.fit("summarize_memory", [
+            PromptSection(name="instructions", content=SUMMARIZE_MEMORY_SYSTEM),
+            PromptSection(name="summary", content=summarized_content, priority=SectionPriority.SUMMARY),
+            PromptSection(name="answer", content=answer_content),
+            PromptSection(name="results", content=results_content, priority=SectionPriority.RESULTS),
+        ])
         summarization_messages = [
-            SystemMessage(content=SUMMARIZE_MEMORY_SYSTEM),
-            AIMessage(content=summarized_content)
+            SystemMessage(content=fitted_summary["instructions"]),
+            AIMessage(content=fitted_summary["summary"] + fitted_summary["answer"] + fitted_summary["results"])
         ]
 
-        msg_summary = self.handler.model.invoke(summarization_messages)
+        await self.update_question_cache(state, connection, response)
+
+        msg_summary = await llm_invoker.ainvoke(self.get_handler(config), summarization_messages)
         msg_summary = msg_summary.content
+        # The detailed entries of this message are replaced by the summary of it
+        memory = state.memory.close_turn(state.request_count, msg_summary)
 
         result_message = AIMessage(
-            content=response.model_dump_json()
+            content=dumps_model(response)
         )
         output = {
             "messages": [result_message],
-            "summary": msg_summary
+            "memory": memory,
+            "prompt_usage": [fitted.usage, fitted_summary.usage],
+            "retry_exhausted": exhausted
         }
         return output
 
+    @staticmethod
+    async def update_question_cache(state: SQLAssistantState, connection: AsyncCommonSQLClient,
+                                    response: FinalPresentation):
+        # Follow-ups depend on the earlier turns of the thread, so only the first question of a thread is cached
+        if state.is_followup or state.generated_query is None:
+            return
+        identity = connection.get_identity()
+        hit = state.question_cache_hit
+        # Turns that ran out of retries before the objectives were met reach this node too, their query didn't
+        # answer the question
+        objectives_met = state.query_observation_report is not None and \
+            state.query_observation_report.all_objectives_met
+        if not response.interpretation_correct or not objectives_met:
+            if hit is not None:
+                question_cache.discard(identity, hit.question)
+            return
+        if hit is None or not hit.exact:
+            fingerprint = (await connection.aget_schema()).get_fingerprint()
+            question_cache.store(identity, fingerprint, state.input, state.generated_query, state.interpretation,
+                                 state.selected_tables)
+
         # is_last_execution_failed = state.last_execution_failed is not None and state.last_execution_failed
         # assert not is_last_execution_failed, "Result should be present in the state"
         #
@@ -147,3 +209,44 @@ class FinalizeAnswerNode(TSModel):
         #     ],
         # }
         # return output
+
+
+class BestEffortAnswerNode(SQLAssistantNode):
+    """
+    Ends a turn whose retry budget ran out before the objectives were met. No model is called, the answer says why
+    the turn stopped and carries the results of the last query of the turn that ran, if any did.
+    """
+
+    async def __call__(self, state: SQLAssistantState, config: RunnableConfig):
+        configuration = config.get("configurable", {})
+        usage = state.retry_usage
+        budget = get_retry_budget(config)
+        reason = (budget.exhausted(usage, "repair") or budget.exhausted(usage, "regenerate") or
+                  "the retry budget was used up")
+        result_format = configuration.get("result_format", None) or ResultLayout.RECORDS
+        results_chunked = result_format is ResultLayout.COLUMNS and bool(configuration.get("result_chunk_rows", None))
+
+        turn_results = (state.execution_results or [])[-usage.attempts:] if usage and usage.attempts else []
+        failures = [result for result in turn_results if result.error is not None]
+        successful = [result for result in turn_results if result.error is None and result.executed]
+        last_error = failures[-1].error if failures else None
+        fragments = [f"I couldn't fully answer this question, I stopped because {reason}."]
+        if last_error is not None:
+            fragments.append(f"The last query failed with: {last_error}")
+        response = FinalPresentation(ready_to_present=False, interpretation_correct=True, message="")
+        if successful:
+            fragments.append("These are the results of the last query that ran, they may answer it only in part.")
+            if results_chunked:
+                response.results_chunked = True
+            else:
+                response.results = successful[-1].serialize(layout=result_format)
+        response.message = "\n\n".join(fragments)
+        summary = f"Message {state.request_count} was not fully answered because {reason}."
+        if last_error is not None:
+            summary += f" The last error was: {last_error}"
+        memory = state.memory.close_turn(state.request_count, summary)
+        return {
+            "messages": [AIMessage(content=dumps_model(response))],
+            "memory": memory,
+            "retry_exhausted": reason
+        }
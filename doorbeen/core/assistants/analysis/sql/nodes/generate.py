@@ -2,37 +2,41 @@ from langchain_core.messages import AIMessage
 from langchain_core.runnables import RunnableConfig
 
 from doorbeen.core.assistants.analysis.sql.query.generate import QueryGenerator
+from doorbeen.core.assistants.analysis.sql.nodes.base import SQLAssistantNode
+from doorbeen.core.assistants.analysis.sql.retries import RetryUsage
 from doorbeen.core.assistants.analysis.sql.state import SQLAssistantState
-from doorbeen.core.connections.clients.SQL.common import CommonSQLClient
-from doorbeen.core.models.provider import ModelHandler
+from doorbeen.core.assistants.memory.summary import ConversationMemory, MemoryOperation
+from doorbeen.core.connections.clients.SQL.aio import AsyncCommonSQLClient
 from doorbeen.core.types.generate import GeneratedSQLQuery
-from doorbeen.core.types.ts_model import TSModel
 
 
-class GenerateSQLQueryNode(TSModel):
-    handler: ModelHandler
+class GenerateSQLQueryNode(SQLAssistantNode):
 
     async def __call__(self, state: SQLAssistantState, config: RunnableConfig):
         configuration = config.get("configurable", {})
-        connection: CommonSQLClient = configuration.get("connection", None)
-        selected_tables = connection.get_table_names(schema_name=connection.credentials.database)
-        table_schemas = connection.get_schema()
-        query_generator = QueryGenerator(handler=self.handler, client=connection)
+        connection: AsyncCommonSQLClient = configuration.get("connection", None)
+        selected_tables, table_schemas = await self.get_selected_schema(state, connection)
+        query_generator = QueryGenerator(handler=self.get_handler(config), client=connection)
         built_query = await query_generator.build_query(state.interpretation, selected_tables, table_schemas, state)
         generated_query = GeneratedSQLQuery(**built_query.content)
 
         result_message = AIMessage(
             content=generated_query.model_dump_json()
         )
-        summary = state.summary
-        summary += "\n\n[CURRENT OPERATION: Generating SQL Query]\n"
-        summary += f"Based on the current interpretation, we've generated the following SQL Query.\n"
-        summary += generated_query.model_dump_json(indent=4) + "\n"
-
         output = {
             "messages": [
                 result_message
             ],
-            "generated_query": generated_query
+            "generated_query": generated_query,
+            "memory": self.remember(state.memory, generated_query),
+            "prompt_usage": [query_generator.prompt_usage],
+            "retry_usage": RetryUsage(generations=1)
         }
         return output
+
+    @staticmethod
+    def remember(memory: ConversationMemory, generated_query: GeneratedSQLQuery) -> ConversationMemory:
+        return memory.add(MemoryOperation.GENERATION,
+                          "Based on the current interpretation, we've generated the following SQL Query.",
+                          generated_query.model_dump_json(),
+                          digest=f"Generated query: {generated_query.query}")
@@ -3,19 +3,19 @@ import json
 from langchain_core.messages import SystemMessage, HumanMessage, AIMessage
 from langchain_core.runnables import RunnableConfig
 
+from doorbeen.core.assistants.analysis.sql.nodes.base import SQLAssistantNode
 from doorbeen.core.assistants.analysis.sql.state import SQLAssistantState
-from doorbeen.core.models.provider import ModelHandler
+from doorbeen.core.assistants.memory.summary import MemoryOperation
+from doorbeen.core.models.invoker import llm_invoker
 from doorbeen.core.types.followups import FollowupAttempts
-from doorbeen.core.types.ts_model import TSModel
 
 
-class InputFollowupNode(TSModel):
-    handler: ModelHandler = None
+class InputFollowupNode(SQLAssistantNode):
 
     async def __call__(self, state: SQLAssistantState, config: RunnableConfig):
         assert state.is_followup, "This node should only be called for follow-up inputs"
-        summary = state.summary
-        summary_message = SystemMessage(content=f"This is the summary of everything that has happened till now\n {summary}")
+        summary_message = SystemMessage(content=f"This is the summary of everything that has happened till now\n "
+                                                f"{state.memory.render('followup')}")
         messages = [summary_message]
 
         last_messages = summary_message
@@ -45,15 +45,15 @@ user can be answered with the information already available.
 """
         messages.append(SystemMessage(content=prompt))
         messages.append(HumanMessage(content=f"CURRENT QUESTION:\n {state.input}"))
-        json_llm = self.handler.model.bind(response_format={"type": "json_object"})
-        response = await json_llm.ainvoke(messages)
+        json_llm = self.get_handler(config).model.bind(response_format={"type": "json_object"})
+        response = await llm_invoker.ainvoke(self.get_handler(config), messages, runnable=json_llm)
         response = json.loads(response.content)
         response = FollowupAttempts(**response)
         result_message = AIMessage(
             content=response.model_dump_json(),
         )
-        summary = state.summary
-        summary += f"Is this related to the previous question: {'Yes' if state.is_followup else 'No'}\n"
+        related = f"Is this related to the previous question: {'Yes' if state.is_followup else 'No'}"
+        memory = state.memory.add(MemoryOperation.FOLLOWUP, related, digest=related)
 
 
 
@@ -62,7 +62,7 @@ user can be answered with the information already available.
             "messages": [result_message],
             "input":  state.input,
             'is_followup': response.is_related or state.is_followup,
-            "summary": summary,
+            "memory": memory,
 
         }
         print(f"Follow-up question: {response.modified_question}")
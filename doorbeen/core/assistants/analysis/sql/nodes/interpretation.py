@@ -2,28 +2,30 @@ import json
 
 from langchain_core.messages import AIMessage, SystemMessage
 from langchain_core.runnables import RunnableConfig
+from pydantic import Field
 
 from doorbeen.core.assistants.analysis.sql.query.understanding import QueryUnderstandingEngine, QueryUnderstanding
+from doorbeen.core.assistants.analysis.sql.nodes.base import SQLAssistantNode
 from doorbeen.core.assistants.analysis.sql.state import SQLAssistantState
-from doorbeen.core.connections.clients.SQL.common import CommonSQLClient
-from doorbeen.core.models.provider import ModelHandler
-from doorbeen.core.types.ts_model import TSModel
+from doorbeen.core.assistants.memory.summary import ConversationMemory, MemoryOperation
+from doorbeen.core.connections.clients.SQL.aio import AsyncCommonSQLClient
+from doorbeen.core.models.invoker import llm_invoker
 
 
-class InterpretInputNode(TSModel):
-    handler: ModelHandler
+class InterpretInputNode(SQLAssistantNode):
+    defer_memory: bool = Field(default=False, description="Leave the memory to the join node when running as a "
+                                                          "parallel branch")
 
     async def __call__(self, state: SQLAssistantState, config: RunnableConfig):
         configuration = config.get("configurable", {})
-        assert state.grade is not None, "Grade should be present in the state"
-        connection: CommonSQLClient = configuration.get("connection", None)
-        db_schema = connection.get_schema().json()
-        selected_tables = connection.get_table_names(schema_name=connection.credentials.database)
-        table_schemas = connection.get_schema()
-        prompt_message = await QueryUnderstandingEngine(llm=self.handler.model).get_prompt(state.input,
+        # A speculative interpretation runs alongside grading, so there is no grade yet
+        assert self.defer_memory or state.grade is not None, "Grade should be present in the state"
+        connection: AsyncCommonSQLClient = configuration.get("connection", None)
+        selected_tables, table_schemas = await self.get_selected_schema(state, connection)
+        prompt_message = await QueryUnderstandingEngine(llm=self.get_handler(config).model).get_prompt(state.input,
                                                                                            selected_tables,
                                                                                            table_schemas)
-        summarized_content = state.summary
+        summarized_content = state.memory.render("interpretation")
         summarized_context = AIMessage(content=f"Here is a summary of all of the previous "
                                                f"conversations\n\n {summarized_content}\n\n")
         request_messages = [
@@ -31,22 +33,25 @@ class InterpretInputNode(TSModel):
             prompt_message
         ]
 
-        json_llm = self.handler.model.bind(response_format={"type": "json_object"})
-        response = await json_llm.ainvoke(request_messages)
+        json_llm = self.get_handler(config).model.bind(response_format={"type": "json_object"})
+        response = await llm_invoker.ainvoke(self.get_handler(config), request_messages, runnable=json_llm)
         response = json.loads(response.content)
         interpretation = QueryUnderstanding(**response)
 
-        summary = state.summary
-        summary += "\n\n[CURRENT OPERATION: Interpretation]\n"
-        summary += f"This is our current interpretation of the input based on the available information.\n"
-        summary += interpretation.model_dump_json(indent=4) + "\n"
-
         result_message = AIMessage(
             content=interpretation.model_dump_json(),
         )
         output = {
             "messages": [result_message],
             "interpretation": interpretation,
-            "summary": summary
         }
+        if not self.defer_memory:
+            output["memory"] = self.remember(state.memory, interpretation)
         return output
+
+    @staticmethod
+    def remember(memory: ConversationMemory, interpretation: QueryUnderstanding) -> ConversationMemory:
+        return memory.add(MemoryOperation.INTERPRETATION,
+                          "This is our current interpretation of the input based on the available information.",
+                          interpretation.model_dump_json(),
+                          digest=f"Interpreted objective: {interpretation.objective}")
@@ -2,24 +2,47 @@ from langchain_core.messages import AIMessage
 from langchain_core.runnables import RunnableConfig
 
 from doorbeen.core.assistants.analysis.sql.query.analysis import QueryResultsAnalysis
+from doorbeen.core.assistants.analysis.sql.nodes.base import SQLAssistantNode
 from doorbeen.core.assistants.analysis.sql.state import SQLAssistantState
-from doorbeen.core.models.provider import ModelHandler
-from doorbeen.core.types.ts_model import TSModel
+from doorbeen.core.types.serialization import dumps_model
 
 
-class ObserveSQLResultsNode(TSModel):
-    handler: ModelHandler
+class EvaluateSQLQueryNode(SQLAssistantNode):
 
     async def __call__(self, state: SQLAssistantState, config: RunnableConfig):
         is_last_execution_failed = state.last_execution_failed is not None and state.last_execution_failed
         assert not is_last_execution_failed, "Result should be present in the state"
-        analyzer = QueryResultsAnalysis(handler=self.handler, results=state.execution_results[-1], state=state)
-        report = await analyzer.analyse()
+        analyzer = QueryResultsAnalysis(handler=self.get_handler(config), results=state.execution_results[-1], state=state)
+        evaluation = await analyzer.evaluate_query_effectiveness()
+        return {"query_evaluation": evaluation}
+
+
+class ObserveSQLResultsNode(SQLAssistantNode):
+
+    async def __call__(self, state: SQLAssistantState, config: RunnableConfig):
+        is_last_execution_failed = state.last_execution_failed is not None and state.last_execution_failed
+        assert not is_last_execution_failed, "Result should be present in the state"
+        analyzer = QueryResultsAnalysis(handler=self.get_handler(config), results=state.execution_results[-1], state=state)
+        await analyzer.prepare_results()
+        report = await analyzer.observe_results()
+        output = {
+            "query_observation_report": report,
+            "prompt_usage": analyzer.prompt_usage
+        }
+        return output
+
+
+class CombineObservationsNode(SQLAssistantNode):
+    """Joins the evaluation of the query and the observation of its results, which run as parallel branches."""
+
+    async def __call__(self, state: SQLAssistantState, config: RunnableConfig):
+        assert state.query_observation_report is not None, "Query Observation Report should be present in the state"
+        report = state.query_observation_report.model_copy(update={"query": state.query_evaluation})
         result_message = AIMessage(
-            content=report.model_dump_json(),
+            content=dumps_model(report),
         )
         output = {
             "messages": [result_message],
-            "query_observation_report": report
+            "query_observation_report": report,
         }
         return output
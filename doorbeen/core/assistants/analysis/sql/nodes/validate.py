@@ -0,0 +1,49 @@
+from langchain_core.messages import AIMessage
+from langchain_core.runnables import RunnableConfig
+
+from doorbeen.core.assistants.analysis.sql.nodes.base import SQLAssistantNode
+from doorbeen.core.assistants.analysis.sql.retries import RetryUsage
+from doorbeen.core.assistants.analysis.sql.state import SQLAssistantState
+from doorbeen.core.assistants.memory.summary import MemoryOperation
+from doorbeen.core.connections.SQL.checks import SQLStaticChecker, static_check_config
+from doorbeen.core.connections.clients.SQL.aio import AsyncCommonSQLClient
+from doorbeen.core.types.execute import ExecutionResults
+from doorbeen.core.types.generate import GeneratedSQLQuery
+from doorbeen.core.types.serialization import dumps_model
+
+
+class ValidateSQLQueryNode(SQLAssistantNode):
+    """
+    Checks the generated query against the cached schema before anything reaches the database. Unambiguous fixes
+    are applied to the query, rejected queries go straight to the failure analysis as a failed execution.
+    """
+
+    async def __call__(self, state: SQLAssistantState, config: RunnableConfig):
+        configuration = config.get("configurable", {})
+        if not static_check_config.enabled:
+            return {"static_check": None}
+        assert state.generated_query is not None, "Generated query should be present in the state"
+        connection: AsyncCommonSQLClient = configuration.get("connection", None)
+        schema = await connection.aget_schema()
+        checker = SQLStaticChecker(dialect=connection.credentials.dialect, database_schema=schema,
+                                   auto_fix=static_check_config.auto_fix)
+        generated_query = state.generated_query
+        result = checker.check(generated_query.query)
+        output = {
+            "messages": [AIMessage(content=dumps_model(result))],
+            "static_check": result,
+            "last_execution_failed": not result.passed,
+        }
+        if result.fixes and result.passed:
+            output["generated_query"] = GeneratedSQLQuery(query=result.query)
+        if not result.passed:
+            error = "; ".join(result.errors)
+            failed = ExecutionResults(query=generated_query.query, error=error, is_sql_error=True, executed=False)
+            output["execution_results"] = [failed]
+            output["retry_usage"] = RetryUsage(rejections=1)
+            output["memory"] = state.memory.add(MemoryOperation.EXECUTION,
+                                                "This query was rejected before running it.\n",
+                                                f"Query: {generated_query.query}\n",
+                                                f"This error occurred: {error}",
+                                                digest=f"Query {generated_query.query} was rejected: {error}")
+        return output
@@ -1,10 +1,13 @@
+import asyncio
 import json
-from typing import Optional
+from typing import List, Optional
 
 from langchain_core.messages import SystemMessage, AIMessage
 from pydantic import model_validator
 
 from doorbeen.core.assistants.analysis.sql.state import SQLAssistantState
+from doorbeen.core.assistants.prompts.budget import PromptBudget, PromptSection, PromptTokenUsage, SectionPriority
+from doorbeen.core.models.invoker import llm_invoker
 from doorbeen.core.models.provider import ModelHandler
 from doorbeen.core.types.execute import ExecutionResults
 from doorbeen.core.types.observe import QueryAnalysisReport, QueryEvaluationReport
@@ -15,18 +18,17 @@ class QueryResultsContext(TSModel):
     all: list
     trimmed: Optional[list] = []
     query: Optional[str] = None
+    total_rows: Optional[int] = None
 
     def format_trimmed_results(self):
-        row_count = len(self.all)
+        row_count = len(self.all) if self.total_rows is None else self.total_rows
         formatted_text = f"""
         Query: {self.query}
         Total Rows: {row_count}
 """
         if row_count > 0:
             formatted_text += f"Rows: \n"
-        # Get all row data in dict format
-        for result in self.trimmed:
-            result_dict = result._asdict()
+        for result_dict in self.trimmed:
             formatted_text += f"{result_dict}\n"
         return formatted_text
 
@@ -36,31 +38,37 @@ class QueryResultsAnalysis(TSModel):
     results: ExecutionResults
     state: SQLAssistantState
     context_row_threshold: Optional[int] = 20
+    prompt_usage: List[PromptTokenUsage] = []
     _results_context: Optional[QueryResultsContext] = None
     _query_effectiveness: Optional[QueryEvaluationReport] = None
 
     @model_validator(mode='after')
     @classmethod
     def validate_results(cls, values):
-        row_count = len(values.results.result)
+        row_count = values.results.get_row_count()
         query = values.state.execution_results[-1].query
         if row_count > 0:
-            values._results_context = QueryResultsContext(all=values.results.result, query=query)
+            # Only the rows that can end up in the prompt are converted, sliced straight off the Arrow table
+            head = values.results.get_records(limit=values.context_row_threshold)
+            values._results_context = QueryResultsContext(all=head, query=query, total_rows=row_count)
         elif row_count == 0:
             values._results_context = QueryResultsContext(all=[], query=query)
         return values
 
     async def analyse(self):
+        await self.prepare_results()
+        report = await self.observe()
+        return report
+
+    async def prepare_results(self):
         needs_trim = self.needs_trim()
         if needs_trim:
             await self.trim_results()
         else:
-            self._results_context.trimmed = self.results.result
-        report = await self.observe()
-        return report
+            self._results_context.trimmed = self._results_context.all
 
     def needs_trim(self):
-        row_count = len(self.results.result)
+        row_count = self.results.get_row_count()
         if row_count > self.context_row_threshold:
             return True
         return False
@@ -71,7 +79,7 @@ class QueryResultsAnalysis(TSModel):
         elif self._results_context is not None and len(self._results_context.all) == 0:
             self._results_context.trimmed = []
 
-    async def evaluate_query_effectiveness(self):
+    async def evaluate_query_effectiveness(self) -> QueryEvaluationReport:
         query = self.state.execution_results[-1].query
         json_llm = self.handler.model.bind(response_format={"type": "json_object"})
         system_prompt = """
@@ -108,14 +116,21 @@ Always provide your observations in the following JSON format:
         messages = [
             SystemMessage(content=system_prompt),
             AIMessage(content=context_prompt)]
-        response = json_llm.invoke(messages)
+        response = await llm_invoker.ainvoke(self.handler, messages, runnable=json_llm)
         response = json.loads(response.content)
         response = QueryEvaluationReport(**response)
         return response
 
-    async def observe(self):
+    async def observe(self) -> QueryAnalysisReport:
+        # The two judgments are independent, only the report combines them
+        query_effectiveness, report = await asyncio.gather(self.evaluate_query_effectiveness(),
+                                                           self.observe_results())
+        report.query = query_effectiveness
+        return report
+
+    async def observe_results(self) -> QueryAnalysisReport:
+        """Insights and unmet objectives of the results, without the evaluation of the query itself."""
         query = self.state.execution_results[-1].query
-        query_effectiveness = await self.evaluate_query_effectiveness()
         json_llm = self.handler.model.bind(response_format={"type": "json_object"})
         system_prompt = """
 You are a Data Scientist who was tasked with an objective. Now you've analysed the data but now it's
@@ -155,26 +170,35 @@ Always provide your observations in the following JSON format:
     "unmet_objectives": [<Objective 1>, <Objective 2>, ...],
     "next_step": "The next step you need to take to meet all the objectives",
 """
-        context_prompt = f"""
+        context_sections = [
+            PromptSection(name="objective", content=f"""
 [OBJECTIVE]: {self.state.interpretation.objective}
 
 [GENERATED QUERY]: {query}
-
+"""),
+            PromptSection(name="results", content=f"""
 [RESULTS]: 
 {self._results_context.format_trimmed_results()}
-        """
-        summarized_content = self.state.summary
+        """, priority=SectionPriority.RESULTS),
+        ]
+        summarized_content = self.state.memory.render("observation")
+        fitted = PromptBudget.for_handler(self.handler).fit("observation", [
+            PromptSection(name="summary", content=summarized_content, priority=SectionPriority.SUMMARY),
+            PromptSection(name="instructions", content=system_prompt),
+            *context_sections
+        ])
+        self.prompt_usage.append(fitted.usage)
         summarized_context = AIMessage(content=f"Here is a summary of all of the previous "
-                                               f"conversations\n\n {summarized_content}\n\n")
+                                               f"conversations\n\n {fitted['summary']}\n\n")
         request_message = [
             summarized_context,
-            SystemMessage(content=system_prompt),
-            AIMessage(content=context_prompt)
+            SystemMessage(content=fitted["instructions"]),
+            AIMessage(content="".join(fitted[section.name] for section in context_sections))
         ]
-        response = json_llm.invoke(request_message)
+        response = await llm_invoker.ainvoke(self.handler, request_message, runnable=json_llm)
         response = json.loads(response.content)
         results_trimmed = self.needs_trim()
-        response = QueryAnalysisReport(**response, results_trimmed=results_trimmed, query=query_effectiveness)
+        response = QueryAnalysisReport(**response, results_trimmed=results_trimmed)
         return response
 
     async def generate_report(self):
@@ -1,3 +1,4 @@
+import asyncio
 from typing import List, Dict, Any, Tuple, Union, Optional
 
 from langchain_core.messages import SystemMessage, HumanMessage, AIMessage
@@ -5,10 +6,13 @@ from langchain_core.messages import SystemMessage, HumanMessage, AIMessage
 from doorbeen.core.assistants.analysis.sql.query.understanding import QueryUnderstanding
 from doorbeen.core.assistants.analysis.sql.state import SQLAssistantState
 from doorbeen.core.assistants.hooks.callback import CallbackManager
+from doorbeen.core.assistants.prompts.budget import PromptBudget, PromptSection, PromptTokenUsage, SectionPriority
 from doorbeen.core.assistants.toolkit.sql import TSSQLToolkit
 from doorbeen.core.connections.clients.NoSQL.mongo import MongoDBClient
+from doorbeen.core.connections.clients.SQL.aio import AsyncCommonSQLClient
 from doorbeen.core.connections.clients.SQL.bigquery import BigQueryClient
 from doorbeen.core.connections.clients.SQL.common import CommonSQLClient
+from doorbeen.core.models.invoker import llm_invoker
 from doorbeen.core.models.provider import ModelProvider, ModelHandler
 from doorbeen.core.types.observe import QueryAnalysisReport
 from doorbeen.core.types.sql_schema import DatabaseSchema
@@ -23,7 +27,8 @@ class QueryAttempt(TSModel):
 
 class QueryGenerator(TSModel):
     handler: ModelHandler
-    client: Union[CommonSQLClient, BigQueryClient, MongoDBClient]
+    client: Union[AsyncCommonSQLClient, CommonSQLClient, BigQueryClient, MongoDBClient]
+    prompt_usage: Optional[PromptTokenUsage] = None
 
     async def build_query(self, interpretation: QueryUnderstanding,
                           selected_tables: List[str],
@@ -31,22 +36,29 @@ class QueryGenerator(TSModel):
                           state: SQLAssistantState
                           ) -> AIMessage:
         system_prompt = self._construct_prompt()
-        input_prompt = self._format_input_prompt(interpretation, selected_tables, table_schemas,
-                                                 state.query_observation_report)
-        db_tools = TSSQLToolkit(client=self.client, handler=self.handler).get_sql_toolkit().get_tools()
+        input_sections = await self._format_input_prompt(interpretation, selected_tables, table_schemas,
+                                                         state.query_observation_report)
+        # The langchain SQLDatabase is built once per connection, off the event loop since it hits the catalog
+        db_tools = await asyncio.to_thread(TSSQLToolkit(client=self.client, handler=self.handler).get_tools)
         json_llm = self.handler.model.bind(response_format={"type": "json_object"})
         llm_with_tools = json_llm.bind_tools(tools=db_tools, tool_choice="sql_db_query_checker")
         response = None
         called_tool = False
-        summarized_content = state.summary
+        summarized_content = state.memory.render("generation")
+        fitted = PromptBudget.for_handler(self.handler).fit("generation", [
+            PromptSection(name="summary", content=summarized_content, priority=SectionPriority.SUMMARY),
+            PromptSection(name="instructions", content=system_prompt),
+            *input_sections
+        ])
+        self.prompt_usage = fitted.usage
         summarized_context = AIMessage(content=f"Here is a summary of all of the previous "
-                                               f"conversations\n\n {summarized_content}\n\n")
+                                               f"conversations\n\n {fitted['summary']}\n\n")
         request_messages = [
             summarized_context,
-            SystemMessage(content=system_prompt),
-            HumanMessage(content=input_prompt)
+            SystemMessage(content=fitted["instructions"]),
+            HumanMessage(content="".join(fitted[section.name] for section in input_sections))
         ]
-        response = llm_with_tools.invoke(request_messages)
+        response = await llm_invoker.ainvoke(self.handler, request_messages, runnable=llm_with_tools)
         called_tool = len(response.tool_calls) > 0
         assert called_tool is not False, "No tool was called"
         if called_tool:
@@ -90,11 +102,15 @@ class QueryGenerator(TSModel):
 
         return corrected_query, explanation, usage_stats
 
-    def _format_input_prompt(self, interpretation: QueryUnderstanding, selected_tables: List[str],
-                             table_schemas: DatabaseSchema,
-                             query_observation_report: Optional[QueryAnalysisReport] = None) -> str:
+    async def _format_input_prompt(self, interpretation: QueryUnderstanding, selected_tables: List[str],
+                                   table_schemas: DatabaseSchema,
+                                   query_observation_report: Optional[QueryAnalysisReport] = None
+                                   ) -> List[PromptSection]:
         formatted_schema = self._format_schema_info(table_schemas)
-        examples = self.client.get_examples(selected_tables)
+        if isinstance(self.client, AsyncCommonSQLClient):
+            examples = await self.client.aget_examples(selected_tables)
+        else:
+            examples = self.client.get_examples(selected_tables)
         selected_tables = ', '.join(selected_tables)
 
         # Base prompt structure
@@ -136,19 +152,26 @@ class QueryGenerator(TSModel):
         {unmet_reasons}
         """
 
-        # Add schema and examples information
-        human_prompt += f"""
+        # Add schema and examples information, these are what gets truncated when the prompt is too large
+        schema_prompt = f"""
         Table Schemas:
         {formatted_schema}
-
+"""
+        tables_prompt = f"""
         Selected Tables:
         {selected_tables}
-
+"""
+        examples_prompt = f"""
         Example Data:
         {examples}
         """
 
-        return human_prompt
+        return [
+            PromptSection(name="objective", content=human_prompt),
+            PromptSection(name="schema", content=schema_prompt, priority=SectionPriority.SCHEMA),
+            PromptSection(name="tables", content=tables_prompt),
+            PromptSection(name="examples", content=examples_prompt, priority=SectionPriority.EXAMPLES),
+        ]
 
     def _construct_prompt(self) -> str:
 
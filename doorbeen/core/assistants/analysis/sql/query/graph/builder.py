@@ -1,28 +1,40 @@
-from typing import Any
+from typing import Any, Dict, Optional
 
+from langchain_core.runnables import RunnableConfig
 from langgraph.constants import START, END
 from langgraph.graph import StateGraph
+from pydantic import Field, PrivateAttr
 
 from doorbeen.core.assistants.analysis.sql.nodes.conditionals.determine import InitAssistant, DetermineInputObjectives
 from doorbeen.core.assistants.analysis.sql.nodes.conditionals.enrich import EnrichInputNode
 from doorbeen.core.assistants.analysis.sql.nodes.conditionals.qn_qa import InputGradingNode
+from doorbeen.core.assistants.analysis.sql.nodes.conditionals.speculate import JoinGradeAndInterpretationNode
 from doorbeen.core.assistants.analysis.sql.nodes.entry import SQLAnalysisEntryNode
+from doorbeen.core.assistants.analysis.sql.nodes.estimate import EstimateSQLQueryCostNode, MakeQueryCheaperNode
 from doorbeen.core.assistants.analysis.sql.nodes.execute import ExecuteSQLQueryNode, AnalyseExecutionFailure
-from doorbeen.core.assistants.analysis.sql.nodes.finalize import FinalizeAnswerNode
+from doorbeen.core.assistants.analysis.sql.nodes.finalize import FinalizeAnswerNode, BestEffortAnswerNode
 from doorbeen.core.assistants.analysis.sql.nodes.generate import GenerateSQLQueryNode
 from doorbeen.core.assistants.analysis.sql.nodes.input_followup import InputFollowupNode
 from doorbeen.core.assistants.analysis.sql.nodes.interpretation import InterpretInputNode
-from doorbeen.core.assistants.analysis.sql.nodes.observe import ObserveSQLResultsNode
+from doorbeen.core.assistants.analysis.sql.nodes.validate import ValidateSQLQueryNode
+from doorbeen.core.assistants.analysis.sql.nodes.observe import ObserveSQLResultsNode, EvaluateSQLQueryNode, \
+    CombineObservationsNode
 from doorbeen.core.assistants.analysis.sql.nodes.visualize import QueryVisualizationNode
+from doorbeen.core.assistants.analysis.sql.retries import get_retry_budget, metered
 from doorbeen.core.assistants.analysis.sql.state import SQLAssistantState
+from doorbeen.core.config.execution_env import ExecutionEnv
 from doorbeen.core.models.provider import ModelHandler
 from doorbeen.core.types.followups import FollowupCertaintyLevel
 from doorbeen.core.types.ts_model import TSModel
 
 
 class SQLAgentGraphBuilder(TSModel):
-    handler: ModelHandler
-    question: str
+    # Both are optional, per request values are passed as config["configurable"]["handler"] and ["question"]
+    handler: Optional[ModelHandler] = None
+    question: Optional[str] = None
+    speculative_interpretation: bool = Field(
+        default_factory=lambda: ExecutionEnv.get_key('ASSISTANT_SPECULATIVE_INTERPRETATION') not in ["False", "false"],
+        description="Interpret the input while it is graded and redo it only if the grade asks for enrichment")
 
     def is_follow_up(self, state: SQLAssistantState):
         if state.is_followup:
@@ -30,6 +42,20 @@ class SQLAgentGraphBuilder(TSModel):
         else:
             return "new"
         
+    def route_input(self, state: SQLAssistantState):
+        if state.question_cache_hit is not None:
+            return "cached"
+        return self.speculate(self.is_follow_up(state), grading_route="new")
+
+    def route_followup(self, state: SQLAssistantState):
+        return self.speculate(self.followup_answers_fully(state), grading_route="process_further")
+
+    def speculate(self, route: str, grading_route: str):
+        # Fans out, the input is interpreted while it is graded and both are joined in join_grade_interpretation_node
+        if self.speculative_interpretation and route == grading_route:
+            return [route, "speculate"]
+        return route
+
     def followup_answers_fully(self, state: SQLAssistantState):
         if state.followups and len(state.followups) > 0:
             fully_answered = state.followups[-1].certainty_level == FollowupCertaintyLevel.FULL
@@ -46,15 +72,42 @@ class SQLAgentGraphBuilder(TSModel):
         else:
             return "no_enrich"
 
-    def query_execution_successful(self, state: SQLAssistantState):
+    @staticmethod
+    def retries_exhausted(state: SQLAssistantState, config: RunnableConfig, loop: Optional[str] = None) -> bool:
+        return get_retry_budget(config).exhausted(state.retry_usage, loop) is not None
+
+    def query_passed_checks(self, state: SQLAssistantState, config: RunnableConfig):
+        if state.static_check is not None and not state.static_check.passed:
+            if self.retries_exhausted(state, config, "repair"):
+                return "best_effort"
+            return "invalid"
+        else:
+            return "valid"
+
+    def query_within_budget(self, state: SQLAssistantState, config: RunnableConfig):
+        # Every query passes through here before it runs, so the tokens and time of the turn are checked here
+        if self.retries_exhausted(state, config):
+            return "best_effort"
+        if state.query_over_budget:
+            return "over_budget"
+        else:
+            return "within_budget"
+
+    def query_execution_successful(self, state: SQLAssistantState, config: RunnableConfig):
         if state.last_execution_failed:
+            if self.retries_exhausted(state, config, "repair"):
+                return "best_effort"
             return "analyse_failure"
         else:
-            return "process_results"
+            # Fans out, the query and its results are judged concurrently and joined in process_results_node
+            return ["evaluate_query", "observe_results"]
 
-    def all_objectives_fulfilled(self, state: SQLAssistantState):
+    def all_objectives_fulfilled(self, state: SQLAssistantState, config: RunnableConfig):
         if state.query_observation_report.all_objectives_met:
             return "all_objectives_met"
+        elif self.retries_exhausted(state, config, "regenerate"):
+            # The results so far are presented as they are
+            return "best_effort"
         else:
             return "regen_query"
 
@@ -64,78 +117,159 @@ class SQLAgentGraphBuilder(TSModel):
         entry_node = SQLAnalysisEntryNode(handler=self.handler)
         init_assistant = InitAssistant(handler=self.handler, qn=self.question)
         follow_up_node = InputFollowupNode(handler=self.handler)
-        qa_grade_node = InputGradingNode(handler=self.handler)
+        # Parallel branches leave the memory to the join node, concurrent updates of it would conflict
+        qa_grade_node = InputGradingNode(handler=self.handler, defer_memory=self.speculative_interpretation)
         enrich_input_node = EnrichInputNode(handler=self.handler)
         determine_input_objectives = DetermineInputObjectives(handler=self.handler)
         interpret_input_node = InterpretInputNode(handler=self.handler)
+        speculative_interpret_node = InterpretInputNode(handler=self.handler, defer_memory=True)
+        join_grade_interpretation_node = JoinGradeAndInterpretationNode(handler=self.handler)
         generate_sql_query_node = GenerateSQLQueryNode(handler=self.handler)
+        validate_sql_query_node = ValidateSQLQueryNode(handler=self.handler)
+        estimate_sql_query_node = EstimateSQLQueryCostNode(handler=self.handler)
+        make_query_cheaper_node = MakeQueryCheaperNode(handler=self.handler)
         execute_sql_query_node = ExecuteSQLQueryNode(handler=self.handler)
-        process_results_node = ObserveSQLResultsNode(handler=self.handler)
+        evaluate_query_node = EvaluateSQLQueryNode(handler=self.handler)
+        observe_results_node = ObserveSQLResultsNode(handler=self.handler)
+        process_results_node = CombineObservationsNode(handler=self.handler)
         generate_visualizations_node = QueryVisualizationNode(handler=self.handler)
         handle_execution_failure_node = AnalyseExecutionFailure(handler=self.handler)
         final_answer_node = FinalizeAnswerNode(handler=self.handler)
+        best_effort_answer_node = BestEffortAnswerNode(handler=self.handler)
 
-        # Add nodes and edges
-        graph_builder.add_node("init_assistant", init_assistant)
+        # Add nodes and edges, the tokens and database time every node spends count towards the turn's retry budget
+        graph_builder.add_node("init_assistant", metered(init_assistant))
         graph_builder.add_edge(START, "init_assistant")
-        graph_builder.add_node("input_followup_node", follow_up_node)
+        graph_builder.add_node("input_followup_node", metered(follow_up_node))
 
         # Add conditional edges
+        speculation = {"speculate": "speculative_interpret_node"} if self.speculative_interpretation else {}
         graph_builder.add_conditional_edges(
             "init_assistant",
-            self.is_follow_up,
+            self.route_input,
             {
                 "new": "qa_grade_node",
                 "followup": "input_followup_node",
+                "cached": "validate_sql_query_node",
+                **speculation,
             },
         )
         
         graph_builder.add_conditional_edges(
             "input_followup_node",
-            self.followup_answers_fully,
+            self.route_followup,
             {
                 "answer_directly": END,
                 "process_further": "qa_grade_node",
+                **speculation,
             },
         )
 
-        graph_builder.add_node("qa_grade_node", qa_grade_node)
-        graph_builder.add_node("enrich_input_node", enrich_input_node)
-        graph_builder.add_node("interpret_input_node", interpret_input_node)
+        graph_builder.add_node("qa_grade_node", metered(qa_grade_node))
+        graph_builder.add_node("enrich_input_node", metered(enrich_input_node))
+        graph_builder.add_node("interpret_input_node", metered(interpret_input_node))
+        graph_builder.add_node("generate_sql_query_node", metered(generate_sql_query_node))
+        if self.speculative_interpretation:
+            graph_builder.add_node("speculative_interpret_node", metered(speculative_interpret_node))
+            graph_builder.add_node("join_grade_interpretation_node", metered(join_grade_interpretation_node))
+            graph_builder.add_edge(["qa_grade_node", "speculative_interpret_node"], "join_grade_interpretation_node")
+            graph_builder.add_conditional_edges(
+                "join_grade_interpretation_node",
+                self.should_enrich,
+                {
+                    "enrich": "enrich_input_node",
+                    "no_enrich": "generate_sql_query_node",
+                },
+            )
+        else:
+            graph_builder.add_conditional_edges(
+                "qa_grade_node",
+                self.should_enrich,
+                {
+                    "enrich": "enrich_input_node",
+                    "no_enrich": "interpret_input_node",
+                },
+            )
+        graph_builder.add_edge("enrich_input_node", "interpret_input_node")
+        graph_builder.add_edge("interpret_input_node", "generate_sql_query_node")
+        # Every query is checked locally and planned before it runs, rejected ones go to the failure analysis and
+        # over budget ones are rewritten to be cheaper first
+        graph_builder.add_node("validate_sql_query_node", metered(validate_sql_query_node))
+        graph_builder.add_node("estimate_sql_query_node", metered(estimate_sql_query_node))
+        graph_builder.add_node("make_query_cheaper_node", metered(make_query_cheaper_node))
+        graph_builder.add_node("execute_sql_query_node", metered(execute_sql_query_node))
+        graph_builder.add_edge("generate_sql_query_node", "validate_sql_query_node")
         graph_builder.add_conditional_edges(
-            "qa_grade_node",
-            self.should_enrich,
+            "validate_sql_query_node",
+            self.query_passed_checks,
             {
-                "enrich": "enrich_input_node",
-                "no_enrich": "interpret_input_node",
+                "invalid": "handle_execution_failure_node",
+                "valid": "estimate_sql_query_node",
+                "best_effort": "best_effort_answer_node",
             },
         )
-        graph_builder.add_edge("enrich_input_node", "interpret_input_node")
-        graph_builder.add_node("generate_sql_query_node", generate_sql_query_node)
-        graph_builder.add_edge("interpret_input_node", "generate_sql_query_node")
-        graph_builder.add_node("execute_sql_query_node", execute_sql_query_node)
-        graph_builder.add_edge("generate_sql_query_node", "execute_sql_query_node")
-        graph_builder.add_node("process_results_node", process_results_node)
-        graph_builder.add_node("handle_execution_failure_node", handle_execution_failure_node)
+        graph_builder.add_conditional_edges(
+            "estimate_sql_query_node",
+            self.query_within_budget,
+            {
+                "over_budget": "make_query_cheaper_node",
+                "within_budget": "execute_sql_query_node",
+                "best_effort": "best_effort_answer_node",
+            },
+        )
+        graph_builder.add_edge("make_query_cheaper_node", "validate_sql_query_node")
+        graph_builder.add_node("evaluate_query_node", metered(evaluate_query_node))
+        graph_builder.add_node("observe_results_node", metered(observe_results_node))
+        graph_builder.add_node("process_results_node", metered(process_results_node))
+        graph_builder.add_node("handle_execution_failure_node", metered(handle_execution_failure_node))
 
         graph_builder.add_conditional_edges(
             "execute_sql_query_node",
             self.query_execution_successful,
             {
                 "analyse_failure": "handle_execution_failure_node",
-                "process_results": "process_results_node",
+                "evaluate_query": "evaluate_query_node",
+                "observe_results": "observe_results_node",
+                "best_effort": "best_effort_answer_node",
             },
         )
+        graph_builder.add_edge(["evaluate_query_node", "observe_results_node"], "process_results_node")
 
-        graph_builder.add_edge("handle_execution_failure_node", "execute_sql_query_node")
-        graph_builder.add_node("final_answer_node", final_answer_node)
+        graph_builder.add_edge("handle_execution_failure_node", "validate_sql_query_node")
+        graph_builder.add_node("final_answer_node", metered(final_answer_node))
+        # Reached when the retry budget of the turn runs out before a query succeeds
+        graph_builder.add_node("best_effort_answer_node", metered(best_effort_answer_node))
         graph_builder.add_conditional_edges(
             "process_results_node",
             self.all_objectives_fulfilled,
             {
                 "regen_query": "generate_sql_query_node",
                 "all_objectives_met": "final_answer_node",
+                "best_effort": "final_answer_node",
             },
         )
         graph_builder.add_edge("final_answer_node", END)
+        graph_builder.add_edge("best_effort_answer_node", END)
         return graph_builder.compile(checkpointer=checkpointer)
+
+
+class SQLAgentGraphCache(TSModel):
+    """
+    Compiled SQL agent graphs keyed by checkpointer. The graph holds no per request state, so one compiled graph is
+    shared by every request using the same checkpointer.
+    """
+    _graphs: Dict[int, Any] = PrivateAttr(default_factory=dict)
+
+    def get(self, checkpointer: Any) -> Any:
+        key = id(checkpointer)
+        cached = self._graphs.get(key)
+        if cached is None or cached[0] is not checkpointer:
+            cached = (checkpointer, SQLAgentGraphBuilder().build(checkpointer))
+            self._graphs[key] = cached
+        return cached[1]
+
+    def clear(self):
+        self._graphs.clear()
+
+
+sql_agent_graphs = SQLAgentGraphCache()
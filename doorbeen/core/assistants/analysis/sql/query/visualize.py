@@ -4,6 +4,7 @@ from typing import Optional
 from pydantic import Field
 
 from doorbeen.core.assistants.analysis.sql.state import SQLAssistantState
+from doorbeen.core.models.invoker import llm_invoker
 from doorbeen.core.models.provider import ModelHandler
 from doorbeen.core.types.ts_model import TSModel
 from doorbeen.core.types.visualize import QueryVisualizationPlan, VizWithData
@@ -27,9 +28,9 @@ class QueryVisualizationGenerator(TSModel):
         return key_count
 
     async def get_results_meta(self):
-        result = self.state.execution_results[-1].result
-        row_count = len(result)
-        column_count = self.get_column_count(result[0]) if row_count > 0 else 0
+        execution_results = self.state.execution_results[-1]
+        row_count = execution_results.get_row_count()
+        column_count = len(execution_results.get_columns())
         return {
             "row_count": row_count,
             "column_count": column_count
@@ -100,7 +101,7 @@ Always provide your observations in the following JSON format:
             context_prompt
         ]
         json_llm = self.handler.model.bind(response_format={"type": "json_object"})
-        response = json_llm.invoke(messages)
+        response = await llm_invoker.ainvoke(self.handler, messages, runnable=json_llm)
         response = json.loads(response.content)
         self.visualization_plan = QueryVisualizationPlan(**response)
         return self.visualization_plan
@@ -0,0 +1,141 @@
+import time
+from contextvars import ContextVar
+from typing import Any, Optional
+
+from langchain_core.runnables import RunnableConfig
+from pydantic import Field
+
+from doorbeen.core.config.execution_env import ExecutionEnv
+from doorbeen.core.types.ts_model import TSModel
+
+
+class RetryBudget(TSModel):
+    """Limits of a single turn, 0 turns a limit off. Exhausting any of them ends the turn with a best effort answer."""
+    max_repairs: int = Field(default_factory=lambda: int(ExecutionEnv.get_key('ASSISTANT_MAX_REPAIRS') or 3),
+                             description="Failed or rejected queries sent back to be corrected")
+    max_regenerations: int = Field(default_factory=lambda: int(ExecutionEnv.get_key('ASSISTANT_MAX_REGENERATIONS')
+                                                               or 2),
+                                   description="New queries generated because the results did not meet the objective")
+    max_tokens: int = Field(default_factory=lambda: int(ExecutionEnv.get_key('ASSISTANT_MAX_TURN_TOKENS') or 0),
+                            description="Model tokens, prompt and completion, spent on the turn")
+    max_db_seconds: float = Field(default_factory=lambda: float(ExecutionEnv.get_key('ASSISTANT_MAX_TURN_DB_SECONDS')
+                                                                or 0),
+                                  description="Time spent running and planning queries")
+    max_wall_seconds: float = Field(default_factory=lambda: float(ExecutionEnv.get_key('ASSISTANT_MAX_TURN_SECONDS')
+                                                                  or 300),
+                                    description="Time since the turn started")
+
+    def exhausted(self, usage: Optional["RetryUsage"], loop: Optional[str] = None) -> Optional[str]:
+        """The first exhausted limit, the attempts of ``loop``, "repair" or "regenerate", are only checked for it."""
+        if usage is None:
+            return None
+        if loop == "repair" and self.max_repairs and usage.repairs >= self.max_repairs:
+            return describe_limit(self.max_repairs, "repairs", usage.repairs)
+        if loop == "regenerate" and self.max_regenerations and usage.regenerations >= self.max_regenerations:
+            return describe_limit(self.max_regenerations, "regenerations", usage.regenerations)
+        if self.max_tokens and usage.tokens >= self.max_tokens:
+            return describe_limit(self.max_tokens, "tokens", usage.tokens)
+        if self.max_db_seconds and usage.db_seconds >= self.max_db_seconds:
+            return describe_limit(self.max_db_seconds, "database seconds", f"{usage.db_seconds:.1f}")
+        if self.max_wall_seconds and usage.elapsed_seconds >= self.max_wall_seconds:
+            return describe_limit(self.max_wall_seconds, "seconds", f"{usage.elapsed_seconds:.1f}")
+        return None
+
+
+def describe_limit(limit: float, unit: str, used: Any) -> str:
+    unit = unit[:-1] if limit == 1 else unit
+    return f"the limit of {limit:g} {unit} was reached ({used} used)"
+
+
+retry_budget = RetryBudget()
+
+
+def get_retry_budget(config: RunnableConfig) -> RetryBudget:
+    return config.get("configurable", {}).get("retry_budget", None) or retry_budget
+
+
+class RetryUsage(TSModel):
+    """
+    What a turn has spent so far. Nodes return only what they added, ``add_retry_usage`` sums it up so that parallel
+    branches can both report, a usage with ``reset`` starts a new turn.
+    """
+    generations: int = 0
+    repairs: int = 0
+    executions: int = 0
+    rejections: int = 0
+    tokens: int = 0
+    db_seconds: float = 0.0
+    started_at: Optional[float] = None
+    reset: bool = False
+
+    @property
+    def regenerations(self) -> int:
+        return max(self.generations - 1, 0)
+
+    @property
+    def elapsed_seconds(self) -> float:
+        return time.time() - self.started_at if self.started_at is not None else 0.0
+
+    def add(self, other: "RetryUsage") -> "RetryUsage":
+        return RetryUsage(generations=self.generations + other.generations, repairs=self.repairs + other.repairs,
+                          executions=self.executions + other.executions, rejections=self.rejections + other.rejections,
+                          tokens=self.tokens + other.tokens,
+                          db_seconds=self.db_seconds + other.db_seconds,
+                          started_at=self.started_at if self.started_at is not None else other.started_at)
+
+    def is_empty(self) -> bool:
+        return self == RetryUsage()
+
+    @property
+    def attempts(self) -> int:
+        """Execution results added in the turn, queries that ran and queries rejected before running."""
+        return self.executions + self.rejections
+
+    def report(self) -> dict:
+        return {**self.model_dump(exclude={"reset"}), "regenerations": self.regenerations,
+                "elapsed_seconds": round(self.elapsed_seconds, 3)}
+
+
+def add_retry_usage(current: Optional[RetryUsage], update: Optional[RetryUsage]) -> Optional[RetryUsage]:
+    if update is None:
+        return current
+    if current is None or update.reset:
+        return update.model_copy(update={"reset": False})
+    return current.add(update)
+
+
+# Usage of the node that is running, model calls and queries report to it from wherever they happen
+_node_usage: ContextVar[Optional[RetryUsage]] = ContextVar("node_usage", default=None)
+
+
+def record_tokens(response: Any):
+    usage = _node_usage.get()
+    metadata = getattr(response, "usage_metadata", None)
+    if usage is not None and metadata:
+        usage.tokens += metadata.get("total_tokens", 0)
+
+
+def record_db_seconds(seconds: float):
+    usage = _node_usage.get()
+    if usage is not None:
+        usage.db_seconds += seconds
+
+
+def metered(node: Any):
+    """Wraps a graph node so that the tokens and database time it spends are added to its ``retry_usage`` update."""
+
+    async def run(state: Any, config: RunnableConfig):
+        usage = RetryUsage()
+        token = _node_usage.set(usage)
+        try:
+            output = await node(state, config)
+        finally:
+            _node_usage.reset(token)
+        if not isinstance(output, dict) or usage.is_empty():
+            return output
+        reported = output.get("retry_usage", None)
+        if reported is not None:
+            usage = reported.add(usage).model_copy(update={"reset": reported.reset})
+        return {**output, "retry_usage": usage}
+
+    return run
@@ -6,11 +6,15 @@ from pydantic import Field
 
 from doorbeen.core.assistants.analysis.grades import InputGradeResult
 from doorbeen.core.assistants.analysis.sql.query.understanding import QueryUnderstanding
+from doorbeen.core.assistants.analysis.sql.retries import RetryUsage, add_retry_usage
+from doorbeen.core.assistants.memory.questions import QuestionCacheHit
+from doorbeen.core.assistants.memory.summary import ConversationMemory
+from doorbeen.core.assistants.prompts.budget import PromptTokenUsage
 from doorbeen.core.types.enrich import EnrichedOutput
-from doorbeen.core.types.execute import ExecutionResults
+from doorbeen.core.types.execute import ExecutionResults, QueryCostEstimate, StaticCheckResult
 from doorbeen.core.types.followups import FollowupAttempts
 from doorbeen.core.types.generate import GeneratedSQLQuery
-from doorbeen.core.types.observe import QueryAnalysisReport
+from doorbeen.core.types.observe import QueryAnalysisReport, QueryEvaluationReport
 from doorbeen.core.types.sql_schema import DatabaseSchema
 from doorbeen.core.types.ts_model import TSModel
 from doorbeen.core.types.visualize import QueryVisualizationPlan
@@ -38,14 +42,33 @@ class SQLAssistantState(TSModel):
     execution_results: Optional[Annotated[list[ExecutionResults], add_execution_operator]] = Field(default=None,
                                                                                                    description="The result of executing the query")
     last_execution_failed: Optional[bool] = Field(default=False, description="Whether the last execution failed")
+    static_check: Optional[StaticCheckResult] = Field(default=None, description="Local checks of the generated query "
+                                                                               "against the schema")
+    cost_estimate: Optional[QueryCostEstimate] = Field(default=None, description="Planner estimates of the generated "
+                                                                                 "query")
+    query_over_budget: Optional[bool] = Field(default=False, description="Whether the generated query has to be made "
+                                                                         "cheaper before it runs")
+    cost_rewrites: Optional[int] = Field(default=0, description="Rewrites of over budget queries for the current "
+                                                                "input")
     query_observation_report: Optional[QueryAnalysisReport] = Field(default=None, description="Report on the query results")
+    query_evaluation: Optional[QueryEvaluationReport] = Field(default=None, description="Whether the executed query "
+                                                                                        "was effective")
+    question_cache_hit: Optional[QuestionCacheHit] = Field(default=None, description="Cached question whose query "
+                                                                                     "answers the input")
     query_viz: Optional[QueryVisualizationPlan] = Field(default=None, description="Visualization of the query")
     selected_tables: Optional[List[str]] = Field(default_factory=list, description="Tables selected for the current "
                                                                                    "query")
     table_schemas: Optional[DatabaseSchema] = Field(default_factory=dict, description="Schemas of the selected tables")
     current_messages: Optional[List[AnyMessage]] = Field(default_factory=list,
                                                          description="Messages for the current execution")
-    summary: Optional[str] = Field(default=None, description="Summary of the existing conversations")
+    memory: ConversationMemory = Field(default_factory=ConversationMemory,
+                                       description="Token budgeted summary of the existing conversations")
+    prompt_usage: Optional[List[PromptTokenUsage]] = Field(default=None,
+                                                           description="Token counts of the prompts built by the "
+                                                                       "last node")
+    retry_usage: Annotated[Optional[RetryUsage], add_retry_usage] = Field(
+        default=None, description="Attempts, tokens and time spent on the current turn")
+    retry_exhausted: Optional[str] = Field(default=None, description="The retry budget limit that ended the turn early")
     request_count: Optional[int] = Field(default=0, description="Number of requests made to the assistant")
     # last_query: Optional[str] = Field(default=None, description="The last executed SQL query")
     # conversation_history: List[Dict[str, str]] = Field(default_factory=list, description="History of the conversation")
@@ -0,0 +1,78 @@
+import asyncio
+import logging
+from typing import Optional
+
+from langgraph.checkpoint.postgres.aio import AsyncPostgresSaver
+from psycopg_pool import AsyncConnectionPool
+from pydantic import Field, PrivateAttr
+
+from doorbeen.core.assistants.memory.locations.postgres import PostgresLocation
+from doorbeen.core.config.execution_env import ExecutionEnv
+from doorbeen.core.types.ts_model import TSModel
+
+
+class CheckpointPoolConfig(TSModel):
+    min_size: int = Field(default_factory=lambda: int(ExecutionEnv.get_key('CHECKPOINT_POOL_MIN_SIZE') or 2),
+                          description="Connections kept open to the memory database")
+    max_size: int = Field(default_factory=lambda: int(ExecutionEnv.get_key('CHECKPOINT_POOL_MAX_SIZE') or 20),
+                          description="Upper bound of connections to the memory database")
+    timeout: float = Field(default_factory=lambda: float(ExecutionEnv.get_key('CHECKPOINT_POOL_TIMEOUT_SECONDS') or 30),
+                           description="Seconds a request waits for a free connection")
+    max_idle: float = Field(default_factory=lambda: float(ExecutionEnv.get_key('CHECKPOINT_POOL_MAX_IDLE_SECONDS')
+                                                          or 600),
+                            description="Seconds an idle connection above min_size is kept")
+    check_on_checkout: bool = Field(default_factory=lambda: ExecutionEnv.get_key('CHECKPOINT_POOL_CHECK')
+                                    not in ["False", "false"],
+                                    description="Whether to test connections before lending them out")
+
+
+class CheckpointerManager(TSModel):
+    """
+    Owns the application wide AsyncPostgresSaver. It is backed by a connection pool and its migrations run once when
+    the pool is opened, requests borrow connections through the saver.
+    """
+    config: CheckpointPoolConfig = Field(default_factory=CheckpointPoolConfig)
+    _pool: Optional[AsyncConnectionPool] = PrivateAttr(default=None)
+    _checkpointer: Optional[AsyncPostgresSaver] = PrivateAttr(default=None)
+    _lock: Optional[asyncio.Lock] = PrivateAttr(default=None)
+
+    async def open(self, location: PostgresLocation) -> AsyncPostgresSaver:
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if self._checkpointer is not None:
+                return self._checkpointer
+            check = AsyncConnectionPool.check_connection if self.config.check_on_checkout else None
+            pool = AsyncConnectionPool(conninfo=location.db_uri, kwargs=location.config.model_dump(),
+                                       min_size=self.config.min_size, max_size=self.config.max_size,
+                                       timeout=self.config.timeout, max_idle=self.config.max_idle, check=check,
+                                       name="checkpoints", open=False)
+            await pool.open(wait=True)
+            checkpointer = AsyncPostgresSaver(pool)
+            await checkpointer.setup()
+            self._pool = pool
+            self._checkpointer = checkpointer
+            logging.info(f"Checkpoint pool opened with {self.config.min_size}-{self.config.max_size} connections")
+            return checkpointer
+
+    async def get_checkpointer(self, db_uri: Optional[str] = None) -> AsyncPostgresSaver:
+        if self._checkpointer is not None:
+            return self._checkpointer
+        # Outside of the API process nothing opened the pool at startup, open it on first use instead
+        db_uri = db_uri or ExecutionEnv.get_key('ASSISTANT_MEMORY_LOCATION_URI')
+        return await self.open(PostgresLocation(db_uri=db_uri))
+
+    def get_pool(self) -> Optional[AsyncConnectionPool]:
+        return self._pool
+
+    def get_stats(self) -> dict:
+        return self._pool.get_stats() if self._pool is not None else {}
+
+    async def close(self):
+        if self._pool is not None:
+            await self._pool.close()
+        self._pool = None
+        self._checkpointer = None
+
+
+checkpointer_manager = CheckpointerManager()
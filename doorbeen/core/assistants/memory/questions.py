@@ -0,0 +1,208 @@
+import math
+import re
+import threading
+from collections import Counter, OrderedDict, defaultdict
+from typing import Dict, List, Optional, Tuple
+
+from pydantic import Field, PrivateAttr
+
+from doorbeen.core.assistants.analysis.sql.query.understanding import QueryUnderstanding
+from doorbeen.core.config.execution_env import ExecutionEnv
+from doorbeen.core.types.generate import GeneratedSQLQuery
+from doorbeen.core.types.ts_model import TSModel
+
+PUNCTUATION_PATTERN = re.compile(r"[^\w\s]")
+# Words a paraphrase may add or drop without changing the query, negations and numbers are deliberately left out
+FILLER_WORDS = frozenset({
+    "a", "an", "the", "of", "for", "me", "us", "please", "can", "could", "you", "would", "tell", "show", "list",
+    "give", "get", "find", "display", "what", "which", "who", "is", "are", "was", "were", "do", "does", "did", "all",
+    "there", "that", "those", "these", "our", "my", "i", "we", "want", "to", "know", "see", "currently", "now",
+})
+
+
+class QuestionCacheConfig(TSModel):
+    enabled: bool = Field(default_factory=lambda: ExecutionEnv.get_key('QUESTION_CACHE_ENABLED')
+                          not in ["False", "false"],
+                          description="Whether answered questions are reused for repeated and paraphrased ones")
+    similarity_threshold: float = Field(
+        default_factory=lambda: float(ExecutionEnv.get_key('QUESTION_CACHE_SIMILARITY') or 0.8),
+        description="Cosine similarity of the n-gram vectors above which a cached question is reused")
+    short_question_threshold: float = Field(
+        default_factory=lambda: float(ExecutionEnv.get_key('QUESTION_CACHE_SHORT_SIMILARITY') or 0.9),
+        description="Stricter threshold for short questions, where a single changed word weighs more")
+    short_question_chars: int = Field(default_factory=lambda: int(ExecutionEnv.get_key('QUESTION_CACHE_SHORT_CHARS')
+                                                                  or 32),
+                                      description="Normalized questions up to this length count as short")
+    ngram_size: int = Field(default_factory=lambda: int(ExecutionEnv.get_key('QUESTION_CACHE_NGRAM') or 3),
+                            description="Length of the character n-grams the questions are indexed by")
+    max_entries: int = Field(default_factory=lambda: int(ExecutionEnv.get_key('QUESTION_CACHE_MAX_ENTRIES') or 2048),
+                             description="Questions kept across all connections")
+
+
+class QuestionCacheStats(TSModel):
+    hits: int = 0
+    exact_hits: int = 0
+    similar_hits: int = 0
+    misses: int = 0
+    stores: int = 0
+    evictions: int = 0
+    invalidations: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+
+class QuestionCacheHit(TSModel):
+    question: str = Field(description="The cached question that matched")
+    similarity: float
+    exact: bool = False
+
+
+class QuestionCacheEntry(TSModel):
+    identity: str
+    fingerprint: str
+    question: str
+    normalized: str
+    vector: Dict[str, float]
+    generated_query: GeneratedSQLQuery
+    interpretation: QueryUnderstanding
+    selected_tables: List[str] = []
+    hits: int = 0
+
+
+def normalize_question(question: str) -> str:
+    return " ".join(PUNCTUATION_PATTERN.sub(" ", question.lower()).split())
+
+
+def ngram_vector(normalized: str, size: int) -> Dict[str, float]:
+    padded = f" {normalized} "
+    grams = Counter(padded[index:index + size] for index in range(max(len(padded) - size + 1, 1)))
+    norm = math.sqrt(sum(count * count for count in grams.values())) or 1.0
+    return {gram: count / norm for gram, count in grams.items()}
+
+
+class QuestionCache(TSModel):
+    """
+    Maps answered questions to the interpretation and the SQL query that answered them, per connection and schema
+    fingerprint. Lookups match the normalized question exactly first and then by cosine similarity of character
+    n-gram vectors through an inverted index. Similar questions only match when the words they differ in are filler
+    words, so "top 5" never matches "top 10" and "not in Germany" never matches "in Germany". A changed schema
+    fingerprint drops every entry of the connection.
+    """
+    config: QuestionCacheConfig = Field(default_factory=QuestionCacheConfig)
+    stats: QuestionCacheStats = Field(default_factory=QuestionCacheStats)
+    _entries: "OrderedDict[str, QuestionCacheEntry]" = PrivateAttr(default_factory=OrderedDict)
+    _postings: Dict[str, Dict[str, Dict[str, float]]] = PrivateAttr(default_factory=dict)
+    _fingerprints: Dict[str, str] = PrivateAttr(default_factory=dict)
+    _lock: threading.RLock = PrivateAttr(default_factory=threading.RLock)
+
+    def lookup(self, identity: str, fingerprint: str,
+               question: str) -> Optional[Tuple[QuestionCacheEntry, QuestionCacheHit]]:
+        if not self.config.enabled:
+            return None
+        normalized = normalize_question(question)
+        with self._lock:
+            self._check_fingerprint(identity, fingerprint)
+            key = self._key(identity, normalized)
+            entry = self._entries.get(key)
+            if entry is not None:
+                self.stats.exact_hits += 1
+                return self._hit(key, QuestionCacheHit(question=entry.question, similarity=1.0, exact=True))
+            match = self._nearest(identity, normalized)
+            if match is None:
+                self.stats.misses += 1
+                return None
+            key, similarity = match
+            self.stats.similar_hits += 1
+            return self._hit(key, QuestionCacheHit(question=self._entries[key].question, similarity=similarity))
+
+    def store(self, identity: str, fingerprint: str, question: str, generated_query: GeneratedSQLQuery,
+              interpretation: QueryUnderstanding, selected_tables: Optional[List[str]] = None):
+        if not self.config.enabled:
+            return
+        normalized = normalize_question(question)
+        with self._lock:
+            self._check_fingerprint(identity, fingerprint)
+            key = self._key(identity, normalized)
+            self._remove(key)
+            entry = QuestionCacheEntry(identity=identity, fingerprint=fingerprint, question=question,
+                                       normalized=normalized, vector=ngram_vector(normalized, self.config.ngram_size),
+                                       generated_query=generated_query, interpretation=interpretation,
+                                       selected_tables=selected_tables or [])
+            self._entries[key] = entry
+            postings = self._postings.setdefault(identity, defaultdict(dict))
+            for gram, weight in entry.vector.items():
+                postings[gram][key] = weight
+            self.stats.stores += 1
+            while len(self._entries) > self.config.max_entries:
+                self._remove(next(iter(self._entries)))
+                self.stats.evictions += 1
+
+    def discard(self, identity: str, question: str):
+        with self._lock:
+            self._remove(self._key(identity, normalize_question(question)))
+
+    def invalidate(self, identity: Optional[str] = None):
+        with self._lock:
+            keys = [key for key, entry in self._entries.items() if identity is None or entry.identity == identity]
+            for key in keys:
+                self._remove(key)
+            if identity is None:
+                self._fingerprints.clear()
+            else:
+                self._fingerprints.pop(identity, None)
+            self.stats.invalidations += 1
+
+    def _nearest(self, identity: str, normalized: str) -> Optional[Tuple[str, float]]:
+        postings = self._postings.get(identity)
+        if not postings:
+            return None
+        # Vectors are unit length, so summing the products over the shared n-grams gives the cosine similarity
+        scores = defaultdict(float)
+        for gram, weight in ngram_vector(normalized, self.config.ngram_size).items():
+            for key, other_weight in postings.get(gram, {}).items():
+                scores[key] += weight * other_weight
+        threshold = self.config.similarity_threshold
+        if len(normalized) <= self.config.short_question_chars:
+            threshold = max(threshold, self.config.short_question_threshold)
+        words = set(normalized.split())
+        for key, similarity in sorted(scores.items(), key=lambda item: -item[1]):
+            if similarity < threshold:
+                break
+            if (words ^ set(self._entries[key].normalized.split())) <= FILLER_WORDS:
+                return key, min(similarity, 1.0)
+        return None
+
+    def _hit(self, key: str, hit: QuestionCacheHit) -> Tuple[QuestionCacheEntry, QuestionCacheHit]:
+        entry = self._entries[key]
+        entry.hits += 1
+        self._entries.move_to_end(key)
+        self.stats.hits += 1
+        return entry, hit
+
+    def _check_fingerprint(self, identity: str, fingerprint: str):
+        previous = self._fingerprints.get(identity)
+        if previous is not None and previous != fingerprint:
+            self.invalidate(identity)
+        self._fingerprints[identity] = fingerprint
+
+    def _remove(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        postings = self._postings.get(entry.identity, {})
+        for gram in entry.vector:
+            keys = postings.get(gram)
+            if keys is not None:
+                keys.pop(key, None)
+                if not keys:
+                    del postings[gram]
+
+    @staticmethod
+    def _key(identity: str, normalized: str) -> str:
+        return f"{identity}|{normalized}"
+
+
+question_cache = QuestionCache()
@@ -0,0 +1,147 @@
+from enum import Enum
+from typing import Dict, FrozenSet, List, Optional
+
+from pydantic import Field
+
+from doorbeen.core.config.execution_env import ExecutionEnv
+from doorbeen.core.models.tokens import count_tokens
+from doorbeen.core.types.ts_model import TSModel
+
+
+class MemoryOperation(str, Enum):
+    NEW_MESSAGE = "new_message"
+    FOLLOWUP = "followup"
+    GRADING = "grading"
+    ENRICHMENT = "enrichment"
+    INTERPRETATION = "interpretation"
+    GENERATION = "generation"
+    EXECUTION = "execution"
+    FAILURE_ANALYSIS = "failure_analysis"
+    COST_REWRITE = "cost_rewrite"
+    TURN_SUMMARY = "turn_summary"
+
+
+OPERATION_TITLES = {
+    MemoryOperation.NEW_MESSAGE: "------------------------- [New Message Starts Here] -------------------------",
+    MemoryOperation.FOLLOWUP: "[CURRENT OPERATION: Follow-up Check]",
+    MemoryOperation.GRADING: "[CURRENT OPERATION: Grading]",
+    MemoryOperation.ENRICHMENT: "[CURRENT OPERATION: Input Enrichment]",
+    MemoryOperation.INTERPRETATION: "[CURRENT OPERATION: Interpretation]",
+    MemoryOperation.GENERATION: "[CURRENT OPERATION: Generating SQL Query]",
+    MemoryOperation.EXECUTION: "[CURRENT OPERATION: SQL Query Execution]",
+    MemoryOperation.FAILURE_ANALYSIS: "[CURRENT OPERATION: Analyse Why SQL Execution Failed]",
+    MemoryOperation.COST_REWRITE: "[CURRENT OPERATION: Make the SQL Query Cheaper]",
+    MemoryOperation.TURN_SUMMARY: "[SUMMARY OF A PREVIOUS MESSAGE]",
+}
+
+ALL_OPERATIONS = frozenset(MemoryOperation)
+CONTEXT_OPERATIONS = frozenset({MemoryOperation.NEW_MESSAGE, MemoryOperation.FOLLOWUP,
+                                MemoryOperation.TURN_SUMMARY})
+
+# The sections each node needs to see, everything else is left out of its prompt
+NODE_MEMORY_VIEWS: Dict[str, FrozenSet[MemoryOperation]] = {
+    "followup": ALL_OPERATIONS,
+    "grading": CONTEXT_OPERATIONS,
+    "interpretation": CONTEXT_OPERATIONS | {MemoryOperation.GRADING, MemoryOperation.ENRICHMENT},
+    "generation": CONTEXT_OPERATIONS | {MemoryOperation.INTERPRETATION, MemoryOperation.GENERATION,
+                                        MemoryOperation.EXECUTION, MemoryOperation.FAILURE_ANALYSIS,
+                                        MemoryOperation.COST_REWRITE},
+    "failure_analysis": CONTEXT_OPERATIONS | {MemoryOperation.GENERATION, MemoryOperation.EXECUTION,
+                                              MemoryOperation.FAILURE_ANALYSIS},
+    "cost_rewrite": CONTEXT_OPERATIONS | {MemoryOperation.GENERATION, MemoryOperation.EXECUTION,
+                                          MemoryOperation.COST_REWRITE},
+    "observation": CONTEXT_OPERATIONS | {MemoryOperation.INTERPRETATION, MemoryOperation.EXECUTION},
+    "finalize": ALL_OPERATIONS,
+}
+
+
+def estimate_tokens(text: str) -> int:
+    return count_tokens(text)
+
+
+class ConversationMemoryConfig(TSModel):
+    token_budget: int = Field(default_factory=lambda: int(ExecutionEnv.get_key('ASSISTANT_MEMORY_TOKEN_BUDGET')
+                                                          or 3000),
+                              description="Tokens the conversation memory may hold before it is compacted")
+    keep_recent: int = Field(default_factory=lambda: int(ExecutionEnv.get_key('ASSISTANT_MEMORY_KEEP_RECENT') or 4),
+                             description="Most recent entries that are never compacted")
+
+
+class MemoryEntry(TSModel):
+    operation: MemoryOperation
+    turn: int = 0
+    fragments: List[str] = Field(default_factory=list)
+    digest: Optional[str] = Field(default=None, description="One line version used once the entry is compacted")
+    tokens: int = 0
+    compacted: bool = False
+
+    def render(self) -> str:
+        return OPERATION_TITLES[self.operation] + "\n" + "".join(self.fragments)
+
+    def compact(self) -> "MemoryEntry":
+        fragments = [self.digest + "\n"]
+        return MemoryEntry(operation=self.operation, turn=self.turn, fragments=fragments, digest=self.digest,
+                           tokens=estimate_tokens("".join(fragments)), compacted=True)
+
+
+class ConversationMemory(TSModel):
+    """
+    Token budgeted replacement for the conversation summary string. Nodes add typed entries made of text fragments,
+    once the budget is exceeded the oldest entries are reduced to their digests and then dropped. Updates return a
+    new memory so the state that was checkpointed before is left untouched.
+    """
+    entries: List[MemoryEntry] = Field(default_factory=list)
+    config: ConversationMemoryConfig = Field(default_factory=ConversationMemoryConfig, exclude=True)
+
+    @property
+    def total_tokens(self) -> int:
+        return sum(entry.tokens for entry in self.entries)
+
+    @property
+    def current_turn(self) -> int:
+        return self.entries[-1].turn if self.entries else 0
+
+    def add(self, operation: MemoryOperation, *fragments: str, digest: Optional[str] = None,
+            turn: Optional[int] = None) -> "ConversationMemory":
+        fragments = [fragment if fragment.endswith("\n") else fragment + "\n" for fragment in fragments]
+        entry = MemoryEntry(operation=operation, turn=self.current_turn if turn is None else turn,
+                            fragments=fragments, digest=digest,
+                            tokens=sum(estimate_tokens(fragment) for fragment in fragments))
+        return self._with_entries(self.entries + [entry])
+
+    def close_turn(self, turn: int, summary: str) -> "ConversationMemory":
+        """Replaces the entries of ``turn`` with one summary entry."""
+        entries = [entry for entry in self.entries if entry.turn != turn]
+        entries.append(MemoryEntry(operation=MemoryOperation.TURN_SUMMARY, turn=turn, fragments=[summary + "\n"],
+                                   digest=summary.split("\n", 1)[0], tokens=estimate_tokens(summary)))
+        return self._with_entries(entries)
+
+    def render(self, node: Optional[str] = None) -> str:
+        operations = NODE_MEMORY_VIEWS.get(node, ALL_OPERATIONS)
+        return "\n".join(entry.render() for entry in self.entries if entry.operation in operations)
+
+    def __str__(self):
+        return self.render()
+
+    def _with_entries(self, entries: List[MemoryEntry]) -> "ConversationMemory":
+        memory = ConversationMemory(entries=entries, config=self.config)
+        memory._compact()
+        return memory
+
+    def _compact(self):
+        budget = self.config.token_budget
+        total = self.total_tokens
+        if total <= budget:
+            return
+        compactable = max(len(self.entries) - self.config.keep_recent, 0)
+        for index in range(compactable):
+            entry = self.entries[index]
+            if entry.compacted or entry.digest is None:
+                continue
+            compacted = entry.compact()
+            total -= entry.tokens - compacted.tokens
+            self.entries[index] = compacted
+            if total <= budget:
+                return
+        while total > budget and len(self.entries) > self.config.keep_recent:
+            total -= self.entries.pop(0).tokens
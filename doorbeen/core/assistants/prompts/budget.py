@@ -0,0 +1,113 @@
+from enum import IntEnum
+from typing import Dict, List, Optional
+
+from pydantic import Field
+
+from doorbeen.core.config.execution_env import ExecutionEnv
+from doorbeen.core.models.provider import ModelHandler
+from doorbeen.core.models.tokens import Tokenizer, get_tokenizer
+from doorbeen.core.types.ts_model import TSModel
+
+TRUNCATION_MARKER = "\n...[truncated to fit the prompt budget]"
+
+
+class SectionPriority(IntEnum):
+    """Sections with a lower priority are truncated first."""
+    EXAMPLES = 10
+    SUMMARY = 20
+    RESULTS = 30
+    SCHEMA = 40
+    REQUIRED = 100
+
+
+class PromptBudgetConfig(TSModel):
+    reserved_output_tokens: int = Field(
+        default_factory=lambda: int(ExecutionEnv.get_key('PROMPT_RESERVED_OUTPUT_TOKENS') or 4096),
+        description="Part of the context window kept free for the response")
+    default_context_tokens: int = Field(
+        default_factory=lambda: int(ExecutionEnv.get_key('PROMPT_DEFAULT_CONTEXT_TOKENS') or 16385),
+        description="Context window assumed when the model is not known")
+    max_prompt_tokens: Optional[int] = Field(
+        default_factory=lambda: int(ExecutionEnv.get_key('PROMPT_MAX_TOKENS') or 0) or None,
+        description="Optional cap below the context window to bound prompt cost")
+
+
+class PromptSection(TSModel):
+    name: str
+    content: str
+    priority: SectionPriority = SectionPriority.REQUIRED
+    min_tokens: int = Field(default=0, description="Tokens the section keeps however tight the budget is")
+
+
+class SectionTokens(TSModel):
+    name: str
+    tokens: int
+    original_tokens: int
+    truncated: bool = False
+
+
+class PromptTokenUsage(TSModel):
+    prompt: str
+    model: Optional[str] = None
+    limit: int
+    total_tokens: int
+    exact: bool = True
+    sections: List[SectionTokens] = []
+
+
+class FittedPrompt(TSModel):
+    sections: Dict[str, str]
+    usage: PromptTokenUsage
+
+    def __getitem__(self, name: str) -> str:
+        return self.sections[name]
+
+
+class PromptBudget(TSModel):
+    """
+    Fits the sections of a prompt into the context window of the model. When they don't fit, the lowest priority
+    sections are truncated first, each down to its ``min_tokens``, until the prompt is within the limit.
+    """
+    limit: int
+    model: Optional[str] = None
+    tokenizer: Tokenizer
+
+    @classmethod
+    def for_handler(cls, handler: Optional[ModelHandler],
+                    config: Optional[PromptBudgetConfig] = None) -> "PromptBudget":
+        config = config or PromptBudgetConfig()
+        info = handler.info if handler is not None else None
+        context_tokens = info.max_tokens if info is not None else config.default_context_tokens
+        limit = max(context_tokens - config.reserved_output_tokens, 0)
+        if config.max_prompt_tokens is not None:
+            limit = min(limit, config.max_prompt_tokens)
+        model = info.name if info is not None else None
+        return cls(limit=limit, model=model, tokenizer=get_tokenizer(model))
+
+    def fit(self, name: str, sections: List[PromptSection]) -> FittedPrompt:
+        counts = {section.name: self.tokenizer.count(section.content) for section in sections}
+        contents = {section.name: section.content for section in sections}
+        tokens = dict(counts)
+        truncated_sections = set()
+        marker_tokens = self.tokenizer.count(TRUNCATION_MARKER)
+        overflow = sum(tokens.values()) - self.limit
+        for section in sorted(sections, key=lambda s: s.priority):
+            if overflow <= 0:
+                break
+            if section.priority is SectionPriority.REQUIRED:
+                continue
+            keep = max(tokens[section.name] - overflow - marker_tokens, section.min_tokens, 0)
+            if keep >= tokens[section.name]:
+                continue
+            truncated = self.tokenizer.truncate(section.content, keep) + TRUNCATION_MARKER
+            contents[section.name] = truncated
+            tokens[section.name] = self.tokenizer.count(truncated)
+            truncated_sections.add(section.name)
+            overflow = sum(tokens.values()) - self.limit
+        usage = PromptTokenUsage(prompt=name, model=self.model, limit=self.limit, total_tokens=sum(tokens.values()),
+                                 exact=self.tokenizer.is_exact,
+                                 sections=[SectionTokens(name=section.name, tokens=tokens[section.name],
+                                                         original_tokens=counts[section.name],
+                                                         truncated=section.name in truncated_sections)
+                                           for section in sections])
+        return FittedPrompt(sections=contents, usage=usage)
@@ -1,9 +1,13 @@
-from typing import Union
+import threading
+from collections import OrderedDict
+from typing import Callable, Union
 
 from langchain_community.agent_toolkits import SQLDatabaseToolkit
 from langchain_community.utilities import SQLDatabase
 from langchain_core.tools import BaseTool
+from pydantic import Field, PrivateAttr
 
+from doorbeen.core.config.execution_env import ExecutionEnv
 from doorbeen.core.connections.clients.NoSQL.mongo import MongoDBClient
 from doorbeen.core.connections.clients.SQL.bigquery import BigQueryClient
 from doorbeen.core.connections.clients.SQL.common import CommonSQLClient
@@ -11,36 +15,76 @@ from doorbeen.core.models.provider import ModelHandler
 from doorbeen.core.types.ts_model import TSModel
 
 
+class SQLDatabaseCacheConfig(TSModel):
+    max_entries: int = Field(default_factory=lambda: int(ExecutionEnv.get_key('LC_SQL_DATABASE_CACHE_MAX_ENTRIES')
+                                                         or 32),
+                             description="Connections whose langchain SQLDatabase is kept in memory")
+    sample_rows_in_table_info: int = Field(
+        default_factory=lambda: int(ExecutionEnv.get_key('LC_SQL_DATABASE_SAMPLE_ROWS') or 3),
+        description="Rows appended to the table info returned by the schema tool")
+
+
+class SQLDatabaseCache(TSModel):
+    """
+    Keeps one langchain SQLDatabase per connection, built on the pooled engine of the client with lazy table
+    reflection, so the toolkit doesn't create an engine and reflect the database on every query generation. Entries
+    are keyed by the schema fingerprint as well and are rebuilt when the schema changes.
+    """
+    config: SQLDatabaseCacheConfig = Field(default_factory=SQLDatabaseCacheConfig)
+    _entries: "OrderedDict[str, SQLDatabase]" = PrivateAttr(default_factory=OrderedDict)
+    _lock: threading.RLock = PrivateAttr(default_factory=threading.RLock)
+
+    def get_or_create(self, key: str, create: Callable[[], SQLDatabase]) -> SQLDatabase:
+        with self._lock:
+            db = self._entries.get(key)
+            if db is None:
+                db = create()
+                self._entries[key] = db
+                while len(self._entries) > self.config.max_entries:
+                    self._entries.popitem(last=False)
+            self._entries.move_to_end(key)
+            return db
+
+    def invalidate(self):
+        with self._lock:
+            self._entries.clear()
+
+
+sql_databases = SQLDatabaseCache()
+
+
 class TSSQLToolkit(TSModel):
     client: Union[CommonSQLClient, BigQueryClient, MongoDBClient]
     handler: ModelHandler
+    _toolkit: SQLDatabaseToolkit = PrivateAttr(default=None)
 
     def get_sql_toolkit(self) -> SQLDatabaseToolkit:
-        db, tools = self.get_lc_tools_from_uri()
-        toolkit = SQLDatabaseToolkit(db=db, llm=self.handler.model)
-        return toolkit
+        if self._toolkit is None:
+            self._toolkit = SQLDatabaseToolkit(db=self.get_database(), llm=self.handler.model)
+        return self._toolkit
 
     def get_tools(self):
-        db, tools = self.get_lc_tools_from_uri()
-        toolkit = SQLDatabaseToolkit(db=db, llm=self.handler.model)
-        collection = [self.get_list_table_tool(), self.get_schema_tool(), self.execute_query()]
-        return toolkit.get_tools()
+        return self.get_sql_toolkit().get_tools()
+
+    def get_database(self) -> SQLDatabase:
+        if isinstance(self.client, MongoDBClient):
+            return SQLDatabase.from_uri(self.client.get_uri())
+        engine = self.client.get_engine()
+        fingerprint = self.client.get_schema().get_fingerprint()
+        key = f"{self.client.get_identity()}|{fingerprint}|{id(engine)}"
+        return sql_databases.get_or_create(key, create=lambda: SQLDatabase(
+            engine=engine, lazy_table_reflection=True,
+            sample_rows_in_table_info=sql_databases.config.sample_rows_in_table_info))
 
     def get_lc_tools_from_uri(self) -> tuple[SQLDatabase, list[BaseTool]]:
-        db_uri = self.client.get_uri()
-        db = SQLDatabase.from_uri(db_uri)
-        toolkit = SQLDatabaseToolkit(db=db, llm=self.handler.model)
-        tools = toolkit.get_tools()
-        return db, tools
+        return self.get_database(), self.get_tools()
 
     def get_list_table_tool(self) -> BaseTool:
-        db, tools = self.get_lc_tools_from_uri()
-        tool = next(tool for tool in tools if tool.name == "sql_db_list_tables")
+        tool = next(tool for tool in self.get_tools() if tool.name == "sql_db_list_tables")
         return tool
 
     def get_schema_tool(self) -> BaseTool:
-        db, tools = self.get_lc_tools_from_uri()
-        tool = next(tool for tool in tools if tool.name == "sql_db_schema")
+        tool = next(tool for tool in self.get_tools() if tool.name == "sql_db_schema")
         return tool
 
     def execute_query(self) -> BaseTool:
@@ -49,6 +93,5 @@ class TSSQLToolkit(TSModel):
             If the query is not correct, an error message will be returned.
             If an error is returned, rewrite the query, check the query, and try again.
             """
-        db, tools = self.get_lc_tools_from_uri()
-        tool = next(tool for tool in tools if tool.name == "sql_db_query")
+        tool = next(tool for tool in self.get_tools() if tool.name == "sql_db_query")
         return tool
@@ -3,19 +3,24 @@ from typing import Any, Dict, Union, AsyncGenerator, List, Optional, Generator
 
 from langchain_core.messages import AIMessage
 from langgraph.checkpoint.postgres.aio import AsyncPostgresSaver
-from psycopg import AsyncConnection
 from pydantic import ConfigDict, Field
 
 from doorbeen.api.schemas.requests.assistants import AskLLMRequest
-from doorbeen.core.assistants.analysis.sql.query.graph.builder import SQLAgentGraphBuilder
-from doorbeen.core.assistants.memory.locations.postgres import PostgresLocation
+from doorbeen.core.assistants.analysis.sql.query.graph.builder import sql_agent_graphs
+from doorbeen.core.assistants.analysis.sql.retries import RetryBudget, RetryUsage, add_retry_usage
+from doorbeen.core.assistants.memory.checkpointer import checkpointer_manager
 from doorbeen.core.config.execution_env import ExecutionEnv
-from doorbeen.core.connections.clients.SQL.common import CommonSQLClient
+from doorbeen.core.connections.SQL.estimates import QueryCostBudget
+from doorbeen.core.connections.SQL.results import QueryResultLimits
+from doorbeen.core.connections.clients.SQL.aio import AsyncCommonSQLClient
 from doorbeen.core.connections.clients.service import DBClientService
-from doorbeen.core.events.generator import AgentEventGenerator
+from doorbeen.core.events.generator import AgentEventGenerator, AgentEvent
+from doorbeen.core.events.serialization import encode_event
+from doorbeen.core.events.types import EventTypes
 from doorbeen.core.models.provider import ModelProvider
 from doorbeen.core.types.databases import DatabaseTypes
-from doorbeen.core.types.outputs import NodeExecutionOutput
+from doorbeen.core.types.execute import ExecutionResults
+from doorbeen.core.types.outputs import NodeExecutionOutput, ResultLayout
 from doorbeen.core.types.ts_model import TSModel
 
 
@@ -34,11 +39,15 @@ class AssistantService(TSModel):
             logging.info(f"Database type {db_type} is not a common SQL type")
             return None
 
-        client: CommonSQLClient = DBClientService.get_client(
+        client: AsyncCommonSQLClient = DBClientService.get_client(
             details=request.connection.credentials,
-            db_type=request.connection.db_type
+            db_type=request.connection.db_type,
+            asynchronous=True
         )
-        connection = client.connect()
+        client.result_cache_ttl = request.connection.result_cache_ttl
+        client.statement_timeout = request.connection.statement_timeout
+        # The engines come from the shared registry so their pools are reused across requests and graph nodes
+        connection = await client.connect().aconnect()
         logging.info(f"Connected to {db_type} database")
         return connection
 
@@ -53,36 +62,41 @@ class AssistantService(TSModel):
         return model_handler
 
     async def setup_memory_checkpointer(self) -> AsyncPostgresSaver:
-        """Set up and return the memory checkpointer."""
-        loc_uri = self.memory_location
-        mem_loc = PostgresLocation(db_uri=loc_uri)
-        logging.info(f"DB Mem Loc: {mem_loc.db_uri}")
-
-        conn = await AsyncConnection.connect(mem_loc.db_uri, **mem_loc.config.model_dump())
-        checkpointer = AsyncPostgresSaver(conn)
-        await checkpointer.setup()
-        return checkpointer, conn
-
-    async def build_agent_graph(self, model_handler: Any, question: str, checkpointer: AsyncPostgresSaver) -> Any:
-        """Build and return the agent graph for processing the question."""
-        graph_builder = SQLAgentGraphBuilder(handler=model_handler, question=question)
-        graph = graph_builder.build(checkpointer)
-
-        # Save graph visualization for debugging
-        graph_details = graph.get_graph().draw_mermaid_png()
-        with open("workflow.png", "wb") as f:
-            f.write(graph_details)
-
-        return graph
-
-    def create_graph_config(self, connection: Any, thread_id: str = "5") -> Dict[str, Any]:
+        """Return the shared, pool backed memory checkpointer."""
+        return await checkpointer_manager.get_checkpointer(self.memory_location)
+
+    async def build_agent_graph(self, checkpointer: AsyncPostgresSaver) -> Any:
+        """Return the compiled agent graph, it is compiled once per checkpointer and reused across requests."""
+        return sql_agent_graphs.get(checkpointer)
+
+    def create_graph_config(self, connection: Any, model_handler: Any, question: str, thread_id: str = "5",
+                            result_format: ResultLayout = ResultLayout.RECORDS,
+                            result_chunk_rows: Optional[int] = None,
+                            bypass_question_cache: bool = False,
+                            bypass_result_cache: bool = False,
+                            statement_timeout: Optional[float] = None,
+                            cost_budget: Optional[QueryCostBudget] = None,
+                            retry_budget: Optional[RetryBudget] = None) -> Dict[str, Any]:
         """Create and return the configuration for the graph."""
+        if cost_budget is not None and "enabled" not in cost_budget.model_fields_set:
+            # Sending a budget turns the cost gate on for the request
+            cost_budget = cost_budget.model_copy(update={"enabled": True})
         return {
             "configurable": {
                 # fetch the user's database connection
                 "connection": connection,
+                # Per request inputs of the shared graph
+                "handler": model_handler,
+                "question": question,
                 # Checkpoints are accessed by thread_id
                 "thread_id": thread_id,
+                "result_format": result_format,
+                "result_chunk_rows": result_chunk_rows,
+                "bypass_question_cache": bypass_question_cache,
+                "bypass_result_cache": bypass_result_cache,
+                "result_limits": QueryResultLimits(timeout_seconds=statement_timeout),
+                "cost_budget": cost_budget,
+                "retry_budget": retry_budget,
             }
         }
 
@@ -91,53 +105,124 @@ class AssistantService(TSModel):
             graph: Any,
             question: str,
             config: Dict[str, Any],
-            conn: AsyncConnection,
             stream: bool = True
     ) -> Union[AsyncGenerator[str, None], List[Dict]]:
         """
         Process graph events and return either a streaming generator or collected responses.
         """
-        try:
-            if stream:
-                async def generate_response():
-                    try:
-                        async for event in graph.astream({"messages": ("user", question)}, config=config):
-                            for chunk in self.process_event_chunk(event):
-                                yield chunk
-                    finally:
-                        # Ensure connection is closed when streaming is done
-                        await conn.close()
-
-                return generate_response()
-            else:
-                responses = []
+        configurable = config.get("configurable", {})
+        chunk_rows = None
+        if configurable.get("result_format", None) is ResultLayout.COLUMNS:
+            chunk_rows = configurable.get("result_chunk_rows", None)
+        # Checkpoint connections are borrowed from the shared pool per operation, nothing to close here
+        if stream:
+            async def generate_response():
+                execution_results = None
+                retry_usage = None
                 async for event in graph.astream({"messages": ("user", question)}, config=config):
-                    for chunk in self.process_event_chunk(event, collect=True):
+                    execution_results = self.get_execution_results(event) or execution_results
+                    retry_usage = self.get_retry_usage(event, retry_usage)
+                    for chunk in self.process_event_chunk(event, retry_usage=retry_usage):
+                        yield chunk
+                    final_node = self.get_final_answer_node(event)
+                    if chunk_rows and final_node and execution_results is not None:
+                        for chunk in self.process_result_chunks(execution_results, chunk_rows, name=final_node):
+                            yield chunk
+
+            return generate_response()
+        else:
+            responses = []
+            execution_results = None
+            retry_usage = None
+            async for event in graph.astream({"messages": ("user", question)}, config=config):
+                execution_results = self.get_execution_results(event) or execution_results
+                retry_usage = self.get_retry_usage(event, retry_usage)
+                for chunk in self.process_event_chunk(event, collect=True, retry_usage=retry_usage):
+                    responses.append(chunk)
+                final_node = self.get_final_answer_node(event)
+                if chunk_rows and final_node and execution_results is not None:
+                    for chunk in self.process_result_chunks(execution_results, chunk_rows, collect=True,
+                                                            name=final_node):
                         responses.append(chunk)
-                return responses
-        finally:
-            # Only close here for non-streaming case
-            if not stream:
-                await conn.close()
+            return responses
 
-    def process_event_chunk(self, event: Dict[str, Any], collect: bool = False) -> Generator[str | Any, Any, None]:
+    def process_event_chunk(self, event: Dict[str, Any], collect: bool = False,
+                            retry_usage: Optional[RetryUsage] = None) -> Generator[str | Any, Any, None]:
         """Process a single event chunk and yield/return the result."""
         for key, value in event.items():
-            print("Key:", key)
             logging.info(f"Key: {key}")
-            logging.info(f"Value: {value}")
-            if isinstance(value["messages"][-1], AIMessage):
-                content = value["messages"][-1].content
+            logging.debug("Value: %s", value)
+            # Branches of a fan out may only update the state without adding a message
+            messages = value.get("messages") if isinstance(value, dict) else None
+            if messages and isinstance(messages[-1], AIMessage):
+                content = messages[-1].content
                 execution_output = NodeExecutionOutput(name=key, value=content)
                 event_obj = AgentEventGenerator(chunk=execution_output).process_chunk()
-                print("Assistant:", event_obj)
-                logging.info(f"Assistant: {event_obj.model_dump_json(indent=4)}")
+                logging.debug("Assistant: %s", event_obj)
 
                 if collect:
                     yield event_obj.model_dump()
                 else:
-                    # Yield JSON string with a newline
-                    yield event_obj.model_dump_json() + "\n"
+                    yield encode_event(event_obj)
+            if isinstance(value, dict) and value.get("prompt_usage"):
+                usage = [prompt_usage.model_dump() for prompt_usage in value["prompt_usage"]]
+                event_obj = AgentEvent(type=EventTypes.PROMPT_USAGE.value, name=key, data=usage)
+                if collect:
+                    yield event_obj.model_dump()
+                else:
+                    yield encode_event(event_obj)
+            if isinstance(value, dict) and value.get("cost_estimate"):
+                estimate = value["cost_estimate"]
+                data = {**estimate.model_dump(), "within_budget": estimate.within_budget,
+                        "over_budget": value.get("query_over_budget", False)}
+                event_obj = AgentEvent(type=EventTypes.COST_ESTIMATE.value, name=key, data=data)
+                if collect:
+                    yield event_obj.model_dump()
+                else:
+                    yield encode_event(event_obj)
+            if isinstance(value, dict) and retry_usage is not None and (value.get("retry_usage") or
+                                                                        value.get("retry_exhausted")):
+                # The totals of the turn so far, not only what this node added
+                data = {**retry_usage.report(), "exhausted": value.get("retry_exhausted", None)}
+                event_obj = AgentEvent(type=EventTypes.RETRY_USAGE.value, name=key, data=data)
+                if collect:
+                    yield event_obj.model_dump()
+                else:
+                    yield encode_event(event_obj)
+
+    @staticmethod
+    def get_execution_results(event: Dict[str, Any]) -> Optional[ExecutionResults]:
+        # Only results of queries that ran are presented, failed and rejected queries are added to the state too
+        for value in event.values():
+            if isinstance(value, dict) and value.get("execution_results"):
+                for results in reversed(value["execution_results"]):
+                    if results.error is None and results.executed:
+                        return results
+        return None
+
+    @staticmethod
+    def get_retry_usage(event: Dict[str, Any], current: Optional[RetryUsage]) -> Optional[RetryUsage]:
+        for value in event.values():
+            if isinstance(value, dict) and value.get("retry_usage") is not None:
+                current = add_retry_usage(current, value["retry_usage"])
+        return current
+
+    @staticmethod
+    def get_final_answer_node(event: Dict[str, Any]) -> Optional[str]:
+        for name in ("final_answer_node", "best_effort_answer_node"):
+            if name in event:
+                return name
+        return None
+
+    def process_result_chunks(self, execution_results: ExecutionResults, chunk_rows: int, collect: bool = False,
+                              name: str = "final_answer_node") -> Generator[str | Any, Any, None]:
+        """Yield the results of the last executed query as compact events of chunk_rows rows each."""
+        for result_chunk in execution_results.iter_result_chunks(chunk_rows):
+            event_obj = AgentEvent(type=EventTypes.RESULT_CHUNK.value, name=name, data=result_chunk)
+            if collect:
+                yield event_obj.model_dump()
+            else:
+                yield encode_event(event_obj)
 
     async def process_llm_request(self, request: AskLLMRequest, stream: bool = True):
         """Process an LLM request and return the response."""
@@ -149,11 +234,18 @@ class AssistantService(TSModel):
         model_handler = await self.setup_model_handler(request)
 
         # Set up memory and checkpointer
-        checkpointer, conn = await self.setup_memory_checkpointer()
+        checkpointer = await self.setup_memory_checkpointer()
 
         # Build graph and configure
-        graph = await self.build_agent_graph(model_handler, request.question, checkpointer)
-        config = self.create_graph_config(connection)
+        graph = await self.build_agent_graph(checkpointer)
+        config = self.create_graph_config(connection, model_handler, request.question,
+                                          result_format=request.result_format,
+                                          result_chunk_rows=request.result_chunk_rows,
+                                          bypass_question_cache=request.bypass_question_cache,
+                                          bypass_result_cache=request.bypass_result_cache,
+                                          statement_timeout=request.statement_timeout,
+                                          cost_budget=request.cost_budget,
+                                          retry_budget=request.retry_budget)
 
         # Process and return results - pass the connection
-        return await self.process_graph_events(graph, request.question, config, conn, stream)
\ No newline at end of file
+        return await self.process_graph_events(graph, request.question, config, stream)
\ No newline at end of file
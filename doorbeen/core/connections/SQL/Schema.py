@@ -1,6 +1,7 @@
-from typing import List
+from typing import List, Union
 
 from sqlalchemy import create_engine, MetaData
+from sqlalchemy.engine import Connection, Engine
 
 from doorbeen.core.types.sql_schema import ForeignKeySchema, ForeignKeyRelation, DatabaseSchema, TableSchema, ColumnSchema
 
@@ -26,8 +27,8 @@ def get_foreign_keys_schema(table) -> List[ForeignKeySchema]:
     return foreign_keys_list
 
 
-def get_sql_schema(database_url: str, include_views: bool = False) -> DatabaseSchema:
-    engine = create_engine(database_url, echo=True)
+def get_sql_schema(database: Union[str, Engine, Connection], include_views: bool = False) -> DatabaseSchema:
+    engine = create_engine(database) if isinstance(database, str) else database
     metadata = MetaData()
     # print("Starting metadata reflection")
     if include_views:
@@ -38,7 +39,7 @@ def get_sql_schema(database_url: str, include_views: bool = False) -> DatabaseSc
     tables_list: List[TableSchema] = []
 
     for table in metadata.tables.values():
-        columns = [ColumnSchema(name=col.name, type=str(col.type)) for col in table.columns]
+        columns = [ColumnSchema(name=col.name, type=str(col.type), comment=col.comment) for col in table.columns]
         primary_keys = [pk.name for pk in table.primary_key]
         foreign_keys_list = get_foreign_keys_schema(table)
 
@@ -46,7 +47,8 @@ def get_sql_schema(database_url: str, include_views: bool = False) -> DatabaseSc
             name=table.name,
             columns=columns,
             primary_keys=primary_keys,
-            foreign_keys=foreign_keys_list
+            foreign_keys=foreign_keys_list,
+            comment=table.comment
         )
 
         tables_list.append(table_schema)
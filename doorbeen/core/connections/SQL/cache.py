@@ -0,0 +1,151 @@
+import asyncio
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Optional
+
+from pydantic import Field, PrivateAttr
+
+from doorbeen.core.config.execution_env import ExecutionEnv
+from doorbeen.core.types.sql_schema import DatabaseSchema
+from doorbeen.core.types.ts_model import TSModel
+
+
+class SchemaCacheConfig(TSModel):
+    ttl_seconds: float = Field(default_factory=lambda: float(ExecutionEnv.get_key('SCHEMA_CACHE_TTL_SECONDS') or 300),
+                               description="How long a reflected schema is trusted before the catalog is re-checked")
+    max_entries: int = Field(default_factory=lambda: int(ExecutionEnv.get_key('SCHEMA_CACHE_MAX_ENTRIES') or 64),
+                             description="Maximum number of connections whose schema is kept in memory")
+
+
+class SchemaCacheEntry(TSModel):
+    database_schema: DatabaseSchema
+    fingerprint: Optional[str] = None
+    reflected_at: float
+    expires_at: float
+
+
+class SchemaCacheStats(TSModel):
+    hits: int = 0
+    misses: int = 0
+    revalidations: int = 0
+    reflections: int = 0
+    evictions: int = 0
+
+
+class SchemaCache(TSModel):
+    """
+    Process-wide cache of reflected database schemas keyed by connection identity.
+
+    Entries are trusted for ``ttl_seconds``. Once expired, the catalog fingerprint is recomputed and the entry is
+    renewed without reflecting again if the fingerprint did not change.
+    """
+    config: SchemaCacheConfig = Field(default_factory=SchemaCacheConfig)
+    stats: SchemaCacheStats = Field(default_factory=SchemaCacheStats)
+    _entries: "OrderedDict[str, SchemaCacheEntry]" = PrivateAttr(default_factory=OrderedDict)
+    _lock: threading.RLock = PrivateAttr(default_factory=threading.RLock)
+    _key_locks: Dict[str, threading.Lock] = PrivateAttr(default_factory=dict)
+    _async_key_locks: Dict[str, asyncio.Lock] = PrivateAttr(default_factory=dict)
+
+    def get_or_reflect(self, key: str, reflect: Callable[[], DatabaseSchema],
+                       fingerprint: Optional[Callable[[], Optional[str]]] = None) -> DatabaseSchema:
+        entry = self._get_entry(key)
+        if entry is not None and entry.expires_at > time.monotonic():
+            self.stats.hits += 1
+            return entry.database_schema
+
+        # Only one caller per connection reflects, the rest wait and reuse the result
+        with self._get_key_lock(key):
+            entry = self._get_entry(key)
+            now = time.monotonic()
+            if entry is not None and entry.expires_at > now:
+                self.stats.hits += 1
+                return entry.database_schema
+
+            current_fingerprint = fingerprint() if fingerprint is not None else None
+            if entry is not None and current_fingerprint is not None and entry.fingerprint == current_fingerprint:
+                entry.expires_at = now + self.config.ttl_seconds
+                self.stats.revalidations += 1
+                return entry.database_schema
+
+            self.stats.misses += 1
+            schema = reflect()
+            self.stats.reflections += 1
+            self._put(key, SchemaCacheEntry(database_schema=schema, fingerprint=current_fingerprint, reflected_at=now,
+                                            expires_at=now + self.config.ttl_seconds))
+            return schema
+
+    async def aget_or_reflect(self, key: str, reflect: Callable[[], Awaitable[DatabaseSchema]],
+                              fingerprint: Optional[Callable[[], Awaitable[Optional[str]]]] = None) -> DatabaseSchema:
+        entry = self._get_entry(key)
+        if entry is not None and entry.expires_at > time.monotonic():
+            self.stats.hits += 1
+            return entry.database_schema
+
+        async with self._get_async_key_lock(key):
+            entry = self._get_entry(key)
+            now = time.monotonic()
+            if entry is not None and entry.expires_at > now:
+                self.stats.hits += 1
+                return entry.database_schema
+
+            current_fingerprint = await fingerprint() if fingerprint is not None else None
+            if entry is not None and current_fingerprint is not None and entry.fingerprint == current_fingerprint:
+                entry.expires_at = now + self.config.ttl_seconds
+                self.stats.revalidations += 1
+                return entry.database_schema
+
+            self.stats.misses += 1
+            schema = await reflect()
+            self.stats.reflections += 1
+            self._put(key, SchemaCacheEntry(database_schema=schema, fingerprint=current_fingerprint, reflected_at=now,
+                                            expires_at=now + self.config.ttl_seconds))
+            return schema
+
+    def get_fingerprint(self, key: str) -> Optional[str]:
+        entry = self._get_entry(key)
+        return entry.fingerprint if entry is not None else None
+
+    def invalidate(self, key: Optional[str] = None):
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+    def _get_entry(self, key: str) -> Optional[SchemaCacheEntry]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def _put(self, key: str, entry: SchemaCacheEntry):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.config.max_entries:
+                evicted_key, _ = self._entries.popitem(last=False)
+                self._key_locks.pop(evicted_key, None)
+                self._async_key_locks.pop(evicted_key, None)
+                self.stats.evictions += 1
+
+    def _get_key_lock(self, key: str) -> threading.Lock:
+        with self._lock:
+            return self._key_locks.setdefault(key, threading.Lock())
+
+    def _get_async_key_lock(self, key: str) -> asyncio.Lock:
+        with self._lock:
+            return self._async_key_locks.setdefault(key, asyncio.Lock())
+
+
+def hash_catalog_rows(rows) -> str:
+    digest = hashlib.sha256()
+    for row in rows:
+        digest.update("|".join("" if value is None else str(value) for value in row).encode("utf-8"))
+        digest.update(b"\n")
+    return digest.hexdigest()
+
+
+schema_cache = SchemaCache()
@@ -0,0 +1,234 @@
+from typing import Dict, List, Optional, Set, Tuple
+
+import sqlglot
+from pydantic import Field
+from sqlglot import exp
+from sqlglot.dialects.dialect import Dialect, NormalizationStrategy
+from sqlglot.errors import ParseError
+from sqlglot.optimizer.scope import Scope, traverse_scope
+
+from doorbeen.core.config.execution_env import ExecutionEnv
+from doorbeen.core.types.databases import DatabaseTypes
+from doorbeen.core.types.execute import StaticCheckResult
+from doorbeen.core.types.sql_schema import DatabaseSchema
+from doorbeen.core.types.ts_model import TSModel
+
+SQLGLOT_DIALECTS = {
+    DatabaseTypes.POSTGRESQL: "postgres",
+    DatabaseTypes.MYSQL: "mysql",
+    DatabaseTypes.SQLITE: "sqlite",
+    DatabaseTypes.ORACLE: "oracle",
+    DatabaseTypes.BIGQUERY: "bigquery",
+    DatabaseTypes.SNOWFLAKE: "snowflake",
+    DatabaseTypes.REDSHIFT: "redshift",
+}
+# Dialects a query that doesn't parse in the connection's dialect is tried in, the first one that parses it wins
+FALLBACK_DIALECTS = ("postgres", "mysql", "bigquery", "sqlite", "tsql", "snowflake", "oracle")
+WRITE_EXPRESSIONS = (exp.Insert, exp.Update, exp.Delete, exp.Merge, exp.Create, exp.Drop, exp.Alter,
+                     exp.TruncateTable, exp.Command, exp.Into, exp.Grant, exp.Copy, exp.LoadData, exp.Set, exp.Use,
+                     exp.Pragma, exp.Transaction, exp.Commit, exp.Rollback)
+CATALOG_PREFIXES = ("pg_", "sqlite_", "information_schema")
+
+
+def get_aliases(expression: exp.Expression) -> Set[str]:
+    # Some dialects let WHERE, GROUP BY and HAVING refer to the aliases of the selected expressions
+    selects = expression.selects if isinstance(expression, exp.Select) else []
+    return {select.alias.lower() for select in selects if isinstance(select, exp.Alias)}
+
+
+def is_read_only_sql(sql: str, dialect: Optional[DatabaseTypes] = None) -> bool:
+    """Whether ``sql`` is a single statement that only reads, queries that can't be parsed are not."""
+    try:
+        expressions = [e for e in sqlglot.parse(sql, read=SQLGLOT_DIALECTS.get(dialect)) if e is not None]
+    except ParseError:
+        return False
+    if len(expressions) != 1:
+        return False
+    if isinstance(expressions[0], exp.Values):
+        return True
+    return SQLStaticChecker.is_read_only(expressions[0])
+
+
+class StaticCheckConfig(TSModel):
+    enabled: bool = Field(default_factory=lambda: ExecutionEnv.get_key('SQL_STATIC_CHECKS_ENABLED')
+                          not in ["False", "false"],
+                          description="Whether generated queries are parsed and checked against the schema before "
+                                      "they run")
+    auto_fix: bool = Field(default_factory=lambda: ExecutionEnv.get_key('SQL_STATIC_AUTO_FIX')
+                           not in ["False", "false"],
+                           description="Whether identifier case and other dialect syntax are rewritten when the fix "
+                                       "is unambiguous")
+
+
+static_check_config = StaticCheckConfig()
+
+
+class SQLStaticChecker(TSModel):
+    """
+    Parses a query with sqlglot and checks it without touching the database. Anything but a single read only query
+    is rejected, tables and columns are resolved against the cached schema and identifiers whose case would not
+    match after the dialect folds them are quoted with the schema's spelling. Queries written in another dialect are
+    transpiled. References that can't be resolved with certainty, e.g. columns of table valued functions, are left to
+    the database.
+    """
+    dialect: DatabaseTypes
+    database_schema: DatabaseSchema
+    auto_fix: bool = True
+
+    def check(self, sql: str) -> StaticCheckResult:
+        result = StaticCheckResult(query=sql, original_query=sql)
+        read = SQLGLOT_DIALECTS.get(self.dialect)
+        if read is None:
+            return result
+        expressions, source_dialect = self._parse(sql, read)
+        if expressions is None:
+            # sqlglot doesn't know every construct of every dialect, the database gets the final say on the syntax
+            result.warnings.append(f"The query could not be parsed as {self.dialect.value} SQL: {source_dialect}")
+            return result
+        if len(expressions) != 1:
+            result.errors.append("Only a single statement can be run at a time")
+            return result
+        expression = expressions[0]
+        result.read_only = self.is_read_only(expression)
+        if not result.read_only:
+            result.errors.append("Only read only queries are allowed, the query has to be a single SELECT statement "
+                                 "without INSERT, UPDATE, DELETE, DDL or SELECT INTO")
+            return result
+        if source_dialect != read:
+            if not self.auto_fix:
+                result.errors.append(f"The query is written in {source_dialect} syntax instead of {read}")
+                return result
+            result.fixes.append(f"Rewrote the query from {source_dialect} to {read} syntax")
+        result.errors.extend(self._check_references(expression, read, result.fixes))
+        result.fixes = list(dict.fromkeys(result.fixes))
+        if result.fixes and not result.errors:
+            result.query = expression.sql(dialect=read)
+        return result
+
+    @staticmethod
+    def _parse(sql: str, read: str) -> Tuple[Optional[List[exp.Expression]], str]:
+        error = None
+        for dialect in (read, *[fallback for fallback in FALLBACK_DIALECTS if fallback != read]):
+            try:
+                return [e for e in sqlglot.parse(sql, read=dialect) if e is not None], dialect
+            except ParseError as e:
+                error = error or str(e).splitlines()[0]
+        return None, error
+
+    @staticmethod
+    def is_read_only(expression: exp.Expression) -> bool:
+        if not isinstance(expression, exp.Query):
+            return False
+        return expression.find(*WRITE_EXPRESSIONS) is None
+
+    def _check_references(self, expression: exp.Expression, read: str, fixes: List[str]) -> List[str]:
+        dialect = Dialect.get_or_raise(read)
+        tables = {table.name: table for table in self.database_schema.tables}
+        tables_lower = {}
+        for name in tables:
+            tables_lower.setdefault(name.lower(), []).append(name)
+        cte_names = {cte.alias_or_name.lower() for cte in expression.find_all(exp.CTE)}
+        errors = []
+        for table in expression.find_all(exp.Table):
+            if not isinstance(table.this, exp.Identifier) or table.args.get("db") is not None:
+                continue
+            name = table.name
+            if name.lower() in cte_names or name.lower().startswith(CATALOG_PREFIXES):
+                continue
+            matched = self._match(table.this, tables, tables_lower, dialect, fixes, "table")
+            if matched is None:
+                errors.append(f"Table {name} does not exist")
+        if errors:
+            return errors
+        for scope in traverse_scope(expression):
+            for column in scope.columns:
+                nested = column.find_ancestor(exp.Select) is not scope.expression
+                if nested and isinstance(scope.expression, exp.Select):
+                    # Columns of nested subqueries are checked in their own scope
+                    continue
+                error = self._check_column(scope, column, tables, dialect, fixes)
+                if error is not None and error not in errors:
+                    errors.append(error)
+        return errors
+
+    def _check_column(self, scope: Scope, column: exp.Column, tables: Dict[str, object], dialect: Dialect,
+                      fixes: List[str]) -> Optional[str]:
+        if not isinstance(column.this, exp.Identifier) or len(column.parts) > 2:
+            return None
+        if column.this.quoted and self.dialect is DatabaseTypes.SQLITE:
+            # SQLite reads double quoted names that aren't columns as strings
+            return None
+        name = column.name
+        if column.table:
+            source = self._find_source(scope, column.table)
+            if source is None:
+                return None
+            found = self._source_has_column(source, column.this, tables, dialect, fixes)
+            return None if found is not False else f"Column {column.table}.{name} does not exist"
+        current = scope
+        while current is not None:
+            if name.lower() in get_aliases(current.expression):
+                return None
+            for source in current.sources.values():
+                found = self._source_has_column(source, column.this, tables, dialect, fixes)
+                if found is not False:
+                    return None
+            current = current.parent
+        return f"Column {name} does not exist in any of the queried tables"
+
+    @staticmethod
+    def _find_source(scope: Scope, alias: str):
+        current = scope
+        while current is not None:
+            for source_alias, source in current.sources.items():
+                if source_alias.lower() == alias.lower():
+                    return source
+            current = current.parent
+        return None
+
+    def _source_has_column(self, source, identifier: exp.Identifier, tables: Dict[str, object], dialect: Dialect,
+                           fixes: List[str]) -> Optional[bool]:
+        """True or False when the source is known to have the column or not, None when it can't be told."""
+        if isinstance(source, Scope):
+            selects = [name.lower() for name in source.expression.named_selects]
+            if "*" in selects or not selects:
+                return None
+            return identifier.name.lower() in selects
+        if not isinstance(source, exp.Table) or not isinstance(source.this, exp.Identifier):
+            return None
+        table = tables.get(source.name)
+        if table is None:
+            return None
+        columns = {column.name: column for column in table.columns}
+        columns_lower = {}
+        for name in columns:
+            columns_lower.setdefault(name.lower(), []).append(name)
+        return self._match(identifier, columns, columns_lower, dialect, fixes, "column") is not None
+
+    def _match(self, identifier: exp.Identifier, names: Dict[str, object], names_lower: Dict[str, List[str]],
+               dialect: Dialect, fixes: List[str], kind: str) -> Optional[str]:
+        """Resolves an identifier to the schema's spelling, quoting it when the dialect would fold it differently."""
+        name = identifier.name
+        candidates = names_lower.get(name.lower(), [])
+        if name in names and (identifier.quoted or self._folds_to(dialect, identifier, name)):
+            return name
+        if not candidates:
+            return None
+        if dialect.normalization_strategy is NormalizationStrategy.CASE_INSENSITIVE and not identifier.quoted:
+            return candidates[0]
+        folded = [candidate for candidate in candidates if self._folds_to(dialect, identifier, candidate)]
+        if folded and not identifier.quoted:
+            return folded[0]
+        if len(candidates) != 1 or not self.auto_fix:
+            return None
+        fixes.append(f"Quoted the {kind} {name}" if name == candidates[0] else
+                     f"Quoted the {kind} {name} as {candidates[0]}")
+        identifier.set("this", candidates[0])
+        identifier.set("quoted", True)
+        return candidates[0]
+
+    @staticmethod
+    def _folds_to(dialect: Dialect, identifier: exp.Identifier, name: str) -> bool:
+        if identifier.quoted:
+            return identifier.name == name
+        return dialect.normalize_identifier(identifier.copy()).name == name
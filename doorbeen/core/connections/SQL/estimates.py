@@ -0,0 +1,125 @@
+import json
+import re
+from typing import Any, Callable, List, Optional, Sequence
+
+from pydantic import Field
+
+from doorbeen.core.config.execution_env import ExecutionEnv
+from doorbeen.core.connections.SQL.query_cache import TRAILING_SEMICOLONS
+from doorbeen.core.types.databases import DatabaseTypes
+from doorbeen.core.types.execute import QueryCostEstimate
+from doorbeen.core.types.ts_model import TSModel
+
+# "SCAN customers", "SCAN TABLE customers" before SQLite 3.36, "SEARCH ..." lines use an index and are left out
+SQLITE_SCAN_PATTERN = re.compile(r"^SCAN (?:TABLE )?(\S+)")
+
+
+def get_optional_number(key: str, cast: Callable[[str], Any] = float) -> Optional[Any]:
+    value = ExecutionEnv.get_key(key)
+    return cast(value) if value else None
+
+
+class QueryCostBudget(TSModel):
+    enabled: bool = Field(default_factory=lambda: ExecutionEnv.get_key('QUERY_COST_GATE_ENABLED') in ["True", "true"],
+                          description="Whether generated queries are estimated before they run")
+    max_rows: Optional[float] = Field(default_factory=lambda: get_optional_number('QUERY_BUDGET_MAX_ROWS'),
+                                      description="Largest row count the planner may expect for any step of the plan")
+    max_cost: Optional[float] = Field(default_factory=lambda: get_optional_number('QUERY_BUDGET_MAX_COST'),
+                                      description="Planner cost of the whole query, in the database's own units")
+    max_bytes: Optional[int] = Field(default_factory=lambda: get_optional_number('QUERY_BUDGET_MAX_BYTES', int),
+                                     description="Bytes the query may scan, reported by BigQuery dry runs")
+    max_full_scans: Optional[int] = Field(
+        default_factory=lambda: get_optional_number('QUERY_BUDGET_MAX_FULL_SCANS', int),
+        description="Tables the query may read without an index")
+    max_rewrites: int = Field(default_factory=lambda: int(ExecutionEnv.get_key('QUERY_BUDGET_MAX_REWRITES') or 2),
+                              description="Attempts at making an over budget query cheaper, it runs afterwards "
+                                          "bounded by the statement timeout")
+
+    def check(self, estimate: QueryCostEstimate) -> QueryCostEstimate:
+        """Returns the estimate with the budgets it exceeds, unknown figures never exceed a budget."""
+        exceeded = []
+        if self.max_rows is not None and (estimate.estimated_rows or 0) > self.max_rows:
+            exceeded.append(f"estimated rows {estimate.estimated_rows:.0f} > {self.max_rows:.0f}")
+        if self.max_cost is not None and (estimate.estimated_cost or 0) > self.max_cost:
+            exceeded.append(f"estimated cost {estimate.estimated_cost:.2f} > {self.max_cost:.2f}")
+        if self.max_bytes is not None and (estimate.bytes_scanned or 0) > self.max_bytes:
+            exceeded.append(f"bytes scanned {estimate.bytes_scanned} > {self.max_bytes}")
+        if self.max_full_scans is not None and len(estimate.full_scans) > self.max_full_scans:
+            exceeded.append(f"full table scans of {', '.join(estimate.full_scans)} > {self.max_full_scans}")
+        return estimate.model_copy(update={"exceeded": exceeded})
+
+
+query_cost_budget = QueryCostBudget()
+
+
+def get_explain_statement(sql: str, dialect: DatabaseTypes) -> Optional[str]:
+    """EXPLAIN only plans the statement, nothing is executed."""
+    sql = TRAILING_SEMICOLONS.sub("", sql)
+    if dialect is DatabaseTypes.POSTGRESQL:
+        return f"EXPLAIN (FORMAT JSON) {sql}"
+    if dialect is DatabaseTypes.MYSQL:
+        return f"EXPLAIN FORMAT=JSON {sql}"
+    if dialect is DatabaseTypes.SQLITE:
+        return f"EXPLAIN QUERY PLAN {sql}"
+    return None
+
+
+def parse_plan(sql: str, dialect: DatabaseTypes, rows: Sequence[Sequence[Any]]) -> QueryCostEstimate:
+    estimate = QueryCostEstimate(query=sql, dialect=dialect.value)
+    if dialect is DatabaseTypes.POSTGRESQL:
+        return parse_postgres_plan(estimate, load_plan(rows[0][0]))
+    if dialect is DatabaseTypes.MYSQL:
+        return parse_mysql_plan(estimate, load_plan(rows[0][0]))
+    if dialect is DatabaseTypes.SQLITE:
+        return parse_sqlite_plan(estimate, [row[-1] for row in rows])
+    return estimate
+
+
+def load_plan(plan: Any) -> Any:
+    # psycopg decodes the JSON plan, the MySQL drivers return it as text
+    return json.loads(plan) if isinstance(plan, (str, bytes)) else plan
+
+
+def parse_postgres_plan(estimate: QueryCostEstimate, plan: List[dict]) -> QueryCostEstimate:
+    root = plan[0]["Plan"]
+    rows, full_scans = [], []
+    nodes = [root]
+    while nodes:
+        node = nodes.pop()
+        rows.append(node.get("Plan Rows", 0))
+        if node.get("Node Type") == "Seq Scan":
+            full_scans.append(node.get("Relation Name", ""))
+        nodes.extend(node.get("Plans", []))
+    return estimate.model_copy(update={"estimated_rows": max(rows), "estimated_cost": root.get("Total Cost"),
+                                       "full_scans": full_scans})
+
+
+def parse_mysql_plan(estimate: QueryCostEstimate, plan: dict) -> QueryCostEstimate:
+    rows, full_scans = [], []
+    nodes = [plan]
+    while nodes:
+        node = nodes.pop()
+        if isinstance(node, list):
+            nodes.extend(node)
+            continue
+        if not isinstance(node, dict):
+            continue
+        if "table_name" in node:
+            rows.append(float(node.get("rows_examined_per_scan", 0)))
+            if node.get("access_type") == "ALL":
+                full_scans.append(node["table_name"])
+        nodes.extend(node.values())
+    cost = plan.get("query_block", {}).get("cost_info", {}).get("query_cost")
+    return estimate.model_copy(update={"estimated_rows": max(rows) if rows else None,
+                                       "estimated_cost": float(cost) if cost is not None else None,
+                                       "full_scans": full_scans})
+
+
+def parse_sqlite_plan(estimate: QueryCostEstimate, details: List[str]) -> QueryCostEstimate:
+    # SQLite's plan has neither row counts nor costs, only which tables are scanned rather than searched
+    full_scans = []
+    for detail in details:
+        match = SQLITE_SCAN_PATTERN.match(detail)
+        if match is not None and match.group(1) != "CONSTANT":
+            full_scans.append(match.group(1))
+    return estimate.model_copy(update={"full_scans": full_scans})
@@ -0,0 +1,176 @@
+import asyncio
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from enum import Enum
+from typing import Awaitable, Callable, Dict, Optional, TypeVar
+
+from pydantic import Field
+from sqlalchemy import text
+
+from doorbeen.core.config.execution_env import ExecutionEnv
+from doorbeen.core.types.databases import DatabaseTypes
+from doorbeen.core.types.ts_model import TSModel
+
+T = TypeVar("T")
+
+# query_canceled in Postgres, ER_QUERY_TIMEOUT and ER_QUERY_INTERRUPTED in MySQL
+POSTGRES_CANCELED_SQLSTATE = "57014"
+MYSQL_TIMEOUT_ERRORS = (3024, 1317)
+
+
+class ExecutionLimits(str, Enum):
+    TIMEOUT = "timeout"
+    BYTES_BILLED = "bytes_billed"
+
+
+def parse_dialect_timeouts(value: Optional[str]) -> Dict[str, float]:
+    """Parses timeouts like ``postgresql=30,bigquery=300``."""
+    timeouts = {}
+    for item in (value or "").split(","):
+        dialect, _, seconds = item.partition("=")
+        if dialect.strip() and seconds.strip():
+            timeouts[dialect.strip().lower()] = float(seconds)
+    return timeouts
+
+
+class StatementLimitsConfig(TSModel):
+    timeout_seconds: float = Field(default_factory=lambda: float(ExecutionEnv.get_key('QUERY_STATEMENT_TIMEOUT_SECONDS')
+                                                                 or 60),
+                                   description="Time a statement may run on the database, 0 turns the limit off")
+    dialect_timeouts: Dict[str, float] = Field(
+        default_factory=lambda: parse_dialect_timeouts(ExecutionEnv.get_key('QUERY_DIALECT_TIMEOUTS')),
+        description="Per dialect overrides of timeout_seconds, e.g. postgresql=30,bigquery=300")
+    maximum_bytes_billed: Optional[int] = Field(
+        default_factory=lambda: int(ExecutionEnv.get_key('BIGQUERY_MAXIMUM_BYTES_BILLED') or 0) or None,
+        description="BigQuery jobs that would bill more bytes fail without running")
+    sqlite_progress_steps: int = Field(default_factory=lambda: int(ExecutionEnv.get_key('SQLITE_PROGRESS_STEPS')
+                                                                   or 10000),
+                                       description="SQLite virtual machine steps between two deadline checks")
+    cancel_grace_seconds: float = Field(default_factory=lambda: float(ExecutionEnv.get_key('QUERY_CANCEL_GRACE_SECONDS')
+                                                                      or 5),
+                                        description="Time a cancelled statement gets to stop before its connection is "
+                                                    "dropped")
+
+    def get_timeout(self, dialect: DatabaseTypes) -> float:
+        return self.dialect_timeouts.get(dialect.value, self.timeout_seconds)
+
+
+statement_limits = StatementLimitsConfig()
+
+
+class SQLiteDeadline:
+    """Progress handler that aborts the running SQLite statement once the deadline passes or it is cancelled."""
+
+    def __init__(self, seconds: float):
+        self.deadline = time.monotonic() + seconds
+        self.cancelled = threading.Event()
+
+    def __call__(self) -> int:
+        return 1 if self.cancelled.is_set() or time.monotonic() > self.deadline else 0
+
+
+@contextmanager
+def statement_timeout(conn, dialect: DatabaseTypes, seconds: float):
+    """Applies a server side timeout to the statements run on ``conn`` inside the block."""
+    if seconds <= 0:
+        yield
+        return
+    milliseconds = int(seconds * 1000)
+    if dialect is DatabaseTypes.POSTGRESQL:
+        # Scoped to the transaction, which is rolled back when the connection goes back to the pool
+        conn.execute(text(f"SET LOCAL statement_timeout = {milliseconds}"))
+        yield
+    elif dialect is DatabaseTypes.MYSQL:
+        conn.execute(text(f"SET SESSION max_execution_time = {milliseconds}"))
+        try:
+            yield
+        finally:
+            if not conn.invalidated:
+                conn.execute(text("SET SESSION max_execution_time = DEFAULT"))
+    elif dialect is DatabaseTypes.SQLITE:
+        driver_connection = conn.connection.driver_connection
+        driver_connection.set_progress_handler(SQLiteDeadline(seconds), statement_limits.sqlite_progress_steps)
+        try:
+            yield
+        finally:
+            driver_connection.set_progress_handler(None, 0)
+    else:
+        yield
+
+
+async def arun_statement(conn, dialect: DatabaseTypes, seconds: float, execute: Callable[[], Awaitable[T]]) -> T:
+    """
+    Async counterpart of ``statement_timeout`` that runs ``execute`` with the timeout applied. Cancelling the caller,
+    e.g. when the HTTP client disconnects, stops the statement on the server and drops the connection instead of
+    returning it to the pool. The statement runs in an inner task so it is cancelled before the driver cleans up,
+    which would otherwise wait for the statement to finish.
+    """
+    milliseconds = int(seconds * 1000)
+    driver_connection = (await conn.get_raw_connection()).driver_connection
+    sqlite_deadline = SQLiteDeadline(seconds if seconds > 0 else float("inf"))
+    if dialect is DatabaseTypes.POSTGRESQL and seconds > 0:
+        await conn.execute(text(f"SET LOCAL statement_timeout = {milliseconds}"))
+    elif dialect is DatabaseTypes.MYSQL and seconds > 0:
+        await conn.execute(text(f"SET SESSION max_execution_time = {milliseconds}"))
+    elif dialect is DatabaseTypes.SQLITE:
+        # The handler serves cancellation too, the statement would keep running in the aiosqlite thread otherwise
+        await driver_connection.set_progress_handler(sqlite_deadline, statement_limits.sqlite_progress_steps)
+    statement = asyncio.ensure_future(execute())
+    try:
+        return await asyncio.shield(statement)
+    except asyncio.CancelledError:
+        if not statement.done():
+            await acancel_statement(conn, dialect, driver_connection, sqlite_deadline)
+            await asyncio.wait([statement], timeout=statement_limits.cancel_grace_seconds)
+        if statement.done() and not statement.cancelled():
+            statement.exception()
+        else:
+            statement.cancel()
+        await conn.invalidate()
+        raise
+    finally:
+        if not conn.invalidated:
+            if dialect is DatabaseTypes.MYSQL and seconds > 0:
+                await conn.execute(text("SET SESSION max_execution_time = DEFAULT"))
+            elif dialect is DatabaseTypes.SQLITE:
+                await driver_connection.set_progress_handler(None, 0)
+
+
+async def acancel_statement(conn, dialect: DatabaseTypes, driver_connection, sqlite_deadline: SQLiteDeadline):
+    try:
+        if dialect is DatabaseTypes.POSTGRESQL:
+            await driver_connection.cancel_safe(timeout=statement_limits.cancel_grace_seconds)
+        elif dialect is DatabaseTypes.MYSQL:
+            await akill_mysql_query(conn, driver_connection.thread_id())
+        elif dialect is DatabaseTypes.SQLITE:
+            sqlite_deadline.cancelled.set()
+    except Exception as e:
+        logging.warning(f"Could not cancel the running {dialect.value} statement: {e}")
+
+
+async def akill_mysql_query(conn, thread_id: int):
+    async with conn.engine.connect() as killer:
+        await killer.execute(text(f"KILL QUERY {int(thread_id)}"))
+
+
+def get_exceeded_limit(error: Exception, dialect: DatabaseTypes) -> Optional[ExecutionLimits]:
+    """Tells apart the errors raised because a statement hit one of the limits from the ones of invalid queries."""
+    original = getattr(error, "orig", None) or error
+    if dialect is DatabaseTypes.POSTGRESQL:
+        if getattr(original, "sqlstate", None) == POSTGRES_CANCELED_SQLSTATE:
+            return ExecutionLimits.TIMEOUT
+    elif dialect is DatabaseTypes.MYSQL:
+        if original.args and original.args[0] in MYSQL_TIMEOUT_ERRORS:
+            return ExecutionLimits.TIMEOUT
+    elif dialect is DatabaseTypes.SQLITE:
+        if "interrupted" in str(original).lower():
+            return ExecutionLimits.TIMEOUT
+    elif dialect is DatabaseTypes.BIGQUERY:
+        message = str(original).lower()
+        if "bytes billed" in message or "bytesbilledlimitexceeded" in message:
+            return ExecutionLimits.BYTES_BILLED
+        if "timed out" in message or "timeout" in message:
+            return ExecutionLimits.TIMEOUT
+    return None
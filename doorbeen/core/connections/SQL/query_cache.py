@@ -0,0 +1,151 @@
+import hashlib
+import json
+import pickle
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, List, Optional, Sequence, Tuple
+
+from pydantic import Field, PrivateAttr
+from sqlalchemy.engine.result import result_tuple
+
+from doorbeen.core.config.execution_env import ExecutionEnv
+from doorbeen.core.connections.SQL.checks import is_read_only_sql
+from doorbeen.core.types.databases import DatabaseTypes
+from doorbeen.core.types.execute import ResultCacheStatus
+from doorbeen.core.types.ts_model import TSModel
+
+READ_ONLY_STATEMENT = re.compile(r"^\s*(\(\s*)*(SELECT|WITH|VALUES|SHOW)\b", re.IGNORECASE)
+TRAILING_SEMICOLONS = re.compile(r"[\s;]+$")
+
+
+class QueryResultCacheConfig(TSModel):
+    enabled: bool = Field(default_factory=lambda: ExecutionEnv.get_key('QUERY_CACHE_ENABLED') not in ["False", "false"],
+                          description="Whether results of read only queries are reused")
+    ttl_seconds: float = Field(default_factory=lambda: float(ExecutionEnv.get_key('QUERY_CACHE_TTL_SECONDS') or 300),
+                               description="How long a result is served unless the connection sets its own TTL")
+    max_bytes: int = Field(default_factory=lambda: int(ExecutionEnv.get_key('QUERY_CACHE_MAX_BYTES')
+                                                       or 64 * 1024 * 1024),
+                           description="Size of all cached results together, least recently used ones go first")
+    max_entry_bytes: int = Field(default_factory=lambda: int(ExecutionEnv.get_key('QUERY_CACHE_MAX_ENTRY_BYTES')
+                                                             or 8 * 1024 * 1024),
+                                 description="Results larger than this are never cached")
+
+
+class QueryResultCacheStats(TSModel):
+    hits: int = 0
+    misses: int = 0
+    stores: int = 0
+    evictions: int = 0
+    bypassed: int = 0
+    oversized: int = 0
+    bytes: int = 0
+
+
+class QueryResultCacheEntry(TSModel):
+    value: Any
+    nbytes: int
+    stored_at: float
+    expires_at: float
+
+
+class QueryResultCache(TSModel):
+    """
+    Process-wide cache of query results keyed by connection identity, catalog fingerprint, the whitespace normalized
+    SQL, its parameters and how the result was read. Streamed results are stored as their Arrow IPC bytes and fetched
+    rows as a pickled column list, the entries are evicted least recently used first once ``max_bytes`` is reached.
+    Only read only statements are cached.
+    """
+    config: QueryResultCacheConfig = Field(default_factory=QueryResultCacheConfig)
+    stats: QueryResultCacheStats = Field(default_factory=QueryResultCacheStats)
+    _entries: "OrderedDict[str, QueryResultCacheEntry]" = PrivateAttr(default_factory=OrderedDict)
+    _lock: threading.RLock = PrivateAttr(default_factory=threading.RLock)
+
+    def accepts(self, sql: str, ttl_seconds: float, dialect: Optional[DatabaseTypes] = None) -> bool:
+        accepted = self.config.enabled and ttl_seconds > 0 and self.is_read_only(sql, dialect)
+        if not accepted:
+            self.stats.bypassed += 1
+        return accepted
+
+    @staticmethod
+    def is_read_only(sql: str, dialect: Optional[DatabaseTypes] = None) -> bool:
+        match = READ_ONLY_STATEMENT.match(sql)
+        if match is None:
+            return False
+        if match.group(2).upper() == "SHOW":
+            return True
+        # WITH may wrap INSERT, UPDATE or DELETE in Postgres and SELECT ... INTO creates a table, so the statement
+        # is parsed to tell
+        return is_read_only_sql(sql, dialect)
+
+    @staticmethod
+    def key(identity: str, fingerprint: Optional[str], sql: str, params: Any = None, variant: str = "rows") -> str:
+        payload = json.dumps([variant, normalize_sql(sql), params], sort_keys=True, default=str)
+        return f"{identity}|{fingerprint or ''}|{hashlib.sha256(payload.encode('utf-8')).hexdigest()}"
+
+    def get(self, key: str) -> Optional[Tuple[Any, ResultCacheStatus]]:
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry.expires_at <= now:
+                self._remove(key)
+                self.stats.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.stats.hits += 1
+            status = ResultCacheStatus(hit=True, age_seconds=now - entry.stored_at,
+                                       ttl_seconds=entry.expires_at - entry.stored_at)
+            return entry.value, status
+
+    def put(self, key: str, value: Any, nbytes: int, ttl_seconds: float) -> bool:
+        if nbytes > min(self.config.max_entry_bytes, self.config.max_bytes):
+            self.stats.oversized += 1
+            return False
+        now = time.time()
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = QueryResultCacheEntry(value=value, nbytes=nbytes, stored_at=now,
+                                                       expires_at=now + ttl_seconds)
+            self.stats.bytes += nbytes
+            self.stats.stores += 1
+            while self.stats.bytes > self.config.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.stats.evictions += 1
+        return True
+
+    def get_rows(self, key: str) -> Optional[List[Any]]:
+        cached = self.get(key)
+        return None if cached is None else unpack_rows(cached[0])
+
+    def put_rows(self, key: str, columns: Sequence[str], rows: Sequence[Any], ttl_seconds: float):
+        packed = pack_rows(columns, rows)
+        self.put(key, packed, len(packed), ttl_seconds)
+
+    def invalidate(self, identity: Optional[str] = None):
+        with self._lock:
+            keys = [key for key in self._entries if identity is None or key.startswith(f"{identity}|")]
+            for key in keys:
+                self._remove(key)
+
+    def _remove(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.stats.bytes -= entry.nbytes
+
+
+def normalize_sql(sql: str) -> str:
+    return TRAILING_SEMICOLONS.sub("", " ".join(sql.split()))
+
+
+def pack_rows(columns: Sequence[str], rows: Sequence[Any]) -> bytes:
+    return pickle.dumps((list(columns), list(zip(*rows))), protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def unpack_rows(packed: bytes) -> List[Any]:
+    columns, values = pickle.loads(packed)
+    make_row = result_tuple(columns)
+    return [make_row(row) for row in zip(*values)]
+
+
+query_result_cache = QueryResultCache()
@@ -0,0 +1,168 @@
+from datetime import date, datetime, time
+from decimal import Decimal
+from typing import Any, List, Optional, Sequence
+
+from pydantic import Field, PrivateAttr
+
+from doorbeen.core.config.execution_env import ExecutionEnv
+from doorbeen.core.types.arrow import ArrowBatchBuilder, ArrowResultSet
+from doorbeen.core.types.execute import ColumnAggregate, ResultCacheStatus, ResultStatistics
+from doorbeen.core.types.ts_model import TSModel
+
+NUMERIC_TYPES = (int, float, Decimal)
+ORDERABLE_TYPES = (int, float, Decimal, str, datetime, date, time)
+
+
+class QueryResultLimits(TSModel):
+    sample_rows: int = Field(default_factory=lambda: int(ExecutionEnv.get_key('QUERY_RESULT_SAMPLE_ROWS') or 30),
+                             description="Rows from the head of the result shown to the LLM")
+    max_rows: int = Field(default_factory=lambda: int(ExecutionEnv.get_key('QUERY_RESULT_MAX_ROWS') or 10000),
+                          description="Rows kept in memory and returned to the user")
+    max_bytes: int = Field(default_factory=lambda: int(ExecutionEnv.get_key('QUERY_RESULT_MAX_BYTES')
+                                                       or 8 * 1024 * 1024),
+                           description="Approximate size of the rows kept in memory")
+    max_scanned_rows: int = Field(default_factory=lambda: int(ExecutionEnv.get_key('QUERY_RESULT_MAX_SCANNED_ROWS')
+                                                              or 1000000),
+                                  description="Rows read from the cursor before it is closed early")
+    batch_size: int = Field(default_factory=lambda: int(ExecutionEnv.get_key('QUERY_RESULT_BATCH_SIZE') or 1000),
+                            description="Rows fetched from the server side cursor per round trip")
+    timeout_seconds: Optional[float] = Field(default=None, description="Seconds the statement may run, the "
+                                                                       "connection's or the dialect's timeout applies "
+                                                                       "when unset")
+
+
+class StreamedQueryResult(TSModel):
+    table: ArrowResultSet
+    statistics: ResultStatistics
+    cache: Optional[ResultCacheStatus] = None
+
+
+class _ColumnAccumulator:
+    __slots__ = ("name", "count", "null_count", "min", "max", "sum", "numeric", "orderable")
+
+    def __init__(self, name: str):
+        self.name = name
+        self.count = 0
+        self.null_count = 0
+        self.min = None
+        self.max = None
+        self.sum = 0.0
+        self.numeric = True
+        self.orderable = True
+
+    def add(self, value: Any):
+        if value is None:
+            self.null_count += 1
+            return
+        self.count += 1
+        if self.numeric:
+            if isinstance(value, NUMERIC_TYPES) and not isinstance(value, bool):
+                self.sum += float(value)
+            else:
+                self.numeric = False
+        if self.orderable:
+            if not isinstance(value, ORDERABLE_TYPES):
+                self.orderable = False
+                return
+            try:
+                if self.min is None or value < self.min:
+                    self.min = value
+                if self.max is None or value > self.max:
+                    self.max = value
+            except TypeError:
+                # Mixed value types in one column, e.g. SQLite's dynamic typing
+                self.orderable = False
+
+    def to_aggregate(self) -> ColumnAggregate:
+        aggregate = ColumnAggregate(name=self.name, count=self.count, null_count=self.null_count)
+        if self.orderable:
+            aggregate.min = self.min
+            aggregate.max = self.max
+        if self.numeric and self.count > 0:
+            aggregate.sum = self.sum
+            aggregate.mean = self.sum / self.count
+        return aggregate
+
+
+class ResultStreamCollector(TSModel):
+    """
+    Consumes a result batch by batch. Only the head of the result, bounded by ``max_rows`` and ``max_bytes``, is
+    kept and it is moved into Arrow record batches as each batch is consumed; row count and column aggregates cover
+    every row read. Reading stops once ``max_scanned_rows`` is reached.
+    """
+    limits: QueryResultLimits = Field(default_factory=QueryResultLimits)
+    _columns: List[str] = PrivateAttr(default_factory=list)
+    _accumulators: List[_ColumnAccumulator] = PrivateAttr(default_factory=list)
+    _builder: Optional[ArrowBatchBuilder] = PrivateAttr(default=None)
+    _pending: List[Any] = PrivateAttr(default_factory=list)
+    _retained_rows: int = PrivateAttr(default=0)
+    _row_count: int = PrivateAttr(default=0)
+    _retained_bytes: int = PrivateAttr(default=0)
+    _retaining: bool = PrivateAttr(default=True)
+    _truncation_reason: Optional[str] = PrivateAttr(default=None)
+    _stopped_early: bool = PrivateAttr(default=False)
+
+    @property
+    def stopped_early(self) -> bool:
+        return self._stopped_early
+
+    def start(self, columns: Sequence[str]):
+        self._columns = list(columns)
+        self._accumulators = [_ColumnAccumulator(name) for name in self._columns]
+        self._builder = ArrowBatchBuilder(columns=self._columns)
+
+    def add(self, batch: Sequence[Any]) -> bool:
+        """Adds a batch of rows and returns False once the cursor should be closed."""
+        accumulators = self._accumulators
+        for row in batch:
+            if self._row_count >= self.limits.max_scanned_rows:
+                self._stopped_early = True
+                self._truncation_reason = f"stopped reading after {self.limits.max_scanned_rows} rows"
+                break
+            self._row_count += 1
+            for accumulator, value in zip(accumulators, row):
+                accumulator.add(value)
+            if self._retaining:
+                self._retain(row)
+        self._builder.append(self._pending)
+        self._pending = []
+        return not self._stopped_early
+
+    def finish(self) -> StreamedQueryResult:
+        if self._builder is None:
+            self.start([])
+        statistics = ResultStatistics(columns=self._columns, row_count=self._row_count,
+                                      row_count_exact=not self._stopped_early, retained_rows=self._retained_rows,
+                                      retained_bytes=self._retained_bytes,
+                                      truncated=self._truncation_reason is not None,
+                                      truncation_reason=self._truncation_reason,
+                                      aggregates=[accumulator.to_aggregate() for accumulator in self._accumulators])
+        return StreamedQueryResult(table=self._builder.build(), statistics=statistics)
+
+    def _retain(self, row: Any):
+        if self._retained_rows >= self.limits.max_rows:
+            self._stop_retaining(f"kept the first {self.limits.max_rows} rows")
+            return
+        row_bytes = estimate_row_bytes(row)
+        if self._retained_bytes + row_bytes > self.limits.max_bytes:
+            self._stop_retaining(f"kept the first {self.limits.max_bytes} bytes")
+            return
+        self._pending.append(row)
+        self._retained_rows += 1
+        self._retained_bytes += row_bytes
+
+    def _stop_retaining(self, reason: str):
+        self._retaining = False
+        self._truncation_reason = reason
+
+
+def estimate_row_bytes(row: Sequence[Any]) -> int:
+    size = 0
+    for value in row:
+        if value is None:
+            continue
+        if isinstance(value, (str, bytes)):
+            size += len(value)
+        else:
+            size += 8
+    return size
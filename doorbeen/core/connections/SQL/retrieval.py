@@ -0,0 +1,246 @@
+import asyncio
+import hashlib
+import logging
+import math
+import os
+import re
+import tempfile
+import threading
+from collections import Counter, OrderedDict
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional
+
+from pydantic import Field, PrivateAttr
+
+from doorbeen.core.config.execution_env import ExecutionEnv
+from doorbeen.core.types.sql_schema import DatabaseSchema
+from doorbeen.core.types.ts_model import TSModel
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+CAMEL_CASE_PATTERN = re.compile(r"([a-z0-9])([A-Z])")
+STOPWORDS = frozenset({
+    "a", "an", "the", "of", "for", "in", "on", "at", "by", "to", "and", "or", "with", "from", "is", "are", "was",
+    "were", "be", "been", "it", "its", "this", "that", "these", "those", "what", "which", "who", "whom", "how", "many",
+    "much", "show", "me", "give", "list", "find", "get", "tell", "do", "does", "did", "my", "our", "their", "each",
+    "per", "all", "any", "there", "have", "has", "had", "i", "we", "you", "please", "can", "could", "would",
+})
+# Table names weigh more than column names, sampled values the least
+TABLE_NAME_WEIGHT = 3
+COLUMN_NAME_WEIGHT = 1
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+
+class TableSelectionConfig(TSModel):
+    top_k: int = Field(default_factory=lambda: int(ExecutionEnv.get_key('TABLE_SELECTION_TOP_K') or 5),
+                       description="Tables picked by relevance to the question")
+    max_tables: int = Field(default_factory=lambda: int(ExecutionEnv.get_key('TABLE_SELECTION_MAX_TABLES') or 8),
+                            description="Upper bound after adding the tables joined to the picked ones")
+    min_schema_tables: int = Field(default_factory=lambda: int(ExecutionEnv.get_key('TABLE_SELECTION_MIN_TABLES')
+                                                               or 8),
+                                   description="Schemas with at most this many tables are never narrowed")
+    sample_rows: int = Field(default_factory=lambda: int(ExecutionEnv.get_key('TABLE_INDEX_SAMPLE_ROWS') or 3),
+                             description="Rows per table whose values are indexed, 0 disables value sampling")
+
+
+class SchemaIndexStoreConfig(TSModel):
+    directory: Optional[str] = Field(default_factory=lambda: ExecutionEnv.get_key('SCHEMA_INDEX_DIR')
+                                     or os.path.join(tempfile.gettempdir(), "doorbeen", "schema_indexes"),
+                                     description="Where built indexes are persisted, one file per fingerprint")
+    max_entries: int = Field(default_factory=lambda: int(ExecutionEnv.get_key('SCHEMA_INDEX_MAX_ENTRIES') or 64),
+                             description="Indexes kept in memory")
+
+
+def tokenize(text: str) -> List[str]:
+    text = CAMEL_CASE_PATTERN.sub(r"\1 \2", text)
+    return [normalize_term(term) for term in TOKEN_PATTERN.findall(text.lower()) if term not in STOPWORDS]
+
+
+def normalize_term(term: str) -> str:
+    # Light plural folding so "customers" matches a "customer" table
+    if len(term) > 4 and term.endswith("ies"):
+        return term[:-3] + "y"
+    if len(term) > 4 and term.endswith(("ses", "xes", "ches", "shes")):
+        return term[:-2]
+    if len(term) > 3 and term.endswith("s") and not term.endswith("ss"):
+        return term[:-1]
+    return term
+
+
+class SchemaIndex(TSModel):
+    """
+    BM25 index with one document per table made of its name, column names, comments and sampled values, plus the
+    foreign key graph used to pull in the tables needed to join the best matches.
+    """
+    fingerprint: str
+    tables: List[str] = []
+    term_frequencies: Dict[str, Dict[str, int]] = {}
+    document_lengths: Dict[str, int] = {}
+    document_frequencies: Dict[str, int] = {}
+    neighbours: Dict[str, List[str]] = {}
+
+    @classmethod
+    def build(cls, fingerprint: str, schema: DatabaseSchema,
+              samples: Optional[Dict[str, Iterable[str]]] = None) -> "SchemaIndex":
+        samples = samples or {}
+        term_frequencies = {}
+        neighbours: Dict[str, set] = {table.name: set() for table in schema.tables}
+        for table in schema.tables:
+            terms = Counter()
+            for term in tokenize(table.name):
+                terms[term] += TABLE_NAME_WEIGHT
+            for column in table.columns:
+                for term in tokenize(column.name):
+                    terms[term] += COLUMN_NAME_WEIGHT
+                if column.comment:
+                    terms.update(tokenize(column.comment))
+            if table.comment:
+                terms.update(tokenize(table.comment))
+            for value in samples.get(table.name, []):
+                terms.update(tokenize(value))
+            term_frequencies[table.name] = dict(terms)
+            for foreign_key in table.foreign_keys:
+                for relation in foreign_key.relations:
+                    if relation.referenced_table in neighbours and relation.referenced_table != table.name:
+                        neighbours[table.name].add(relation.referenced_table)
+                        neighbours[relation.referenced_table].add(table.name)
+        document_frequencies = Counter()
+        for terms in term_frequencies.values():
+            document_frequencies.update(terms.keys())
+        return cls(fingerprint=fingerprint, tables=[table.name for table in schema.tables],
+                   term_frequencies=term_frequencies,
+                   document_lengths={name: sum(terms.values()) for name, terms in term_frequencies.items()},
+                   document_frequencies=dict(document_frequencies),
+                   neighbours={name: sorted(linked) for name, linked in neighbours.items()})
+
+    def score(self, question: str) -> Dict[str, float]:
+        terms = set(tokenize(question))
+        if not self.tables or not terms:
+            return {}
+        average_length = sum(self.document_lengths.values()) / len(self.tables) or 1
+        table_count = len(self.tables)
+        scores = {}
+        for table in self.tables:
+            frequencies = self.term_frequencies.get(table, {})
+            length_norm = BM25_K1 * (1 - BM25_B + BM25_B * self.document_lengths.get(table, 0) / average_length)
+            score = 0.0
+            for term in terms:
+                frequency = frequencies.get(term, 0)
+                if frequency == 0:
+                    continue
+                document_frequency = self.document_frequencies.get(term, 0)
+                idf = math.log(1 + (table_count - document_frequency + 0.5) / (document_frequency + 0.5))
+                score += idf * frequency * (BM25_K1 + 1) / (frequency + length_norm)
+            if score > 0:
+                scores[table] = score
+        return scores
+
+    def select(self, question: str, config: Optional[TableSelectionConfig] = None,
+               keep: Optional[Iterable[str]] = None) -> List[str]:
+        """
+        Returns the ``top_k`` tables most relevant to ``question`` followed by the tables joined to them, preferring
+        those linked to more of the picked tables. ``keep`` are tables that stay selected, e.g. the ones of the
+        previous question in a follow up. All tables are returned when the schema is small or nothing matches.
+        """
+        config = config or TableSelectionConfig()
+        if len(self.tables) <= config.min_schema_tables:
+            return list(self.tables)
+        scores = self.score(question)
+        if not scores:
+            return list(self.tables)
+        ranked = sorted(scores, key=lambda table: (-scores[table], table))[:config.top_k]
+        keep = [table for table in keep or [] if table in self.neighbours]
+        # A previous selection that wasn't narrowed carries no signal
+        if len(keep) >= len(self.tables):
+            keep = []
+        selected = list(dict.fromkeys(keep + ranked))
+        links = Counter(neighbour for table in selected for neighbour in self.neighbours.get(table, [])
+                        if neighbour not in selected)
+        for neighbour in sorted(links, key=lambda table: (-links[table], -scores.get(table, 0.0), table)):
+            if len(selected) >= config.max_tables:
+                break
+            selected.append(neighbour)
+        return selected
+
+
+class SchemaIndexStore(TSModel):
+    """
+    Keeps built schema indexes in memory and on disk keyed by the fingerprint of the reflected schema, an index is
+    only rebuilt when the schema changes.
+    """
+    config: SchemaIndexStoreConfig = Field(default_factory=SchemaIndexStoreConfig)
+    _entries: "OrderedDict[str, SchemaIndex]" = PrivateAttr(default_factory=OrderedDict)
+    _lock: threading.RLock = PrivateAttr(default_factory=threading.RLock)
+    _async_key_locks: Dict[str, asyncio.Lock] = PrivateAttr(default_factory=dict)
+
+    @staticmethod
+    def fingerprint(identity: str, schema: DatabaseSchema) -> str:
+        return hashlib.sha256(f"{identity}|{schema.get_fingerprint()}".encode("utf-8")).hexdigest()
+
+    async def aget_or_build(self, identity: str, schema: DatabaseSchema,
+                            samples: Optional[Callable[[List[str]], Awaitable[Dict[str, List[str]]]]] = None
+                            ) -> SchemaIndex:
+        fingerprint = self.fingerprint(identity, schema)
+        index = self._get(fingerprint)
+        if index is not None:
+            return index
+        # The lock lives as long as the fingerprint's index is cached, so concurrent callers always share one
+        with self._lock:
+            key_lock = self._async_key_locks.setdefault(fingerprint, asyncio.Lock())
+        async with key_lock:
+            index = self._get(fingerprint)
+            if index is None:
+                index = await asyncio.to_thread(self._load, fingerprint)
+            if index is None:
+                sampled = await samples([table.name for table in schema.tables]) if samples is not None else None
+                index = SchemaIndex.build(fingerprint, schema, samples=sampled)
+                await asyncio.to_thread(self._save, index)
+            self._put(index)
+        return index
+
+    def _get(self, fingerprint: str) -> Optional[SchemaIndex]:
+        with self._lock:
+            index = self._entries.get(fingerprint)
+            if index is not None:
+                self._entries.move_to_end(fingerprint)
+            return index
+
+    def _put(self, index: SchemaIndex):
+        with self._lock:
+            self._entries[index.fingerprint] = index
+            self._entries.move_to_end(index.fingerprint)
+            while len(self._entries) > self.config.max_entries:
+                evicted_fingerprint, _ = self._entries.popitem(last=False)
+                self._async_key_locks.pop(evicted_fingerprint, None)
+
+    def _path(self, fingerprint: str) -> Optional[str]:
+        if not self.config.directory:
+            return None
+        return os.path.join(self.config.directory, f"{fingerprint}.json")
+
+    def _load(self, fingerprint: str) -> Optional[SchemaIndex]:
+        path = self._path(fingerprint)
+        if path is None or not os.path.exists(path):
+            return None
+        try:
+            with open(path, "r", encoding="utf-8") as file:
+                return SchemaIndex.model_validate_json(file.read())
+        except (OSError, ValueError) as e:
+            logging.warning(f"Ignoring unreadable schema index {path}: {e}")
+            return None
+
+    def _save(self, index: SchemaIndex):
+        path = self._path(index.fingerprint)
+        if path is None:
+            return
+        try:
+            os.makedirs(self.config.directory, exist_ok=True)
+            # Written to a temporary file first so a concurrent reader never sees a partial index
+            temporary_path = f"{path}.{os.getpid()}.tmp"
+            with open(temporary_path, "w", encoding="utf-8") as file:
+                file.write(index.model_dump_json())
+            os.replace(temporary_path, path)
+        except OSError as e:
+            logging.warning(f"Could not persist the schema index to {path}: {e}")
+
+
+schema_indexes = SchemaIndexStore()
@@ -0,0 +1,226 @@
+import asyncio
+import logging
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, List, Optional, Sequence
+
+from pydantic import Field, PrivateAttr
+from sqlalchemy.exc import DatabaseError
+
+from doorbeen.core.config.execution_env import ExecutionEnv
+from doorbeen.core.exceptions.SQLClients import CSQLInvalidQuery
+from doorbeen.core.types.databases import DatabaseTypes
+from doorbeen.core.types.sql_schema import DatabaseSchema, TableSchema
+from doorbeen.core.types.ts_model import TSModel
+
+BINARY_TYPE_MARKERS = ("BLOB", "BYTEA", "BINARY", "BYTES", "IMAGE", "RAW")
+WIDE_TYPE_MARKERS = ("JSON", "TEXT", "CLOB", "XML", "ARRAY", "STRUCT", "RECORD", "[]")
+TEXT_CAST_TYPES = {
+    DatabaseTypes.MYSQL: "CHAR",
+    DatabaseTypes.BIGQUERY: "STRING",
+}
+
+
+class SampleCacheConfig(TSModel):
+    ttl_seconds: float = Field(default_factory=lambda: float(ExecutionEnv.get_key('SAMPLE_CACHE_TTL_SECONDS') or 900),
+                               description="How long sampled rows of a table are reused")
+    max_entries: int = Field(default_factory=lambda: int(ExecutionEnv.get_key('SAMPLE_CACHE_MAX_ENTRIES') or 4096),
+                             description="Tables whose sampled rows are kept in memory")
+    max_value_chars: int = Field(default_factory=lambda: int(ExecutionEnv.get_key('SAMPLE_VALUE_MAX_CHARS') or 120),
+                                 description="Characters kept of each sampled value")
+    concurrency: int = Field(default_factory=lambda: int(ExecutionEnv.get_key('SAMPLE_FETCH_CONCURRENCY') or 4),
+                             description="Tables sampled at the same time when the cache is cold")
+    tablesample_percent: float = Field(default_factory=lambda: float(ExecutionEnv.get_key('SAMPLE_TABLESAMPLE_PERCENT')
+                                                                     or 1),
+                                       description="Percent of storage blocks read by TABLESAMPLE where supported")
+
+
+class SampleCacheEntry(TSModel):
+    rows: List[Any]
+    expires_at: float
+
+
+class SampleCacheStats(TSModel):
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+
+
+class SampleRowCache(TSModel):
+    """
+    Process-wide cache of sampled table rows keyed by connection identity, schema fingerprint, table and row count,
+    so a schema change never serves rows of the old table definition.
+    """
+    config: SampleCacheConfig = Field(default_factory=SampleCacheConfig)
+    stats: SampleCacheStats = Field(default_factory=SampleCacheStats)
+    _entries: "OrderedDict[str, SampleCacheEntry]" = PrivateAttr(default_factory=OrderedDict)
+    _lock: threading.RLock = PrivateAttr(default_factory=threading.RLock)
+
+    @staticmethod
+    def key(identity: str, fingerprint: str, table: str, count: int) -> str:
+        return f"{identity}|{fingerprint}|{table}|{count}"
+
+    def get(self, key: str) -> Optional[List[Any]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry.expires_at <= time.monotonic():
+                self._entries.pop(key, None)
+                self.stats.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.stats.hits += 1
+            return entry.rows
+
+    def put(self, key: str, rows: List[Any]):
+        with self._lock:
+            self._entries[key] = SampleCacheEntry(rows=rows, expires_at=time.monotonic() + self.config.ttl_seconds)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.config.max_entries:
+                self._entries.popitem(last=False)
+                self.stats.evictions += 1
+
+    def invalidate(self, identity: Optional[str] = None):
+        with self._lock:
+            if identity is None:
+                self._entries.clear()
+                return
+            for key in [key for key in self._entries if key.startswith(f"{identity}|")]:
+                del self._entries[key]
+
+
+class TableSampler(TSModel):
+    """
+    Samples rows of the given tables for prompts. Cached tables are served from ``sample_cache`` and the cold ones are
+    fetched concurrently, each on its own pooled connection.
+    """
+    identity: str
+    database_schema: DatabaseSchema
+    dialect: DatabaseTypes
+    quote: Callable[[str], str]
+    cache: SampleRowCache = Field(default_factory=lambda: sample_cache)
+
+    def sample(self, tables: List[str], count: int, run_query: Callable[[str], List[Any]]) -> List[List[tuple]]:
+        samples, cold = self._from_cache(tables, count)
+        if cold:
+            workers = max(min(self.cache.config.concurrency, len(cold)), 1)
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                fetched = executor.map(lambda table: self._fetch(table, count, run_query), cold)
+                samples.update(zip(cold, fetched))
+        return [samples[table] for table in tables]
+
+    async def asample(self, tables: List[str], count: int,
+                      run_query: Callable[[str], Awaitable[List[Any]]]) -> List[List[tuple]]:
+        samples, cold = self._from_cache(tables, count)
+        if cold:
+            semaphore = asyncio.Semaphore(max(self.cache.config.concurrency, 1))
+
+            async def fetch(table: str) -> List[tuple]:
+                async with semaphore:
+                    return await self._afetch(table, count, run_query)
+
+            samples.update(zip(cold, await asyncio.gather(*[fetch(table) for table in cold])))
+        return [samples[table] for table in tables]
+
+    def _from_cache(self, tables: List[str], count: int):
+        samples = {}
+        for table in dict.fromkeys(tables):
+            rows = self.cache.get(self._key(table, count))
+            if rows is not None:
+                samples[table] = rows
+        return samples, [table for table in dict.fromkeys(tables) if table not in samples]
+
+    def _fetch(self, table: str, count: int, run_query: Callable[[str], List[Any]]) -> List[tuple]:
+        best = []
+        for query in self._queries(table, count):
+            try:
+                rows = run_query(query)
+            except (CSQLInvalidQuery, DatabaseError) as e:
+                logging.debug(f"Sampling query failed for {table}: {e}")
+                continue
+            best = rows if len(rows) > len(best) else best
+            if len(best) >= count:
+                break
+        return self._store(table, count, best)
+
+    async def _afetch(self, table: str, count: int, run_query: Callable[[str], Awaitable[List[Any]]]) -> List[tuple]:
+        best = []
+        for query in self._queries(table, count):
+            try:
+                rows = await run_query(query)
+            except (CSQLInvalidQuery, DatabaseError) as e:
+                logging.debug(f"Sampling query failed for {table}: {e}")
+                continue
+            best = rows if len(rows) > len(best) else best
+            if len(best) >= count:
+                break
+        return self._store(table, count, best)
+
+    def _queries(self, table: str, count: int) -> List[str]:
+        return build_sample_queries(self.dialect, self.quote, table, self.database_schema.get_table(table), count,
+                                    self.cache.config)
+
+    def _store(self, table: str, count: int, rows: List[Any]) -> List[tuple]:
+        # Tables that could not be sampled are cached empty too, so they aren't retried on every prompt
+        trimmed = [trim_row(row, self.cache.config.max_value_chars) for row in rows[:count]]
+        self.cache.put(self._key(table, count), trimmed)
+        return trimmed
+
+    def _key(self, table: str, count: int) -> str:
+        return self.cache.key(self.identity, self.database_schema.get_fingerprint(), table, count)
+
+
+def build_sample_queries(dialect: DatabaseTypes, quote, table_name: str, table: Optional[TableSchema], count: int,
+                         config: SampleCacheConfig) -> List[str]:
+    """
+    Returns the queries to sample ``count`` rows of a table, cheapest first. Wide text and JSON columns are cut down
+    server side and binary columns are left out so they never travel to the prompt. The later queries are fallbacks
+    for when block sampling returns too few rows, e.g. on small tables.
+    """
+    quoted_table = quote(table_name)
+    projection = "*"
+    order_by = ""
+    if table is not None and table.columns:
+        projection = ", ".join(project_column(dialect, quote(column.name), column.type, config.max_value_chars)
+                               for column in table.columns)
+        if table.primary_keys:
+            order_by = " ORDER BY " + ", ".join(quote(key) for key in table.primary_keys)
+    limited = f"SELECT {projection} FROM {quoted_table}{order_by} LIMIT {count}"
+    if dialect is DatabaseTypes.POSTGRESQL:
+        sampled = (f"SELECT {projection} FROM {quoted_table} TABLESAMPLE SYSTEM ({config.tablesample_percent}) "
+                   f"LIMIT {count}")
+        return [sampled, limited]
+    if dialect is DatabaseTypes.BIGQUERY:
+        # A plain LIMIT is billed for the whole table on BigQuery, TABLESAMPLE only for the blocks it reads
+        sampled = (f"SELECT {projection} FROM {quoted_table} TABLESAMPLE SYSTEM ({config.tablesample_percent} PERCENT) "
+                   f"LIMIT {count}")
+        return [sampled, f"SELECT {projection} FROM {quoted_table} LIMIT {count}"]
+    return [limited]
+
+
+def project_column(dialect: DatabaseTypes, quoted_column: str, column_type: str, max_chars: int) -> str:
+    upper_type = column_type.upper()
+    if any(marker in upper_type for marker in BINARY_TYPE_MARKERS):
+        return f"NULL AS {quoted_column}"
+    if not any(marker in upper_type for marker in WIDE_TYPE_MARKERS):
+        return quoted_column
+    if dialect is DatabaseTypes.BIGQUERY and "STRING" not in upper_type:
+        text_value = f"TO_JSON_STRING({quoted_column})"
+    else:
+        text_value = f"CAST({quoted_column} AS {TEXT_CAST_TYPES.get(dialect, 'TEXT')})"
+    return f"SUBSTR({text_value}, 1, {max_chars}) AS {quoted_column}"
+
+
+def trim_row(row: Sequence[Any], max_chars: int) -> tuple:
+    trimmed = []
+    for value in row:
+        if isinstance(value, str) and len(value) > max_chars:
+            value = value[:max_chars] + "..."
+        elif isinstance(value, (bytes, bytearray, memoryview)):
+            value = f"<{len(value)} bytes>"
+        trimmed.append(value)
+    return tuple(trimmed)
+
+
+sample_cache = SampleRowCache()
@@ -0,0 +1,241 @@
+import logging
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import inspect, text
+from sqlalchemy.exc import DatabaseError
+
+from doorbeen.core.connections.SQL.Schema import get_sql_schema
+from doorbeen.core.connections.SQL.cache import schema_cache, hash_catalog_rows
+from doorbeen.core.connections.SQL.estimates import get_explain_statement, parse_plan
+from doorbeen.core.connections.SQL.limits import arun_statement
+from doorbeen.core.connections.SQL.query_cache import query_result_cache
+from doorbeen.core.connections.SQL.results import QueryResultLimits, ResultStreamCollector, StreamedQueryResult
+from doorbeen.core.connections.SQL.retrieval import SchemaIndex, schema_indexes
+from doorbeen.core.connections.clients.SQL.common import CommonSQLClient
+from doorbeen.core.connections.clients.engines import engine_registry
+from doorbeen.core.exceptions.SQLClients import CSQLInvalidQuery
+from doorbeen.core.types.databases import DatabaseTypes
+from doorbeen.core.types.execute import QueryCostEstimate
+from doorbeen.core.types.sql_schema import DatabaseSchema
+
+
+class AsyncCommonSQLClient(CommonSQLClient):
+    """
+    CommonSQLClient with a non-blocking execution path built on SQLAlchemy's asyncio engine. The synchronous methods
+    are still available and share the same schema cache.
+    """
+    async_engine: Any = None
+
+    def get_async_uri(self) -> str:
+        dialect = self.credentials.dialect
+        creds = self.credentials
+        if dialect is DatabaseTypes.POSTGRESQL:
+            # psycopg 3 picks its asyncio implementation when used through create_async_engine
+            dialect_str = "postgresql+psycopg"
+        elif dialect is DatabaseTypes.MYSQL:
+            dialect_str = "mysql+aiomysql"
+        elif dialect is DatabaseTypes.ORACLE:
+            # python-oracledb has a native asyncio mode, create_async_engine selects it for this dialect
+            dialect_str = "oracle+oracledb"
+        elif dialect is DatabaseTypes.SQLITE:
+            return f"sqlite+aiosqlite:///{creds.database}"
+        else:
+            raise ValueError(f"No async driver configured for {dialect.value}")
+        return f"{dialect_str}://{creds.username}:{creds.password}@{creds.host}:{creds.port}/{creds.database}"
+
+    def get_async_engine(self):
+        if self.async_engine is None:
+            self.async_engine = engine_registry.get_async_engine(self.get_async_uri())
+        return self.async_engine
+
+    async def aconnect(self, verify: bool = False):
+        engine = self.get_async_engine()
+        if verify:
+            async with engine.connect():
+                pass
+        return self
+
+    async def aquery(self, sql, params=None, use_cache: bool = True, timeout_seconds: Optional[float] = None):
+        key = self.get_result_cache_key(sql, params) if use_cache else None
+        cached = query_result_cache.get_rows(key) if key is not None else None
+        if cached is not None:
+            return cached
+        dialect = self.credentials.dialect
+        timeout_seconds = self.get_statement_timeout(timeout_seconds)
+        try:
+            async with self.get_async_engine().connect() as conn:
+                fetched_results, columns = await arun_statement(conn, dialect, timeout_seconds,
+                                                                lambda: self._afetch(conn, sql, params))
+        except DatabaseError as e:
+            raise self.get_query_error(e, timeout_seconds)
+        if key is not None:
+            query_result_cache.put_rows(key, columns, fetched_results, self.get_result_cache_ttl())
+        return fetched_results
+
+    async def astream_query(self, sql, params=None, limits: Optional[QueryResultLimits] = None,
+                            use_cache: bool = True) -> StreamedQueryResult:
+        collector = ResultStreamCollector(limits=limits or QueryResultLimits())
+        key = self.get_result_cache_key(sql, params, limits=collector.limits) if use_cache else None
+        cached = self.get_cached_stream(key)
+        if cached is not None:
+            return cached
+        dialect = self.credentials.dialect
+        timeout_seconds = self.get_statement_timeout(collector.limits.timeout_seconds)
+        try:
+            async with self.get_async_engine().connect() as conn:
+                await arun_statement(conn, dialect, timeout_seconds,
+                                     lambda: self._astream(conn, sql, params, collector))
+        except DatabaseError as e:
+            raise self.get_query_error(e, timeout_seconds)
+        return self.cache_stream(key, collector.finish())
+
+    async def aestimate_query(self, sql, params=None) -> QueryCostEstimate:
+        dialect = self.credentials.dialect
+        statement = get_explain_statement(sql, dialect)
+        if statement is None:
+            return QueryCostEstimate(query=sql, dialect=dialect.value, error="Estimates are not supported")
+        try:
+            async with self.get_async_engine().connect() as conn:
+                rows = (await conn.execute(text(statement), params)).fetchall()
+        except DatabaseError as e:
+            raise CSQLInvalidQuery(e)
+        return parse_plan(sql, dialect, rows)
+
+    @staticmethod
+    async def _afetch(conn, sql, params=None):
+        result = await conn.execute(text(sql), params)
+        fetched_results = result.fetchall()
+        columns = list(result.keys())
+        result.close()
+        return fetched_results, columns
+
+    async def _astream(self, conn, sql, params, collector: ResultStreamCollector):
+        result = await conn.stream(text(sql), params, execution_options={"yield_per": collector.limits.batch_size})
+        collector.start(result.keys())
+        async for batch in result.partitions():
+            if not collector.add(batch):
+                break
+        if collector.stopped_early and self.credentials.dialect is DatabaseTypes.MYSQL:
+            await conn.invalidate()
+        else:
+            await result.close()
+
+    async def aget_schema(self, refresh: bool = False) -> DatabaseSchema:
+        identity = self.get_identity()
+        if refresh:
+            schema_cache.invalidate(identity)
+            query_result_cache.invalidate(identity)
+        schema = await schema_cache.aget_or_reflect(identity, reflect=self._areflect,
+                                                    fingerprint=self.aget_catalog_fingerprint)
+        return schema
+
+    async def aget_schema_index(self, sample_rows: int = 0) -> SchemaIndex:
+        """
+        Returns the table retrieval index of the current schema, built on first use and whenever the schema changes.
+        Text values of ``sample_rows`` rows per table are indexed along with the names.
+        """
+        schema = await self.aget_schema()
+
+        async def sample_values(tables: List[str]) -> Dict[str, List[str]]:
+            examples = await self.aget_examples(tables, count=sample_rows)
+            return {table: [value for row in rows for value in row if isinstance(value, str)]
+                    for table, rows in zip(tables, examples)}
+
+        return await schema_indexes.aget_or_build(self.get_identity(), schema,
+                                                  samples=sample_values if sample_rows > 0 else None)
+
+    async def aget_catalog_fingerprint(self) -> Optional[str]:
+        catalog_query = self.get_catalog_query()
+        if catalog_query is None:
+            return None
+        try:
+            async with self.get_async_engine().connect() as conn:
+                result = await conn.execute(text(catalog_query))
+                rows = result.fetchall()
+        except DatabaseError as e:
+            logging.warning(f"Could not compute the catalog fingerprint: {e}")
+            return None
+        return hash_catalog_rows(rows)
+
+    async def aget_table_names(self, schema_name: str = "public") -> List[str]:
+        async with self.get_async_engine().connect() as conn:
+            return await conn.run_sync(lambda sync_conn: inspect(sync_conn).get_table_names(schema=schema_name))
+
+    async def aget_examples(self, tables: List[str], schema_name: str = "public",
+                            count: int = 5) -> List[List[tuple]]:
+        sampler = self.get_table_sampler(schema=await self.aget_schema())
+        # Sampled rows have their own cache, sample_cache
+        return await sampler.asample(tables, count, run_query=lambda sql: self.aquery(sql, use_cache=False))
+
+    async def _areflect(self) -> DatabaseSchema:
+        async with self.get_async_engine().connect() as conn:
+            return await conn.run_sync(get_sql_schema)
+
+
+if __name__ == '__main__':
+    # Benchmark: concurrent "requests" each running one query that waits server side (simulated with a sleep() SQL
+    # function) while a ticker measures event loop stalls. The blocking path serialises every request on the loop
+    # thread, the async path overlaps them.
+    import asyncio
+    import os
+    import sqlite3
+    import tempfile
+    import time
+
+    from sqlalchemy import event
+
+    from doorbeen.core.connections.credentials.SQL.common import CommonSQLCredentials
+
+    CONCURRENT_REQUESTS = 16
+    QUERY_SECONDS = 0.25
+    SLOW_QUERY = f"SELECT sleep({QUERY_SECONDS})"
+
+    db_path = os.path.join(tempfile.mkdtemp(), "bench.db")
+    sqlite3.connect(db_path).close()
+    credentials = CommonSQLCredentials(host="", port=0, username="", password="", database=db_path,
+                                       dialect=DatabaseTypes.SQLITE)
+
+    class BenchmarkClient(AsyncCommonSQLClient):
+        def get_uri(self):
+            return f"sqlite:///{db_path}"
+
+    def register_sleep(dbapi_connection, _):
+        dbapi_connection.create_function("sleep", 1, time.sleep)
+
+    async def measure(label: str, run_request):
+        max_lag = 0.0
+        done = asyncio.Event()
+
+        async def ticker():
+            nonlocal max_lag
+            while not done.is_set():
+                tick = time.perf_counter()
+                await asyncio.sleep(0.01)
+                max_lag = max(max_lag, time.perf_counter() - tick - 0.01)
+
+        ticker_task = asyncio.create_task(ticker())
+        started = time.perf_counter()
+        await asyncio.gather(*[run_request() for _ in range(CONCURRENT_REQUESTS)])
+        elapsed = time.perf_counter() - started
+        done.set()
+        await ticker_task
+        print(f"{label:>9}: {CONCURRENT_REQUESTS} requests in {elapsed:.2f}s "
+              f"({CONCURRENT_REQUESTS / elapsed:.2f} req/s), max event loop stall {max_lag * 1000:.0f}ms")
+
+    async def main():
+        client = BenchmarkClient(credentials=credentials).connect()
+        await client.aconnect()
+        event.listen(client.get_engine(), "connect", register_sleep)
+        event.listen(client.get_async_engine().sync_engine, "connect", register_sleep)
+
+        async def blocking_request():
+            client.query(SLOW_QUERY, use_cache=False)
+
+        async def async_request():
+            await client.aquery(SLOW_QUERY, use_cache=False)
+
+        await measure("blocking", blocking_request)
+        await measure("async", async_request)
+        await engine_registry.adispose()
+
+    asyncio.run(main())
@@ -1,33 +1,109 @@
-from typing import Any
+from typing import Any, List, Optional
 
-from sqlalchemy import create_engine, inspect, text
+from pydantic import Field
+from sqlalchemy import inspect, text
+from sqlalchemy.engine.result import result_tuple
 
 from doorbeen.core.connections.SQL.Schema import get_sql_schema
+from doorbeen.core.connections.SQL.cache import schema_cache
+from doorbeen.core.connections.SQL.limits import ExecutionLimits, get_exceeded_limit, statement_limits
+from doorbeen.core.connections.SQL.results import QueryResultLimits, ResultStreamCollector, StreamedQueryResult
+from doorbeen.core.connections.SQL.samples import TableSampler
 from doorbeen.core.connections.clients.base import DatabaseClient
+from doorbeen.core.connections.clients.engines import engine_registry
 from doorbeen.core.connections.credentials.SQL.bigquery import BigQueryCredentials
+from doorbeen.core.exceptions.SQLClients import CSQLExecutionLimitExceeded
+from doorbeen.core.types.databases import DatabaseTypes
+from doorbeen.core.types.execute import QueryCostEstimate
 
 
 class BigQueryClient(DatabaseClient):
     credentials: BigQueryCredentials
     engine: Any = None
+    statement_timeout: Optional[float] = Field(default=None, description="Seconds a job may run, overrides the "
+                                                                         "dialect's timeout")
+    maximum_bytes_billed: Optional[int] = Field(default=None, description="Jobs that would bill more bytes fail "
+                                                                          "without running")
 
-    def query(self, sql, params=None):
-        if self.client is None:
-            self.get_connection()
-        conn = self.client
-
-        if params is None:
-            result = conn.execute(text(sql))
-        else:
-            result = conn.execute(text(sql), **params)
-        fetched_results = result.fetchall()
-        result.close()
+    def query(self, sql, params=None, timeout_seconds: Optional[float] = None):
+        with self.get_engine().connect() as conn:
+            cursor = self._execute(conn, sql, params, timeout_seconds)
+            make_row = result_tuple([column[0] for column in cursor.description or []])
+            fetched_results = [make_row(row) for row in cursor.fetchall()]
+            cursor.close()
         return fetched_results
 
-    def get_schema(self):
-        schema = get_sql_schema(self.get_uri())
+    def stream_query(self, sql, params=None, limits: Optional[QueryResultLimits] = None) -> StreamedQueryResult:
+        collector = ResultStreamCollector(limits=limits or QueryResultLimits())
+        with self.get_engine().connect() as conn:
+            cursor = self._execute(conn, sql, params, collector.limits.timeout_seconds)
+            collector.start([column[0] for column in cursor.description or []])
+            # The BigQuery DB-API cursor pages through the result, closing it early skips the remaining pages
+            while batch := cursor.fetchmany(collector.limits.batch_size):
+                if not collector.add(batch):
+                    break
+            cursor.close()
+        return collector.finish()
+
+    def _execute(self, conn, sql, params, timeout_seconds: Optional[float]):
+        # Job limits can only be passed to the DB-API cursor, SQLAlchemy has no option for them
+        from google.cloud.bigquery import QueryJobConfig
+
+        if timeout_seconds is None:
+            timeout_seconds = self.statement_timeout
+        if timeout_seconds is None:
+            timeout_seconds = statement_limits.get_timeout(DatabaseTypes.BIGQUERY)
+        maximum_bytes_billed = self.maximum_bytes_billed or statement_limits.maximum_bytes_billed
+        job_config = QueryJobConfig(maximum_bytes_billed=maximum_bytes_billed)
+        if timeout_seconds > 0:
+            job_config.job_timeout_ms = int(timeout_seconds * 1000)
+        sql = self._bind_literals(conn, sql, params)
+        cursor = conn.connection.driver_connection.cursor()
+        try:
+            cursor.execute(sql, job_config=job_config)
+        except Exception as e:
+            limit = get_exceeded_limit(e, DatabaseTypes.BIGQUERY)
+            if limit is None:
+                raise
+            threshold = maximum_bytes_billed if limit is ExecutionLimits.BYTES_BILLED else timeout_seconds
+            raise CSQLExecutionLimitExceeded(e, limit=limit.value, threshold=threshold)
+        return cursor
+
+    def estimate_query(self, sql, params=None) -> QueryCostEstimate:
+        """Dry runs ``sql``, BigQuery validates it and reports the bytes it would scan without billing anything."""
+        from google.cloud.bigquery import QueryJobConfig
+
+        with self.get_engine().connect() as conn:
+            cursor = conn.connection.driver_connection.cursor()
+            cursor.execute(self._bind_literals(conn, sql, params),
+                           job_config=QueryJobConfig(dry_run=True, use_query_cache=False))
+            bytes_scanned = cursor.query_job.total_bytes_processed
+            cursor.close()
+        return QueryCostEstimate(query=sql, dialect=DatabaseTypes.BIGQUERY.value, bytes_scanned=bytes_scanned)
+
+    @staticmethod
+    def _bind_literals(conn, sql, params):
+        if not params:
+            return sql
+        return str(text(sql).bindparams(**params).compile(dialect=conn.dialect, compile_kwargs={"literal_binds": True}))
+
+    def get_identity(self) -> str:
+        return self.get_uri(uri_only=True)
+
+    def get_schema(self, refresh: bool = False):
+        identity = self.get_identity()
+        if refresh:
+            schema_cache.invalidate(identity)
+        # Catalog queries are billed on BigQuery so entries simply expire after the TTL
+        schema = schema_cache.get_or_reflect(identity, reflect=lambda: get_sql_schema(self.get_engine()))
         return schema
 
+    def get_examples(self, tables: List[str], schema_name: Optional[str] = None, count: int = 5) -> List[List[tuple]]:
+        sampler = TableSampler(identity=self.get_identity(), database_schema=self.get_schema(),
+                               dialect=DatabaseTypes.BIGQUERY,
+                               quote=self.get_engine().dialect.identifier_preparer.quote)
+        return sampler.sample(tables, count, run_query=self.query)
+
     def get_uri(self, uri_only: bool = False):
         conn_string = (f'bigquery://{self.credentials.project_id}')
         if self.credentials.dataset_id:
@@ -39,21 +115,23 @@ class BigQueryClient(DatabaseClient):
         conn_string += f'?credentials_info={self.credentials.service_account_details}'
         return conn_string
 
-    def connect(self):
-        conn_string = self.get_uri()
-        engine = create_engine(conn_string, credentials_info=self.credentials.service_account_details)
-        conn = engine.connect()
-        self.client = conn
+    def connect(self, verify: bool = False):
+        engine = self.get_engine()
+        if verify:
+            with engine.connect():
+                pass
         return self
 
     def get_engine(self):
-        conn_string = self.get_uri(uri_only=True)
-        self.engine = create_engine(conn_string)
+        if self.engine is None:
+            conn_string = self.get_uri(uri_only=True)
+            self.engine = engine_registry.get_engine(conn_string,
+                                                     credentials_info=self.credentials.service_account_details)
         return self.engine
 
     def get_table_names(self, dataset_name: str):
         # Get all the contents of the table with the table name using the SQLAlchemy engine
-        inspector = inspect(self.engine)
+        inspector = inspect(self.get_engine())
         schemas = inspector.get_schema_names()
         tables = []
         for schema in schemas:
@@ -1,15 +1,25 @@
-from typing import Any, List
+import logging
+from typing import Any, List, Optional
 
-from sqlalchemy import create_engine, text, inspect
+from pydantic import Field
+from sqlalchemy import text, inspect
 from sqlalchemy.exc import DatabaseError
 
 from doorbeen.core.connections.SQL.Schema import get_sql_schema
+from doorbeen.core.connections.SQL.cache import schema_cache, hash_catalog_rows
+from doorbeen.core.connections.SQL.estimates import get_explain_statement, parse_plan
+from doorbeen.core.connections.SQL.limits import get_exceeded_limit, statement_limits, statement_timeout
+from doorbeen.core.connections.SQL.query_cache import query_result_cache
+from doorbeen.core.connections.SQL.results import QueryResultLimits, ResultStreamCollector, StreamedQueryResult
+from doorbeen.core.connections.SQL.samples import TableSampler
 from doorbeen.core.connections.clients.base import DatabaseClient
+from doorbeen.core.connections.clients.engines import engine_registry
 from doorbeen.core.connections.clients.factory.abstracts import DatabaseClientFactory
 from doorbeen.core.connections.credentials.SQL.common import CommonSQLCredentials
-from doorbeen.core.exceptions.SQLClients import CSQLInvalidQuery
+from doorbeen.core.exceptions.SQLClients import CSQLExecutionLimitExceeded, CSQLInvalidQuery
 from doorbeen.core.types.databases import DatabaseTypes
-from doorbeen.core.types.sql_schema import ColumnSchema
+from doorbeen.core.types.execute import QueryCostEstimate, ResultCacheStatus
+from doorbeen.core.types.sql_schema import ColumnSchema, DatabaseSchema
 
 
 class SQLDatabaseClientFactory(DatabaseClientFactory):
@@ -20,30 +30,129 @@ class SQLDatabaseClientFactory(DatabaseClientFactory):
 class CommonSQLClient(DatabaseClient):
     credentials: CommonSQLCredentials
     engine: Any = None
-
-    def connect(self):
-        conn_string = self.get_uri()
-        engine = create_engine(conn_string)
-        self.engine = engine
-        conn = engine.connect()
-        self.client = conn
+    result_cache_ttl: Optional[float] = Field(default=None, description="Seconds results of this connection are "
+                                                                        "reused, overrides QUERY_CACHE_TTL_SECONDS")
+    statement_timeout: Optional[float] = Field(default=None, description="Seconds a statement may run on this "
+                                                                         "connection, overrides the dialect's timeout")
+
+    def connect(self, verify: bool = False):
+        engine = self.get_engine()
+        if verify:
+            # Checking out a pooled connection surfaces invalid credentials or an unreachable host right away
+            with engine.connect():
+                pass
         return self
 
-    def query(self, sql, params=None):
+    def get_engine(self):
+        if self.engine is None:
+            self.engine = engine_registry.get_engine(self.get_uri())
+        return self.engine
+
+    def query(self, sql, params=None, use_cache: bool = True, timeout_seconds: Optional[float] = None):
+        key = self.get_result_cache_key(sql, params) if use_cache else None
+        cached = query_result_cache.get_rows(key) if key is not None else None
+        if cached is not None:
+            return cached
+        dialect = self.credentials.dialect
+        timeout_seconds = self.get_statement_timeout(timeout_seconds)
+        try:
+            # Connections go back to the shared pool as soon as the rows are fetched
+            with self.get_engine().connect() as conn, statement_timeout(conn, dialect, timeout_seconds):
+                result = conn.execute(text(sql), params)
+                fetched_results = result.fetchall()
+                columns = list(result.keys())
+                result.close()
+        except DatabaseError as e:
+            raise self.get_query_error(e, timeout_seconds)
+        if key is not None:
+            query_result_cache.put_rows(key, columns, fetched_results, self.get_result_cache_ttl())
+        return fetched_results
+
+    def stream_query(self, sql, params=None, limits: Optional[QueryResultLimits] = None,
+                     use_cache: bool = True) -> StreamedQueryResult:
+        collector = ResultStreamCollector(limits=limits or QueryResultLimits())
+        key = self.get_result_cache_key(sql, params, limits=collector.limits) if use_cache else None
+        cached = self.get_cached_stream(key)
+        if cached is not None:
+            return cached
+        dialect = self.credentials.dialect
+        timeout_seconds = self.get_statement_timeout(collector.limits.timeout_seconds)
+        try:
+            with self.get_engine().connect() as conn, statement_timeout(conn, dialect, timeout_seconds):
+                # yield_per turns on server side cursors where the driver supports them
+                result = conn.execution_options(yield_per=collector.limits.batch_size).execute(text(sql), params)
+                collector.start(result.keys())
+                for batch in result.partitions():
+                    if not collector.add(batch):
+                        break
+                self._close_result(conn, result, collector.stopped_early)
+        except DatabaseError as e:
+            raise self.get_query_error(e, timeout_seconds)
+        return self.cache_stream(key, collector.finish())
+
+    def estimate_query(self, sql, params=None) -> QueryCostEstimate:
+        """Plans ``sql`` with EXPLAIN and returns the planner's estimates without running it."""
+        dialect = self.credentials.dialect
+        statement = get_explain_statement(sql, dialect)
+        if statement is None:
+            return QueryCostEstimate(query=sql, dialect=dialect.value, error="Estimates are not supported")
         try:
-            if self.client is None:
-                self.get_connection()
-            conn = self.client
-
-            if params is None:
-                result = conn.execute(text(sql))
-            else:
-                result = conn.execute(text(sql), **params)
-            fetched_results = result.fetchall()
-            result.close()
-            return fetched_results
+            with self.get_engine().connect() as conn:
+                rows = conn.execute(text(statement), params).fetchall()
         except DatabaseError as e:
             raise CSQLInvalidQuery(e)
+        return parse_plan(sql, dialect, rows)
+
+    def get_statement_timeout(self, timeout_seconds: Optional[float] = None) -> float:
+        # The request's timeout wins over the connection's, which wins over the dialect's
+        if timeout_seconds is not None:
+            return timeout_seconds
+        if self.statement_timeout is not None:
+            return self.statement_timeout
+        return statement_limits.get_timeout(self.credentials.dialect)
+
+    def get_query_error(self, e: DatabaseError, timeout_seconds: float) -> CSQLInvalidQuery:
+        limit = get_exceeded_limit(e, self.credentials.dialect)
+        if limit is None:
+            return CSQLInvalidQuery(e)
+        return CSQLExecutionLimitExceeded(e, limit=limit.value, threshold=timeout_seconds)
+
+    def get_result_cache_ttl(self) -> float:
+        if self.result_cache_ttl is not None:
+            return self.result_cache_ttl
+        return query_result_cache.config.ttl_seconds
+
+    def get_result_cache_key(self, sql, params=None, limits: Optional[QueryResultLimits] = None) -> Optional[str]:
+        if not query_result_cache.accepts(sql, self.get_result_cache_ttl(), self.credentials.dialect):
+            return None
+        identity = self.get_identity()
+        # Streamed results depend on the limits they were read with, fetched rows don't
+        variant = "rows"
+        if limits is not None:
+            variant = f"stream:{limits.model_dump_json(exclude={'batch_size', 'timeout_seconds'})}"
+        return query_result_cache.key(identity, schema_cache.get_fingerprint(identity), sql, params, variant=variant)
+
+    @staticmethod
+    def get_cached_stream(key: Optional[str]) -> Optional[StreamedQueryResult]:
+        cached = query_result_cache.get(key) if key is not None else None
+        if cached is None:
+            return None
+        streamed, status = cached
+        return streamed.model_copy(update={"cache": status})
+
+    def cache_stream(self, key: Optional[str], streamed: StreamedQueryResult) -> StreamedQueryResult:
+        if key is None:
+            return streamed
+        ttl_seconds = self.get_result_cache_ttl()
+        query_result_cache.put(key, streamed, streamed.table.nbytes, ttl_seconds)
+        return streamed.model_copy(update={"cache": ResultCacheStatus(hit=False, ttl_seconds=ttl_seconds)})
+
+    def _close_result(self, conn, result, stopped_early: bool):
+        if stopped_early and self.credentials.dialect is DatabaseTypes.MYSQL:
+            # Closing an unbuffered MySQL cursor reads the remaining rows off the wire, dropping the connection doesn't
+            conn.invalidate()
+            return
+        result.close()
 
     def get_uri(self):
         dialect = self.credentials.dialect
@@ -56,27 +165,58 @@ class CommonSQLClient(DatabaseClient):
         conn_string = f"{dialect_str}://{self.credentials.username}:{self.credentials.password}@{self.credentials.host}:{self.credentials.port}/{self.credentials.database}"
         return conn_string
 
-    def get_schema(self):
-        schema = get_sql_schema(self.get_uri())
+    def get_identity(self) -> str:
+        creds = self.credentials
+        return f"{creds.dialect.value}://{creds.username}@{creds.host}:{creds.port}/{creds.database}"
+
+    def get_schema(self, refresh: bool = False):
+        identity = self.get_identity()
+        if refresh:
+            schema_cache.invalidate(identity)
+            query_result_cache.invalidate(identity)
+        schema = schema_cache.get_or_reflect(identity, reflect=lambda: get_sql_schema(self.get_engine()),
+                                             fingerprint=self.get_catalog_fingerprint)
         return schema
 
+    def get_catalog_fingerprint(self) -> Optional[str]:
+        catalog_query = self.get_catalog_query()
+        if catalog_query is None:
+            return None
+        try:
+            with self.get_engine().connect() as conn:
+                rows = conn.execute(text(catalog_query)).fetchall()
+        except DatabaseError as e:
+            logging.warning(f"Could not compute the catalog fingerprint: {e}")
+            return None
+        return hash_catalog_rows(rows)
+
+    def get_catalog_query(self) -> Optional[str]:
+        # A cheap catalog query whose result changes whenever a table or column is added, dropped or retyped
+        dialect = self.credentials.dialect
+        if dialect is DatabaseTypes.POSTGRESQL:
+            return ("SELECT table_name, column_name, data_type FROM information_schema.columns "
+                    "WHERE table_schema = current_schema() ORDER BY table_name, ordinal_position")
+        if dialect is DatabaseTypes.MYSQL:
+            return ("SELECT table_name, column_name, data_type FROM information_schema.columns "
+                    "WHERE table_schema = DATABASE() ORDER BY table_name, ordinal_position")
+        if dialect is DatabaseTypes.SQLITE:
+            return "SELECT name, sql FROM sqlite_master WHERE type IN ('table', 'view') ORDER BY name"
+        return None
+
     def get_table_names(self, schema_name: str = "public") -> List[str]:
-        inspector = inspect(self.engine)
+        inspector = inspect(self.get_engine())
         return inspector.get_table_names(schema=schema_name)
 
-    def get_examples(self, tables: List[str], schema_name: str = "public", count: int = 5) -> List[str]:
-        examples = []
-        for table in tables:
-            query = f"SELECT * FROM {table} LIMIT {count}"
-            try:
-                result = self.query(query)
-                examples.append(result)
-            except CSQLInvalidQuery:
-                examples.append([])
-        return examples
+    def get_examples(self, tables: List[str], schema_name: str = "public", count: int = 5) -> List[List[tuple]]:
+        # Sampled rows have their own cache, sample_cache
+        return self.get_table_sampler().sample(tables, count, run_query=lambda sql: self.query(sql, use_cache=False))
+
+    def get_table_sampler(self, schema: Optional[DatabaseSchema] = None) -> TableSampler:
+        return TableSampler(identity=self.get_identity(), database_schema=schema or self.get_schema(),
+                            dialect=self.credentials.dialect, quote=self.get_engine().dialect.identifier_preparer.quote)
 
     def get_column_info(self, table_name: str, schema_name: str = "public") -> List[ColumnSchema]:
-        inspector = inspect(self.engine)
+        inspector = inspect(self.get_engine())
         columns = inspector.get_columns(table_name, schema=schema_name)
 
         column_schema: List[ColumnSchema] = []
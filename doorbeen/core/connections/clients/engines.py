@@ -0,0 +1,133 @@
+import asyncio
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from pydantic import Field, PrivateAttr
+from sqlalchemy import create_engine
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+
+from doorbeen.core.config.execution_env import ExecutionEnv
+from doorbeen.core.types.ts_model import TSModel
+
+
+class EngineRegistryConfig(TSModel):
+    pool_size: int = Field(default_factory=lambda: int(ExecutionEnv.get_key('DB_POOL_SIZE') or 5),
+                           description="Connections kept open per engine")
+    max_overflow: int = Field(default_factory=lambda: int(ExecutionEnv.get_key('DB_POOL_MAX_OVERFLOW') or 10),
+                              description="Connections allowed above pool_size under load")
+    pool_recycle: int = Field(default_factory=lambda: int(ExecutionEnv.get_key('DB_POOL_RECYCLE_SECONDS') or 1800),
+                              description="Seconds after which a pooled connection is replaced")
+    pool_pre_ping: bool = Field(default_factory=lambda: ExecutionEnv.get_key('DB_POOL_PRE_PING') not in ["False", "false"],
+                                description="Whether to test connections on checkout")
+    idle_timeout: float = Field(default_factory=lambda: float(ExecutionEnv.get_key('DB_ENGINE_IDLE_SECONDS') or 900),
+                                description="Seconds an unused engine is kept before it is disposed")
+    max_engines: int = Field(default_factory=lambda: int(ExecutionEnv.get_key('DB_MAX_ENGINES') or 32),
+                             description="Maximum number of distinct engines kept alive")
+
+
+class RegisteredEngine(TSModel):
+    engine: Any
+    created_at: float
+    last_used_at: float
+
+
+class EngineRegistry(TSModel):
+    """
+    Hands out pooled SQLAlchemy engines keyed by a fingerprint of the connection URI and engine options so that
+    requests and graph nodes targeting the same database share one connection pool.
+    """
+    config: EngineRegistryConfig = Field(default_factory=EngineRegistryConfig)
+    _engines: "OrderedDict[str, RegisteredEngine]" = PrivateAttr(default_factory=OrderedDict)
+    _lock: threading.RLock = PrivateAttr(default_factory=threading.RLock)
+
+    def get_engine(self, uri: str, **engine_kwargs) -> Engine:
+        return self._get_or_create(uri, create_engine, engine_kwargs)
+
+    def get_async_engine(self, uri: str, **engine_kwargs) -> AsyncEngine:
+        return self._get_or_create(uri, create_async_engine, engine_kwargs, asynchronous=True)
+
+    def _get_or_create(self, uri: str, factory, engine_kwargs: Dict[str, Any], asynchronous: bool = False):
+        key = self.fingerprint(uri, asynchronous=asynchronous, **engine_kwargs)
+        now = time.monotonic()
+        with self._lock:
+            self._evict_idle(now)
+            registered = self._engines.get(key)
+            if registered is None:
+                engine = factory(uri, **self._pool_options(uri), **engine_kwargs)
+                registered = RegisteredEngine(engine=engine, created_at=now, last_used_at=now)
+                self._engines[key] = registered
+                self._evict_overflow()
+            registered.last_used_at = now
+            self._engines.move_to_end(key)
+            return registered.engine
+
+    def dispose(self, uri: Optional[str] = None, asynchronous: bool = False, **engine_kwargs):
+        with self._lock:
+            if uri is None:
+                keys = list(self._engines.keys())
+            else:
+                keys = [self.fingerprint(uri, asynchronous=asynchronous, **engine_kwargs)]
+            for key in keys:
+                registered = self._engines.pop(key, None)
+                if registered is not None:
+                    self._dispose_engine(registered.engine)
+
+    async def adispose(self):
+        with self._lock:
+            registered_engines = list(self._engines.values())
+            self._engines.clear()
+        for registered in registered_engines:
+            if isinstance(registered.engine, AsyncEngine):
+                await registered.engine.dispose()
+            else:
+                registered.engine.dispose()
+
+    def size(self) -> int:
+        return len(self._engines)
+
+    @staticmethod
+    def fingerprint(uri: str, asynchronous: bool = False, **engine_kwargs) -> str:
+        payload = json.dumps({"uri": uri, "async": asynchronous, "options": engine_kwargs}, sort_keys=True,
+                             default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _pool_options(self, uri: str) -> Dict[str, Any]:
+        options = {"pool_pre_ping": self.config.pool_pre_ping, "pool_recycle": self.config.pool_recycle}
+        # SQLite pools connections per thread and does not accept queue pool sizing
+        if make_url(uri).get_backend_name() != "sqlite":
+            options["pool_size"] = self.config.pool_size
+            options["max_overflow"] = self.config.max_overflow
+        return options
+
+    def _evict_idle(self, now: float):
+        idle_keys = [key for key, registered in self._engines.items()
+                     if now - registered.last_used_at > self.config.idle_timeout]
+        for key in idle_keys:
+            logging.info(f"Disposing engine idle for more than {self.config.idle_timeout}s")
+            self._dispose_engine(self._engines.pop(key).engine)
+
+    def _evict_overflow(self):
+        while len(self._engines) > self.config.max_engines:
+            _, registered = self._engines.popitem(last=False)
+            self._dispose_engine(registered.engine)
+
+    @staticmethod
+    def _dispose_engine(engine: Any):
+        if not isinstance(engine, AsyncEngine):
+            engine.dispose()
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            asyncio.run(engine.dispose())
+        else:
+            loop.create_task(engine.dispose())
+
+
+engine_registry = EngineRegistry()
@@ -1,4 +1,5 @@
 from doorbeen.core.connections.clients.NoSQL.mongo import MongoDBClient
+from doorbeen.core.connections.clients.SQL.aio import AsyncCommonSQLClient
 from doorbeen.core.connections.clients.SQL.bigquery import BigQueryClient
 from doorbeen.core.connections.clients.SQL.common import CommonSQLClient
 from doorbeen.core.connections.clients.factory.abstracts import DatabaseClientFactory
@@ -12,6 +13,11 @@ class CommonSQLClientFactory(DatabaseClientFactory):
         return CommonSQLClient(credentials=credentials)
 
 
+class AsyncCommonSQLClientFactory(DatabaseClientFactory):
+    def create_client(self, credentials: CommonSQLCredentials) -> AsyncCommonSQLClient:
+        return AsyncCommonSQLClient(credentials=credentials)
+
+
 class BigQueryClientFactory(DatabaseClientFactory):
     def create_client(self, credentials: BigQueryCredentials) -> BigQueryClient:
         return BigQueryClient(credentials=credentials)
@@ -1,5 +1,6 @@
 from doorbeen.core.connections.clients.SQL.bigquery import BigQueryClient
-from doorbeen.core.connections.clients.factory.implementations import CommonSQLClientFactory, BigQueryClientFactory
+from doorbeen.core.connections.clients.factory.implementations import CommonSQLClientFactory, BigQueryClientFactory, \
+    AsyncCommonSQLClientFactory
 from doorbeen.core.connections.clients.generator import DatabaseClientGenerator
 from doorbeen.core.connections.credentials.SQL.bigquery import BigQueryCredentialsFactory
 from doorbeen.core.connections.credentials.SQL.common import CommonSQLCredentialsFactory
@@ -11,7 +12,7 @@ from doorbeen.core.types.ts_model import TSModel
 class DBClientService(TSModel):
 
     @staticmethod
-    def get_client(details: dict, db_type: DatabaseTypes):
+    def get_client(details: dict, db_type: DatabaseTypes, asynchronous: bool = False):
         factory = None
         client = None
         creds = None
@@ -20,7 +21,7 @@ class DBClientService(TSModel):
         if is_common_sql:
             creds_factory = CommonSQLCredentialsFactory()
             creds = DatabaseCredentialsGenerator().parse(factory=creds_factory, **details)
-            client_factory = CommonSQLClientFactory()
+            client_factory = AsyncCommonSQLClientFactory() if asynchronous else CommonSQLClientFactory()
             details['dialect'] = details['dialect'].lower()
         if db_type == DatabaseTypes.BIGQUERY:
             creds_factory = BigQueryCredentialsFactory()
@@ -0,0 +1,49 @@
+from doorbeen.core.events.generator import AgentEvent
+from doorbeen.core.types.serialization import dumps_model
+
+
+def encode_event(event: AgentEvent) -> str:
+    """One NDJSON line for the event stream."""
+    return dumps_model(event) + "\n"
+
+
+if __name__ == '__main__':
+    # Benchmark: encoding the payloads a request produces, the current pydantic path vs dumps_model
+    import random
+    import timeit
+    import uuid
+    from datetime import datetime, timedelta
+    from decimal import Decimal
+
+    from doorbeen.core.events.types import EventTypes
+    from doorbeen.core.types.execute import ColumnAggregate, ExecutionResults, ResultStatistics
+    from doorbeen.core.types.finalize import FinalPresentation
+    from doorbeen.core.types.observe import QueryAnalysisReport, QueryEvaluationReport
+
+    ROW_COUNT = 10000
+    started = datetime(2024, 1, 1)
+    records = [{"order_id": str(uuid.uuid4()), "customer": f"customer {index}", "region": random.choice(["EMEA", "APAC"]),
+                "amount": float(Decimal(random.randint(0, 10 ** 6)) / 100), "ordered_at": started + timedelta(hours=index),
+                "items": random.randint(1, 20)} for index in range(ROW_COUNT)]
+    presentation = FinalPresentation(ready_to_present=True, interpretation_correct=True,
+                                     message="Revenue grew **12%** quarter over quarter. " * 20, results=records)
+    statistics = ResultStatistics(columns=list(records[0].keys()), row_count=ROW_COUNT, retained_rows=ROW_COUNT,
+                                  aggregates=[ColumnAggregate(name=name, count=ROW_COUNT) for name in records[0]])
+    execution = ExecutionResults(query="SELECT * FROM orders", statistics=statistics)
+    report = QueryAnalysisReport(query=QueryEvaluationReport(query_effective=True, met_reasons=["covers all regions"]),
+                                 all_objectives_met=True, insights=["APAC leads revenue"] * 10, next_step="present")
+    event = AgentEvent(type=EventTypes.NODE_OUTPUT.value, name="final_answer_node", data=dumps_model(presentation))
+
+    payloads = {
+        "FinalPresentation (10k rows)": (presentation, None),
+        "ExecutionResults": (execution, {"result", "table"}),
+        "QueryAnalysisReport": (report, None),
+        "AgentEvent (final answer)": (event, None),
+    }
+    for label, (model, exclude) in payloads.items():
+        current = min(timeit.repeat(lambda: model.model_dump_json(exclude=exclude), number=5, repeat=5)) / 5
+        compact = min(timeit.repeat(lambda: dumps_model(model, exclude=exclude), number=5, repeat=5)) / 5
+        print(f"{label:>30}: model_dump_json {current * 1000:8.2f}ms, dumps_model {compact * 1000:8.2f}ms "
+              f"({current / compact:.1f}x)")
+    pretty = min(timeit.repeat(lambda: presentation.model_dump_json(indent=4), number=5, repeat=5)) / 5
+    print(f"{'FinalPresentation indent=4':>30}: {pretty * 1000:8.2f}ms")
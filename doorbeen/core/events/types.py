@@ -7,3 +7,7 @@ class EventTypes(Enum):
     MESSAGE = "agent:message"
     ERROR = "agent:error"
     NODE_OUTPUT = "assistant:node:output"
+    RESULT_CHUNK = "assistant:result:chunk"
+    PROMPT_USAGE = "assistant:prompt:usage"
+    COST_ESTIMATE = "assistant:query:estimate"
+    RETRY_USAGE = "assistant:retry:usage"
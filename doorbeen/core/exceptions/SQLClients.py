@@ -1,3 +1,5 @@
+from typing import Optional
+
 from doorbeen.core.assistants.analysis.sql.query.validation import ValidationResult
 
 
@@ -8,6 +10,17 @@ class CSQLInvalidQuery(Exception):
         super().__init__(self.message)
 
 
+class CSQLExecutionLimitExceeded(CSQLInvalidQuery):
+    """The query was stopped by the database because it ran longer or would scan more than the request allows."""
+
+    def __init__(self, e: Exception, limit: str, threshold: Optional[float] = None):
+        super().__init__(e)
+        self.limit = limit
+        self.threshold = threshold
+        self.message = f"The query exceeded the {limit} limit ({threshold}) and was stopped: {self.message}"
+        self.args = (self.message,)
+
+
 class QueryValidationFailed(Exception):
     def __init__(self, validation: ValidationResult):
         self.message = validation.explanation
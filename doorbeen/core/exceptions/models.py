@@ -0,0 +1,7 @@
+class ModelInvocationTimeout(Exception):
+
+    def __init__(self, provider: str, timeout: float):
+        self.provider = provider
+        self.timeout = timeout
+        self.message = f"The {provider} model did not respond within {timeout:g} seconds"
+        super().__init__(self.message)
@@ -0,0 +1,275 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from abc import abstractmethod
+from collections import OrderedDict
+from enum import Enum
+from typing import Any, List, Optional, Tuple
+
+from langchain_core.messages import BaseMessage, convert_to_messages, message_to_dict, messages_from_dict
+from langchain_core.runnables import RunnableBinding
+from pydantic import Field, PrivateAttr
+
+from doorbeen.core.config.execution_env import ExecutionEnv
+from doorbeen.core.types.ts_model import TSModel
+
+CACHE_TABLE = "llm_response_cache"
+
+
+class LLMCacheBackends(str, Enum):
+    MEMORY = "memory"
+    SQLITE = "sqlite"
+    POSTGRES = "postgres"
+
+
+def parse_names(value: Optional[str]) -> List[str]:
+    return [name.strip() for name in (value or "").split(",") if name.strip()]
+
+
+class LLMResponseCacheConfig(TSModel):
+    enabled: bool = Field(default_factory=lambda: ExecutionEnv.get_key('LLM_CACHE_ENABLED') not in ["False", "false"],
+                          description="Whether identical model calls are answered from the cache")
+    ttl_seconds: float = Field(default_factory=lambda: float(ExecutionEnv.get_key('LLM_CACHE_TTL_SECONDS') or 3600),
+                               description="How long a cached response is served")
+    max_entries: int = Field(default_factory=lambda: int(ExecutionEnv.get_key('LLM_CACHE_MAX_ENTRIES') or 1024),
+                             description="Responses kept in memory")
+    backend: LLMCacheBackends = Field(
+        default_factory=lambda: LLMCacheBackends(ExecutionEnv.get_key('LLM_CACHE_BACKEND') or "memory"),
+        description="Persistent tier behind the in memory one, memory disables it")
+    sqlite_path: str = Field(default_factory=lambda: ExecutionEnv.get_key('LLM_CACHE_SQLITE_PATH')
+                             or os.path.join(tempfile.gettempdir(), "doorbeen", "llm_cache.sqlite3"),
+                             description="Database file of the sqlite backend")
+    persistent_max_entries: int = Field(
+        default_factory=lambda: int(ExecutionEnv.get_key('LLM_CACHE_PERSISTENT_MAX_ENTRIES') or 100000),
+        description="Responses kept by the persistent tier")
+    skip_nodes: List[str] = Field(default_factory=lambda: parse_names(ExecutionEnv.get_key('LLM_CACHE_SKIP_NODES')),
+                                  description="Graph nodes whose model calls always go to the provider")
+
+
+class LLMCacheStats(TSModel):
+    hits: int = 0
+    memory_hits: int = 0
+    persistent_hits: int = 0
+    misses: int = 0
+    stores: int = 0
+    evictions: int = 0
+    skipped: int = 0
+
+
+class LLMResponseStore(TSModel):
+    """Persistent tier of the response cache, values are serialized messages."""
+    max_entries: int = 100000
+    _puts: int = PrivateAttr(default=0)
+
+    @abstractmethod
+    async def aget(self, key: str) -> Optional[str]:
+        pass
+
+    @abstractmethod
+    async def aput(self, key: str, value: str, expires_at: float):
+        pass
+
+    @abstractmethod
+    async def aclear(self):
+        pass
+
+    def should_prune(self) -> bool:
+        # Expired and surplus rows are removed every so often instead of on every write
+        self._puts += 1
+        return self._puts % 100 == 1
+
+
+class SQLiteResponseStore(LLMResponseStore):
+    path: str
+    _lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+    _ready: bool = PrivateAttr(default=False)
+
+    async def aget(self, key: str) -> Optional[str]:
+        return await asyncio.to_thread(self._get, key)
+
+    async def aput(self, key: str, value: str, expires_at: float):
+        await asyncio.to_thread(self._put, key, value, expires_at, self.should_prune())
+
+    async def aclear(self):
+        await asyncio.to_thread(self._execute, f"DELETE FROM {CACHE_TABLE}")
+
+    def _get(self, key: str) -> Optional[str]:
+        rows = self._execute(f"SELECT response FROM {CACHE_TABLE} WHERE key = ? AND expires_at > ?", key, time.time())
+        return rows[0][0] if rows else None
+
+    def _put(self, key: str, value: str, expires_at: float, prune: bool):
+        self._execute(f"INSERT OR REPLACE INTO {CACHE_TABLE} (key, response, created_at, expires_at) "
+                      f"VALUES (?, ?, ?, ?)", key, value, time.time(), expires_at)
+        if prune:
+            self._execute(f"DELETE FROM {CACHE_TABLE} WHERE expires_at <= ?", time.time())
+            self._execute(f"DELETE FROM {CACHE_TABLE} WHERE key IN (SELECT key FROM {CACHE_TABLE} "
+                          f"ORDER BY created_at DESC LIMIT -1 OFFSET ?)", self.max_entries)
+
+    def _execute(self, sql: str, *params) -> List[Tuple]:
+        with self._lock:
+            with sqlite3.connect(self.path, timeout=5) as connection:
+                if not self._ready:
+                    connection.execute(f"CREATE TABLE IF NOT EXISTS {CACHE_TABLE} (key TEXT PRIMARY KEY, "
+                                       f"response TEXT NOT NULL, created_at REAL NOT NULL, expires_at REAL NOT NULL)")
+                    self._ready = True
+                return connection.execute(sql, params).fetchall()
+
+
+class PostgresResponseStore(LLMResponseStore):
+    """Keeps the responses in the memory database, borrowing connections from the checkpoint pool."""
+    _ready: bool = PrivateAttr(default=False)
+
+    async def aget(self, key: str) -> Optional[str]:
+        rows = await self._execute(f"SELECT response FROM {CACHE_TABLE} WHERE key = %s AND expires_at > %s",
+                                   key, time.time(), fetch=True)
+        return rows[0][0] if rows else None
+
+    async def aput(self, key: str, value: str, expires_at: float):
+        await self._execute(f"INSERT INTO {CACHE_TABLE} (key, response, created_at, expires_at) "
+                            f"VALUES (%s, %s, %s, %s) ON CONFLICT (key) DO UPDATE SET response = EXCLUDED.response, "
+                            f"created_at = EXCLUDED.created_at, expires_at = EXCLUDED.expires_at",
+                            key, value, time.time(), expires_at)
+        if self.should_prune():
+            await self._execute(f"DELETE FROM {CACHE_TABLE} WHERE expires_at <= %s", time.time())
+            await self._execute(f"DELETE FROM {CACHE_TABLE} WHERE key IN (SELECT key FROM {CACHE_TABLE} "
+                                f"ORDER BY created_at DESC OFFSET %s)", self.max_entries)
+
+    async def aclear(self):
+        await self._execute(f"DELETE FROM {CACHE_TABLE}")
+
+    async def _execute(self, sql: str, *params, fetch: bool = False) -> List[Tuple]:
+        from doorbeen.core.assistants.memory.checkpointer import checkpointer_manager
+
+        await checkpointer_manager.get_checkpointer()
+        async with checkpointer_manager.get_pool().connection() as connection:
+            if not self._ready:
+                await connection.execute(f"CREATE TABLE IF NOT EXISTS {CACHE_TABLE} (key TEXT PRIMARY KEY, "
+                                         f"response TEXT NOT NULL, created_at DOUBLE PRECISION NOT NULL, "
+                                         f"expires_at DOUBLE PRECISION NOT NULL)")
+                self._ready = True
+            cursor = await connection.execute(sql, params)
+            return await cursor.fetchall() if fetch else []
+
+
+class LLMResponseCache(TSModel):
+    """
+    Exact match cache of model responses keyed by the model, its parameters, the bound call options such as
+    response_format and tools, and a hash of the normalized messages. Responses are kept in an in memory LRU and,
+    depending on ``backend``, in sqlite or the Postgres memory database so they survive restarts and are shared
+    between workers.
+    """
+    config: LLMResponseCacheConfig = Field(default_factory=LLMResponseCacheConfig)
+    stats: LLMCacheStats = Field(default_factory=LLMCacheStats)
+    store: Optional[LLMResponseStore] = None
+    _entries: "OrderedDict[str, Tuple[str, float]]" = PrivateAttr(default_factory=OrderedDict)
+    _lock: threading.RLock = PrivateAttr(default_factory=threading.RLock)
+
+    def model_post_init(self, __context: Any):
+        if self.store is None and self.config.backend is LLMCacheBackends.SQLITE:
+            os.makedirs(os.path.dirname(self.config.sqlite_path) or ".", exist_ok=True)
+            self.store = SQLiteResponseStore(path=self.config.sqlite_path,
+                                             max_entries=self.config.persistent_max_entries)
+        elif self.store is None and self.config.backend is LLMCacheBackends.POSTGRES:
+            self.store = PostgresResponseStore(max_entries=self.config.persistent_max_entries)
+
+    def is_enabled_for(self, node: Optional[str]) -> bool:
+        if not self.config.enabled or (node is not None and node in self.config.skip_nodes):
+            self.stats.skipped += 1
+            return False
+        return True
+
+    @staticmethod
+    def key(runnable: Any, messages: Any) -> str:
+        options = {}
+        model = runnable
+        # Bindings hold the call options, e.g. response_format, tools and tool_choice
+        while isinstance(model, RunnableBinding):
+            options = {**model.kwargs, **options}
+            model = model.bound
+        parameters = getattr(model, "_identifying_params", None) or {}
+        payload = {
+            "model": type(model).__name__,
+            "parameters": parameters,
+            "options": options,
+            "messages": normalize_messages(messages),
+        }
+        encoded = json.dumps(payload, sort_keys=True, default=str, ensure_ascii=False)
+        return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+    async def aget(self, key: str) -> Optional[BaseMessage]:
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] > now:
+                self._entries.move_to_end(key)
+                self.stats.hits += 1
+                self.stats.memory_hits += 1
+                return load_message(entry[0])
+            self._entries.pop(key, None)
+        if self.store is not None:
+            try:
+                value = await self.store.aget(key)
+            except Exception as e:
+                logging.warning(f"Could not read the persistent LLM cache: {e}")
+                value = None
+            if value is not None:
+                self._remember(key, value, now + self.config.ttl_seconds)
+                self.stats.hits += 1
+                self.stats.persistent_hits += 1
+                return load_message(value)
+        self.stats.misses += 1
+        return None
+
+    async def aput(self, key: str, message: BaseMessage):
+        value = json.dumps(message_to_dict(message), default=str)
+        expires_at = time.time() + self.config.ttl_seconds
+        self._remember(key, value, expires_at)
+        self.stats.stores += 1
+        if self.store is not None:
+            try:
+                await self.store.aput(key, value, expires_at)
+            except Exception as e:
+                logging.warning(f"Could not write to the persistent LLM cache: {e}")
+
+    async def aclear(self):
+        with self._lock:
+            self._entries.clear()
+        if self.store is not None:
+            await self.store.aclear()
+
+    def _remember(self, key: str, value: str, expires_at: float):
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.config.max_entries:
+                self._entries.popitem(last=False)
+                self.stats.evictions += 1
+
+
+def normalize_messages(messages: Any) -> List[dict]:
+    """Role, whitespace normalized content and tool calls of each message, the parts that decide the response."""
+    normalized = []
+    for message in convert_to_messages(messages if isinstance(messages, list) else [messages]):
+        content = message.content
+        if isinstance(content, str):
+            content = " ".join(content.split())
+        item = {"type": message.type, "content": content}
+        if getattr(message, "tool_calls", None):
+            item["tool_calls"] = [{"name": call["name"], "args": call["args"]} for call in message.tool_calls]
+        if message.name:
+            item["name"] = message.name
+        normalized.append(item)
+    return normalized
+
+
+def load_message(value: str) -> BaseMessage:
+    return messages_from_dict([json.loads(value)])[0]
+
+
+llm_response_cache = LLMResponseCache()
@@ -1,10 +1,20 @@
+import asyncio
 import json
+import logging
 import re
-from typing import Any, Optional, Type, Union
+import threading
+import weakref
+from typing import Any, Dict, Optional, Type, Union
 
-from langchain_core.messages import AIMessage
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.runnables.config import ensure_config
 from langchain_openai import ChatOpenAI
+from pydantic import Field, PrivateAttr
 
+from doorbeen.core.assistants.analysis.sql.retries import record_tokens
+from doorbeen.core.config.execution_env import ExecutionEnv
+from doorbeen.core.exceptions.models import ModelInvocationTimeout
+from doorbeen.core.models.provider import ModelHandler
 from doorbeen.core.types.ts_model import TSModel
 
 
@@ -41,3 +51,154 @@ class ModelInvoker(TSModel):
             return output_model(**parsed_content)
         else:
             return parsed_content
+
+
+def parse_provider_limits(value: Optional[str]) -> Dict[str, int]:
+    """Parses limits like ``OpenAI=32,Anthropic=8``."""
+    limits = {}
+    for item in (value or "").split(","):
+        provider, _, limit = item.partition("=")
+        if provider.strip() and limit.strip():
+            limits[provider.strip()] = int(limit)
+    return limits
+
+
+class LLMInvokerConfig(TSModel):
+    max_concurrency: int = Field(default_factory=lambda: int(ExecutionEnv.get_key('LLM_MAX_CONCURRENCY') or 16),
+                                 description="Model calls in flight per provider unless overridden")
+    provider_concurrency: Dict[str, int] = Field(
+        default_factory=lambda: parse_provider_limits(ExecutionEnv.get_key('LLM_PROVIDER_CONCURRENCY')),
+        description="Per provider overrides of max_concurrency, e.g. OpenAI=32,Anthropic=8")
+    timeout_seconds: float = Field(default_factory=lambda: float(ExecutionEnv.get_key('LLM_TIMEOUT_SECONDS') or 120),
+                                   description="How long a model call may take once it got a slot")
+
+
+class LLMInvocationStats(TSModel):
+    calls: int = 0
+    in_flight: int = 0
+    timeouts: int = 0
+    cancellations: int = 0
+
+
+class LLMInvoker(TSModel):
+    """
+    Runs model calls with ``ainvoke`` so graph nodes never block the event loop. Calls are bounded per provider by
+    a semaphore and by a timeout, and a call whose request was cancelled, e.g. because the client disconnected,
+    releases its slot and aborts the HTTP request to the provider.
+    """
+    config: LLMInvokerConfig = Field(default_factory=LLMInvokerConfig)
+    stats: LLMInvocationStats = Field(default_factory=LLMInvocationStats)
+    # Semaphores belong to an event loop, tests and scripts may run more than one
+    _semaphores: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, asyncio.Semaphore]]" = PrivateAttr(
+        default_factory=weakref.WeakKeyDictionary)
+    _lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+
+    async def ainvoke(self, handler: Optional[ModelHandler], messages: Any, runnable: Optional[Any] = None,
+                      timeout: Optional[float] = None, cache: bool = True) -> Any:
+        runnable = runnable if runnable is not None else handler.model
+        response_cache = handler.cache if handler is not None and cache else None
+        cache_key = None
+        if response_cache is not None and response_cache.is_enabled_for(self.get_current_node()):
+            cache_key = response_cache.key(runnable, messages)
+            cached = await response_cache.aget(cache_key)
+            if cached is not None:
+                return cached
+        response = await self._ainvoke(handler, runnable, messages, timeout)
+        record_tokens(response)
+        if cache_key is not None and isinstance(response, BaseMessage):
+            await response_cache.aput(cache_key, response)
+        return response
+
+    async def _ainvoke(self, handler: Optional[ModelHandler], runnable: Any, messages: Any,
+                       timeout: Optional[float]) -> Any:
+        provider = self.get_provider(handler, runnable)
+        timeout = self.config.timeout_seconds if timeout is None else timeout
+        async with self._get_semaphore(provider):
+            self.stats.calls += 1
+            self.stats.in_flight += 1
+            try:
+                return await asyncio.wait_for(runnable.ainvoke(messages), timeout=timeout)
+            except asyncio.TimeoutError:
+                self.stats.timeouts += 1
+                raise ModelInvocationTimeout(provider, timeout)
+            except asyncio.CancelledError:
+                self.stats.cancellations += 1
+                logging.info(f"Cancelled an in flight {provider} model call")
+                raise
+            finally:
+                self.stats.in_flight -= 1
+
+    @staticmethod
+    def get_current_node() -> Optional[str]:
+        # Set by LangGraph on the config of the node that is running
+        return ensure_config().get("metadata", {}).get("langgraph_node")
+
+    def get_limit(self, provider: str) -> int:
+        return self.config.provider_concurrency.get(provider, self.config.max_concurrency)
+
+    @staticmethod
+    def get_provider(handler: Optional[ModelHandler], runnable: Any) -> str:
+        if handler is not None and handler.info is not None:
+            return handler.info.provider
+        model = handler.model if handler is not None and handler.model is not None else runnable
+        return type(model).__name__
+
+    def _get_semaphore(self, provider: str) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            semaphores = self._semaphores.setdefault(loop, {})
+            if provider not in semaphores:
+                semaphores[provider] = asyncio.Semaphore(max(self.get_limit(provider), 1))
+            return semaphores[provider]
+
+
+llm_invoker = LLMInvoker()
+
+
+if __name__ == '__main__':
+    # Load test: concurrent "requests" each making one call to a fake chat model that takes 0.5s, as a provider
+    # round trip would. Blocking invoke() serialises the requests on the event loop thread, the invoker overlaps them
+    # up to the provider's concurrency limit.
+    import time
+
+    from langchain_core.language_models import BaseChatModel
+    from langchain_core.outputs import ChatGeneration, ChatResult
+
+    MODEL_SECONDS = 0.5
+    CONCURRENCY_LIMIT = 16
+
+    class SlowChatModel(BaseChatModel):
+        @property
+        def _llm_type(self) -> str:
+            return "slow-fake"
+
+        def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+            time.sleep(MODEL_SECONDS)
+            return ChatResult(generations=[ChatGeneration(message=AIMessage(content="{}"))])
+
+        async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+            await asyncio.sleep(MODEL_SECONDS)
+            return ChatResult(generations=[ChatGeneration(message=AIMessage(content="{}"))])
+
+    async def measure(requests: int, run_request) -> float:
+        started = time.perf_counter()
+        await asyncio.gather(*[run_request() for _ in range(requests)])
+        return time.perf_counter() - started
+
+    async def main():
+        model = SlowChatModel()
+        invoker = LLMInvoker(config=LLMInvokerConfig(max_concurrency=CONCURRENCY_LIMIT))
+
+        async def blocking_request():
+            model.invoke("question")
+
+        async def invoker_request():
+            await invoker.ainvoke(None, "question", runnable=model)
+
+        for requests in (1, 8, 32):
+            blocking = await measure(requests, blocking_request)
+            invoked = await measure(requests, invoker_request)
+            print(f"{requests:>3} requests: blocking {blocking:.2f}s, invoker {invoked:.2f}s "
+                  f"(limit {CONCURRENCY_LIMIT})")
+
+    asyncio.run(main())
@@ -10,15 +10,11 @@ from pydantic import model_validator
 from pydantic import Field
 
 from doorbeen.core.assistants.hooks.callback import CallbackManager
+from doorbeen.core.models.cache import LLMResponseCache, llm_response_cache
 from doorbeen.core.types.manufacturers import ModelProviders
 from doorbeen.core.types.ts_model import TSModel
 
 
-class ModelHandler(TSModel):
-    model: Optional[Any] = None
-    callback: Optional[Any] = None
-
-
 class ModelSelectionMode(Enum):
     STATIC = "static"
     DYNAMIC = "dynamic"
@@ -32,6 +28,14 @@ class ModelInfo(TSModel):
     capabilities: List[str]
 
 
+class ModelHandler(TSModel):
+    model: Optional[Any] = None
+    callback: Optional[Any] = None
+    info: Optional[ModelInfo] = None
+    cache: Optional[LLMResponseCache] = Field(default_factory=lambda: llm_response_cache,
+                                              description="Response cache of the model calls, None disables it")
+
+
 class ModelProviderConfig(TSModel):
     models: Dict[str, ModelInfo] = Field(default_factory=dict)
     selection_mode: Dict[str, ModelSelectionMode] = Field(default_factory=dict)
@@ -166,7 +170,7 @@ class ModelProvider(TSModel):
 
         callback = CallbackManager.get_callback(ModelProviders(model_info.provider))
 
-        return ModelHandler(model=base_model, callback=callback)
+        return ModelHandler(model=base_model, callback=callback, info=model_info)
 
     def _set_response_mode(self, model: BaseChatModel, provider: str, output_model: Optional[Type[TSModel]], plaintext: bool) -> BaseChatModel:
         if plaintext:
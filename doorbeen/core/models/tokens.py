@@ -0,0 +1,88 @@
+import logging
+import re
+from functools import lru_cache
+from typing import Any, Optional
+
+from doorbeen.core.types.ts_model import TSModel
+
+try:
+    import tiktoken
+except ImportError:  # pragma: no cover
+    tiktoken = None
+
+DEFAULT_ENCODING = "cl100k_base"
+# Word pieces of up to four characters and single punctuation marks, close to what BPE encoders produce for English
+# text, SQL and JSON
+APPROXIMATE_TOKEN_PATTERN = re.compile(r"\w{1,4}|[^\w\s]")
+
+
+class Tokenizer(TSModel):
+    """
+    Counts and truncates text in model tokens. Uses the tiktoken encoder of the model when its files are available
+    locally or can be fetched, otherwise an offline approximation that follows the same word piece boundaries.
+    """
+    encoding: Optional[Any] = None
+
+    @property
+    def is_exact(self) -> bool:
+        return self.encoding is not None
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        if self.encoding is not None:
+            return len(self.encoding.encode(text, disallowed_special=()))
+        return len(APPROXIMATE_TOKEN_PATTERN.findall(text))
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """Keeps the first ``max_tokens`` tokens of ``text``, cut back to the last full line when there is one."""
+        if max_tokens <= 0:
+            return ""
+        if self.encoding is not None:
+            tokens = self.encoding.encode(text, disallowed_special=())
+            if len(tokens) <= max_tokens:
+                return text
+            head = self.encoding.decode(tokens[:max_tokens])
+        else:
+            matches = APPROXIMATE_TOKEN_PATTERN.finditer(text)
+            end = None
+            for index, match in enumerate(matches):
+                if index == max_tokens:
+                    end = match.start()
+                    break
+            if end is None:
+                return text
+            head = text[:end]
+        line_end = head.rfind("\n")
+        return head[:line_end] if line_end > 0 else head
+
+
+@lru_cache(maxsize=None)
+def get_tokenizer(model_name: Optional[str] = None) -> Tokenizer:
+    return Tokenizer(encoding=_load_encoding(model_name))
+
+
+def _load_encoding(model_name: Optional[str]) -> Optional[Any]:
+    if tiktoken is None:
+        return None
+    encoding_name = DEFAULT_ENCODING
+    if model_name:
+        try:
+            encoding_name = tiktoken.encoding_name_for_model(model_name)
+        except KeyError:
+            # Non OpenAI models, their tokenizers are close enough to cl100k for budgeting
+            pass
+    return _load_encoding_by_name(encoding_name)
+
+
+@lru_cache(maxsize=None)
+def _load_encoding_by_name(encoding_name: str) -> Optional[Any]:
+    try:
+        return tiktoken.get_encoding(encoding_name)
+    except Exception as e:
+        logging.warning(f"Could not load the {encoding_name} tiktoken encoder, token counts are approximated: {e}")
+        return None
+
+
+def count_tokens(text: str, model_name: Optional[str] = None) -> int:
+    return get_tokenizer(model_name).count(text)
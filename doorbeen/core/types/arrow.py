@@ -0,0 +1,158 @@
+import json
+from typing import Any, Iterator, List, Optional, Sequence, Union
+
+import pyarrow as pa
+import pyarrow.compute as pc
+from pydantic import PrivateAttr
+
+from doorbeen.core.types.outputs import ResultLayout
+from doorbeen.core.types.ts_model import TSModel
+
+
+class ArrowResultSet(TSModel):
+    """
+    Columnar query result kept as an Arrow IPC stream. The bytes are what gets checkpointed and the table read back
+    from them shares their memory, so slicing and column access never copy the data.
+    """
+    ipc: bytes
+    _table: Optional[pa.Table] = PrivateAttr(default=None)
+
+    model_config = {
+        "ser_json_bytes": "base64",
+        "val_json_bytes": "base64",
+    }
+
+    @classmethod
+    def from_table(cls, table: pa.Table) -> "ArrowResultSet":
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        return cls(ipc=sink.getvalue().to_pybytes())
+
+    @property
+    def table(self) -> pa.Table:
+        if self._table is None:
+            self._table = pa.ipc.open_stream(pa.py_buffer(self.ipc)).read_all()
+        return self._table
+
+    @property
+    def num_rows(self) -> int:
+        return self.table.num_rows
+
+    @property
+    def columns(self) -> List[str]:
+        return self.table.column_names
+
+    @property
+    def types(self) -> List[str]:
+        return [str(field.type) for field in self.table.schema]
+
+    @property
+    def nbytes(self) -> int:
+        return len(self.ipc)
+
+    def head(self, count: int) -> pa.Table:
+        return self.table.slice(0, count)
+
+    def to_records(self, limit: Optional[int] = None) -> List[dict]:
+        table = self.table if limit is None else self.head(limit)
+        arrays = [to_json_compatible(column) for column in table.columns]
+        return pa.Table.from_arrays(arrays, names=table.column_names).to_pylist()
+
+    def to_rows(self, limit: Optional[int] = None) -> dict:
+        table = self.table if limit is None else self.head(limit)
+        return {"columns": table.column_names, "types": self.types, "rows": table_to_rows(table)}
+
+    def iter_row_chunks(self, size: int) -> Iterator[List[list]]:
+        # Each chunk is converted only when it is requested, so the first one can be sent before the rest exist
+        for offset in range(0, self.num_rows, size):
+            yield table_to_rows(self.table.slice(offset, size))
+
+    def serialize(self, layout: ResultLayout = ResultLayout.RECORDS,
+                  limit: Optional[int] = None) -> Union[List[dict], dict]:
+        if layout is ResultLayout.COLUMNS:
+            return self.to_rows(limit=limit)
+        return self.to_records(limit=limit)
+
+    def to_json(self, layout: ResultLayout = ResultLayout.RECORDS, limit: Optional[int] = None) -> str:
+        return json.dumps(self.serialize(layout=layout, limit=limit), default=str)
+
+
+class ArrowBatchBuilder(TSModel):
+    """Turns batches of DB-API rows into Arrow record batches column by column as they are fetched."""
+    columns: List[str]
+    _batches: List[pa.RecordBatch] = PrivateAttr(default_factory=list)
+
+    def append(self, rows: Sequence[Sequence[Any]]):
+        if len(rows) == 0:
+            return
+        arrays = [to_arrow_array([row[index] for row in rows]) for index in range(len(self.columns))]
+        self._batches.append(pa.RecordBatch.from_arrays(arrays, names=self.columns))
+
+    def build(self) -> ArrowResultSet:
+        if len(self._batches) == 0:
+            table = pa.Table.from_arrays([pa.array([], pa.null()) for _ in self.columns], names=self.columns)
+        else:
+            table = unify_batches(self._batches)
+        self._batches = []
+        return ArrowResultSet.from_table(table)
+
+
+def table_to_rows(table: pa.Table) -> List[list]:
+    columns = [to_json_compatible(column).to_pylist() for column in table.columns]
+    return [list(row) for row in zip(*columns)]
+
+
+def to_arrow_array(values: List[Any]) -> pa.Array:
+    try:
+        array = pa.array(values)
+        if not isinstance(array.type, pa.BaseExtensionType):
+            return array
+    except (pa.ArrowInvalid, pa.ArrowTypeError, OverflowError):
+        pass
+    # Values Arrow can't infer a single plain type for (UUIDs, mixed SQLite columns) are kept as text
+    return pa.array([None if value is None else str(value) for value in values], pa.string())
+
+
+def unify_batches(batches: List[pa.RecordBatch]) -> pa.Table:
+    tables = [pa.Table.from_batches([batch]) for batch in batches]
+    try:
+        return pa.concat_tables(tables, promote_options="permissive")
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        pass
+    # Batches disagree on a column type that can't be promoted, fall back to text for those columns
+    schema = tables[0].schema
+    conflicting = {name for table in tables[1:] for name, field in zip(table.column_names, table.schema)
+                   if field.type != schema.field(name).type and not pa.types.is_null(field.type)}
+    text_tables = []
+    for table in tables:
+        arrays = [pc.cast(column, pa.string()) if name in conflicting else column
+                  for name, column in zip(table.column_names, table.columns)]
+        text_tables.append(pa.Table.from_arrays(arrays, names=table.column_names))
+    return pa.concat_tables(text_tables, promote_options="permissive")
+
+
+def timestamps_to_isoformat(column: pa.ChunkedArray) -> pa.ChunkedArray:
+    # Formats the same way datetime.isoformat() does: microsecond precision, the fraction only when it isn't
+    # zero and the UTC offset with a colon for timezone aware columns
+    column = pc.cast(column, pa.timestamp("us", tz=column.type.tz), safe=False)
+    text = pc.strftime(column, format="%Y-%m-%dT%H:%M:%S%z" if column.type.tz else "%Y-%m-%dT%H:%M:%S")
+    text = pc.replace_substring_regex(text, pattern=r"\.000000([+-]|$)", replacement=r"\1")
+    if column.type.tz:
+        text = pc.replace_substring_regex(text, pattern=r"([+-]\d{2})(\d{2})$", replacement=r"\1:\2")
+    return text
+
+
+def to_json_compatible(column: pa.ChunkedArray) -> pa.ChunkedArray:
+    column_type = column.type
+    if pa.types.is_timestamp(column_type):
+        return timestamps_to_isoformat(column)
+    if pa.types.is_date(column_type) or pa.types.is_time(column_type):
+        return pc.cast(column, pa.string())
+    if pa.types.is_decimal(column_type):
+        return pc.cast(column, pa.float64())
+    if pa.types.is_binary(column_type) or pa.types.is_large_binary(column_type):
+        return pc.cast(column, pa.string())
+    if pa.types.is_duration(column_type):
+        return pc.cast(column, pa.int64())
+    return column
@@ -1,14 +1,82 @@
-from typing import List, Optional
+from typing import Any, Iterator, List, Optional, Union
 
+from pydantic import Field
+
+from doorbeen.core.assistants.utils.sql import serialize_rows
+from doorbeen.core.types.arrow import ArrowResultSet
+from doorbeen.core.types.outputs import ResultLayout
 from doorbeen.core.types.ts_model import TSModel
 from sqlalchemy.engine.row import Row
 
 
+class ColumnAggregate(TSModel):
+    name: str
+    count: int = 0
+    null_count: int = 0
+    min: Optional[Any] = None
+    max: Optional[Any] = None
+    sum: Optional[float] = None
+    mean: Optional[float] = None
+
+
+class ResultStatistics(TSModel):
+    columns: List[str] = []
+    row_count: int = 0
+    row_count_exact: bool = True
+    retained_rows: int = 0
+    retained_bytes: int = 0
+    truncated: bool = False
+    truncation_reason: Optional[str] = None
+    aggregates: List[ColumnAggregate] = []
+
+
+class ResultCacheStatus(TSModel):
+    hit: bool = False
+    age_seconds: float = 0.0
+    ttl_seconds: Optional[float] = None
+
+
+class QueryCostEstimate(TSModel):
+    query: str
+    dialect: str
+    estimated_rows: Optional[float] = Field(default=None, description="Largest row count the planner expects for "
+                                                                      "any step of the plan")
+    estimated_cost: Optional[float] = Field(default=None, description="Planner cost in the database's own units")
+    bytes_scanned: Optional[int] = None
+    full_scans: List[str] = Field(default_factory=list, description="Tables read without an index")
+    exceeded: List[str] = Field(default_factory=list, description="Budgets the estimate is over")
+    error: Optional[str] = None
+
+    @property
+    def within_budget(self) -> bool:
+        return not self.exceeded
+
+
+class StaticCheckResult(TSModel):
+    query: str = Field(description="The query to run, with the fixes applied")
+    original_query: str
+    read_only: bool = True
+    errors: List[str] = Field(default_factory=list, description="Problems found without running the query")
+    fixes: List[str] = Field(default_factory=list, description="Rewrites applied to the query")
+    warnings: List[str] = Field(default_factory=list, description="What could not be checked, the database decides")
+
+    @property
+    def passed(self) -> bool:
+        return not self.errors
+
+
 class ExecutionResults(TSModel):
     query: str
     result: Optional[List] = None
+    table: Optional[ArrowResultSet] = None
+    statistics: Optional[ResultStatistics] = None
+    cache: Optional[ResultCacheStatus] = None
     error: Optional[str] = None
     is_sql_error: Optional[bool] = None
+    limit_exceeded: Optional[str] = Field(default=None, description="Execution limit, e.g. timeout, the query was "
+                                                                    "stopped by")
+    executed: bool = Field(default=True, description="False when the query was rejected before it reached the "
+                                                     "database")
 
     model_config = {
         "json_encoders": {
@@ -16,12 +84,73 @@ class ExecutionResults(TSModel):
         }
     }
 
+    def has_rows(self) -> bool:
+        return self.table is not None or self.result is not None
+
+    def get_row_count(self) -> int:
+        if self.statistics is not None:
+            return self.statistics.row_count
+        if self.table is not None:
+            return self.table.num_rows
+        return 0 if self.result is None else len(self.result)
+
+    def get_columns(self) -> List[str]:
+        if self.table is not None:
+            return self.table.columns
+        if self.result:
+            return list(self.result[0]._fields)
+        return []
+
+    def get_records(self, limit: Optional[int] = None) -> List[dict]:
+        if self.table is not None:
+            return self.table.to_records(limit=limit)
+        rows = self.result or []
+        return serialize_rows(rows if limit is None else rows[:limit])
+
+    def serialize(self, layout: ResultLayout = ResultLayout.RECORDS,
+                  limit: Optional[int] = None) -> Union[List[dict], dict]:
+        if self.table is not None:
+            return self.table.serialize(layout=layout, limit=limit)
+        if layout is ResultLayout.RECORDS:
+            return self.get_records(limit=limit)
+        rows = self.result or []
+        compact = serialize_rows(rows if limit is None else rows[:limit], layout=ResultLayout.COLUMNS)
+        compact["types"] = get_row_types(rows)
+        return compact
+
+    def iter_result_chunks(self, size: int) -> Iterator[dict]:
+        """
+        Splits the result into compact chunks of ``size`` rows. The first chunk also carries the column names and
+        types.
+        """
+        total_rows = self.table.num_rows if self.table is not None else len(self.result or [])
+        if self.table is not None:
+            row_chunks = self.table.iter_row_chunks(size)
+            types = self.table.types
+        else:
+            rows = self.result or []
+            row_chunks = (serialize_rows(rows[offset:offset + size], layout=ResultLayout.COLUMNS)["rows"]
+                          for offset in range(0, len(rows), size))
+            types = get_row_types(rows)
+        chunk_count = max((total_rows + size - 1) // size, 1)
+        for index in range(chunk_count):
+            chunk = {"index": index, "rows": next(row_chunks, []), "last": index == chunk_count - 1}
+            if index == 0:
+                chunk = {"columns": self.get_columns(), "types": types, "total_rows": total_rows, **chunk}
+            yield chunk
+
     def get_results_json(self):
-        results = []
-        if self.result is not None:
-            for row in self.result:
-                results.append(row._asdict())
-        return results
+        return self.get_records()
+
+
+def get_row_types(rows: List) -> List[str]:
+    if not rows:
+        return []
+    types = []
+    for index in range(len(rows[0])):
+        value = next((row[index] for row in rows if row[index] is not None), None)
+        types.append("null" if value is None else type(value).__name__)
+    return types
 
 
 class CorrectedSQLQuery(TSModel):
@@ -29,4 +158,3 @@ class CorrectedSQLQuery(TSModel):
     corrected_query: str
     explanation: Optional[str] = None
     modification_plan: Optional[str] = None
-
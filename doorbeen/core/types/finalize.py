@@ -1,4 +1,4 @@
-from typing import Optional, List
+from typing import Optional, List, Union
 
 from doorbeen.core.types.ts_model import TSModel
 
@@ -7,4 +7,5 @@ class FinalPresentation(TSModel):
     ready_to_present: bool
     interpretation_correct: bool
     message: str
-    results: Optional[List[dict]] = None
+    results: Optional[Union[List[dict], dict]] = None
+    results_chunked: Optional[bool] = None
@@ -1,3 +1,4 @@
+from enum import Enum
 from typing import Any
 
 from doorbeen.core.types.ts_model import TSModel
@@ -6,3 +7,8 @@ from doorbeen.core.types.ts_model import TSModel
 class NodeExecutionOutput(TSModel):
     name: str
     value: Any
+
+
+class ResultLayout(str, Enum):
+    RECORDS = "records"
+    COLUMNS = "columns"
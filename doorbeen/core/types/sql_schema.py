@@ -1,4 +1,7 @@
-from typing import List
+import hashlib
+from typing import Dict, Iterable, List, Optional
+
+from pydantic import PrivateAttr
 
 from doorbeen.core.types.ts_model import TSModel
 
@@ -6,6 +9,7 @@ from doorbeen.core.types.ts_model import TSModel
 class ColumnSchema(TSModel):
     name: str
     type: str
+    comment: Optional[str] = None
 
 
 class ForeignKeyRelation(TSModel):
@@ -24,7 +28,24 @@ class TableSchema(TSModel):
     columns: List[ColumnSchema]
     primary_keys: List[str]
     foreign_keys: List[ForeignKeySchema]
+    comment: Optional[str] = None
 
 
 class DatabaseSchema(TSModel):
     tables: List[TableSchema]
+    _fingerprint: Optional[str] = PrivateAttr(default=None)
+    _tables_by_name: Optional[Dict[str, TableSchema]] = PrivateAttr(default=None)
+
+    def get_fingerprint(self) -> str:
+        if self._fingerprint is None:
+            self._fingerprint = hashlib.sha256(self.model_dump_json().encode("utf-8")).hexdigest()
+        return self._fingerprint
+
+    def get_table(self, name: str) -> Optional[TableSchema]:
+        if self._tables_by_name is None:
+            self._tables_by_name = {table.name: table for table in self.tables}
+        return self._tables_by_name.get(name)
+
+    def subset(self, table_names: Iterable[str]) -> "DatabaseSchema":
+        names = set(table_names)
+        return DatabaseSchema(tables=[table for table in self.tables if table.name in names])
@@ -0,0 +1,44 @@
+import pytest
+
+from doorbeen.core.connections.SQL.query_cache import QueryResultCache, QueryResultCacheConfig
+from doorbeen.core.types.databases import DatabaseTypes
+
+
+@pytest.mark.parametrize("sql, dialect", [
+    ("SELECT * FROM customers", None),
+    ("  select name from customers;", DatabaseTypes.SQLITE),
+    ("(SELECT id FROM orders) UNION (SELECT id FROM refunds)", DatabaseTypes.POSTGRESQL),
+    ("WITH recent AS (SELECT * FROM orders WHERE created_at > '2024-01-01') SELECT count(*) FROM recent",
+     DatabaseTypes.POSTGRESQL),
+    ("WITH totals AS (SELECT customer_id, sum(amount) AS total FROM orders GROUP BY 1) "
+     "SELECT * FROM totals ORDER BY total DESC", DatabaseTypes.MYSQL),
+    ("VALUES (1, 'a'), (2, 'b')", DatabaseTypes.POSTGRESQL),
+    ("SHOW TABLES", DatabaseTypes.MYSQL),
+])
+def test_read_only(sql, dialect):
+    assert QueryResultCache.is_read_only(sql, dialect)
+
+
+@pytest.mark.parametrize("sql, dialect", [
+    ("WITH moved AS (DELETE FROM orders WHERE status = 'old' RETURNING *) SELECT * FROM moved",
+     DatabaseTypes.POSTGRESQL),
+    ("WITH changed AS (UPDATE customers SET country = 'DE' RETURNING id) SELECT count(*) FROM changed",
+     DatabaseTypes.POSTGRESQL),
+    ("WITH recent AS (SELECT * FROM orders) INSERT INTO archive SELECT * FROM recent", DatabaseTypes.POSTGRESQL),
+    ("WITH recent AS (SELECT * FROM orders) INSERT INTO archive SELECT * FROM recent", DatabaseTypes.SQLITE),
+    ("SELECT * INTO orders_backup FROM orders", DatabaseTypes.POSTGRESQL),
+    ("SELECT * FROM customers; DELETE FROM customers", DatabaseTypes.SQLITE),
+    ("INSERT INTO customers (name) VALUES ('Anna')", None),
+    ("UPDATE customers SET name = 'Anna'", None),
+    ("SELEC * FROM", DatabaseTypes.SQLITE),
+])
+def test_not_read_only(sql, dialect):
+    assert not QueryResultCache.is_read_only(sql, dialect)
+
+
+def test_accepts_counts_bypassed():
+    cache = QueryResultCache(config=QueryResultCacheConfig(enabled=True))
+    assert cache.accepts("SELECT 1", 60, DatabaseTypes.SQLITE)
+    assert not cache.accepts("SELECT 1", 0, DatabaseTypes.SQLITE)
+    assert not cache.accepts("SELECT * INTO orders_backup FROM orders", 60, DatabaseTypes.POSTGRESQL)
+    assert cache.stats.bypassed == 2
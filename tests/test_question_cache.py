@@ -0,0 +1,166 @@
+import asyncio
+import sqlite3
+
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage
+
+from doorbeen.core.assistants.analysis.sql.nodes import finalize
+from doorbeen.core.assistants.analysis.sql.nodes.conditionals import determine
+from doorbeen.core.assistants.analysis.sql.nodes.conditionals.determine import InitAssistant
+from doorbeen.core.assistants.analysis.sql.nodes.finalize import FinalizeAnswerNode
+from doorbeen.core.assistants.analysis.sql.query.understanding import QueryPlan, QueryUnderstanding
+from doorbeen.core.assistants.analysis.sql.state import SQLAssistantState
+from doorbeen.core.assistants.memory.questions import QuestionCache, QuestionCacheConfig, QuestionCacheHit
+from doorbeen.core.connections.clients.SQL.aio import AsyncCommonSQLClient
+from doorbeen.core.connections.clients.engines import engine_registry
+from doorbeen.core.connections.credentials.SQL.common import CommonSQLCredentials
+from doorbeen.core.types.finalize import FinalPresentation
+from doorbeen.core.types.generate import GeneratedSQLQuery
+from doorbeen.core.types.observe import QueryAnalysisReport
+
+QUESTION = "Which customers are in Germany?"
+QUERY = GeneratedSQLQuery(query="SELECT name FROM customers WHERE country = 'Germany'")
+INTERPRETATION = QueryUnderstanding(objective="Customers located in Germany", plan=QueryPlan(groups=[]),
+                                    reasoning="Filter the customers by country", tests=[], operations=["filter"])
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    cache = QuestionCache(config=QuestionCacheConfig(enabled=True))
+    # The nodes use the module level cache, swap it so that the tests don't share entries
+    monkeypatch.setattr(determine, "question_cache", cache)
+    monkeypatch.setattr(finalize, "question_cache", cache)
+    return cache
+
+
+@pytest.fixture
+def connection(tmp_path):
+    database = tmp_path / "shop.db"
+    with sqlite3.connect(database) as db:
+        db.execute("CREATE TABLE customers (id INTEGER PRIMARY KEY, name TEXT, country TEXT)")
+        db.execute("INSERT INTO customers (name, country) VALUES ('Anna', 'Germany'), ('Bruno', 'France')")
+    credentials = CommonSQLCredentials(host="", port=0, username="", password="", database=str(database),
+                                       dialect="sqlite")
+
+    async def aconnect():
+        return await AsyncCommonSQLClient(credentials=credentials).connect().aconnect()
+
+    yield asyncio.run(aconnect())
+    asyncio.run(engine_registry.adispose())
+
+
+def store(cache: QuestionCache, question: str = QUESTION, identity: str = "db", fingerprint: str = "v1"):
+    cache.store(identity, fingerprint, question, QUERY, INTERPRETATION, ["customers"])
+
+
+def test_exact_hit(cache):
+    store(cache)
+    entry, hit = cache.lookup("db", "v1", "which customers are  in germany")
+    assert hit.exact and hit.similarity == 1.0 and hit.question == QUESTION
+    assert entry.generated_query == QUERY and entry.selected_tables == ["customers"]
+    assert cache.stats.exact_hits == 1 and cache.stats.hit_rate == 1.0
+
+
+def test_paraphrase_hit(cache):
+    store(cache)
+    entry, hit = cache.lookup("db", "v1", "Which customers are in Germany please?")
+    assert not hit.exact and hit.similarity >= cache.config.similarity_threshold
+    assert hit.question == QUESTION and entry.generated_query == QUERY
+    assert cache.stats.similar_hits == 1
+
+
+@pytest.mark.parametrize("stored, asked", [
+    (QUESTION, "Which customers are not in Germany?"),
+    (QUESTION, "Which customers are in France?"),
+    ("Show the top 10 customers by revenue", "Show the top 5 customers by revenue"),
+])
+def test_near_miss_is_rejected(cache, stored, asked):
+    store(cache, stored)
+    assert cache.lookup("db", "v1", asked) is None
+    assert cache.stats.misses == 1
+
+
+def test_connections_are_kept_apart(cache):
+    store(cache, identity="db")
+    assert cache.lookup("other", "v1", QUESTION) is None
+
+
+def test_fingerprint_change_invalidates(cache):
+    store(cache)
+    store(cache, "Show the top 10 customers by revenue")
+    assert cache.lookup("db", "v2", QUESTION) is None
+    assert cache.stats.invalidations == 1
+    # The entries of the old schema are gone, switching back doesn't bring them back
+    assert cache.lookup("db", "v1", QUESTION) is None
+
+
+def test_discard(cache):
+    store(cache)
+    cache.discard("db", "which customers are in germany")
+    assert cache.lookup("db", "v1", QUESTION) is None
+    assert cache.lookup("db", "v1", "Which customers are in Germany please?") is None
+
+
+def test_eviction_keeps_recently_used(cache):
+    cache.config.max_entries = 2
+    store(cache, "Show the top 10 customers by revenue")
+    store(cache)
+    store(cache, "How many orders were placed last week?")
+    assert cache.lookup("db", "v1", "Show the top 10 customers by revenue") is None
+    assert cache.lookup("db", "v1", QUESTION) is not None
+    assert cache.stats.evictions == 1
+
+
+def init(connection: AsyncCommonSQLClient, messages: list, question: str = QUESTION, **configurable) -> dict:
+    state = SQLAssistantState(messages=messages)
+    config = {"configurable": {"connection": connection, "question": question, **configurable}}
+    return asyncio.run(InitAssistant()(state, config))
+
+
+def finalize_turn(connection: AsyncCommonSQLClient, interpretation_correct: bool = True, objectives_met: bool = True,
+                  hit: QuestionCacheHit = None, question: str = QUESTION, is_followup: bool = False):
+    state = SQLAssistantState(messages=[], input=question, is_followup=is_followup, generated_query=QUERY,
+                              interpretation=INTERPRETATION, selected_tables=["customers"], question_cache_hit=hit,
+                              query_observation_report=QueryAnalysisReport(all_objectives_met=objectives_met,
+                                                                           next_step="present"))
+    response = FinalPresentation(ready_to_present=True, interpretation_correct=interpretation_correct, message="")
+    asyncio.run(FinalizeAnswerNode.update_question_cache(state, connection, response))
+
+
+def test_answered_question_is_reused(cache, connection):
+    finalize_turn(connection)
+    output = init(connection, [HumanMessage(content="Which customers are in Germany please?")],
+                  "Which customers are in Germany please?")
+    assert output["question_cache_hit"].question == QUESTION
+    assert output["generated_query"] == QUERY and output["interpretation"] == INTERPRETATION
+
+
+def test_bypass_skips_lookup(cache, connection):
+    finalize_turn(connection)
+    output = init(connection, [HumanMessage(content=QUESTION)], bypass_question_cache=True)
+    assert output["question_cache_hit"] is None and "generated_query" not in output
+
+
+def test_followups_are_skipped(cache, connection):
+    finalize_turn(connection)
+    messages = [HumanMessage(content="How many customers are there?"), AIMessage(content="2"),
+                HumanMessage(content=QUESTION)]
+    output = init(connection, messages)
+    assert output["is_followup"] and output["question_cache_hit"] is None
+    assert cache.stats.hits == 0 and cache.stats.misses == 0
+    # Follow-ups depend on the earlier turns, so their queries aren't stored either
+    finalize_turn(connection, question="And in France?", is_followup=True)
+    assert cache.stats.stores == 1
+
+
+def test_wrong_interpretation_discards_hit(cache, connection):
+    finalize_turn(connection)
+    hit = init(connection, [HumanMessage(content=QUESTION)])["question_cache_hit"]
+    finalize_turn(connection, interpretation_correct=False, hit=hit)
+    assert init(connection, [HumanMessage(content=QUESTION)])["question_cache_hit"] is None
+
+
+def test_unmet_objectives_are_not_stored(cache, connection):
+    finalize_turn(connection, objectives_met=False)
+    assert init(connection, [HumanMessage(content=QUESTION)])["question_cache_hit"] is None
+    assert cache.stats.stores == 0